@@ -0,0 +1,53 @@
+import re
+import unicodedata
+
+# Canonical spelling for common street-address abbreviations
+ABBREVIATIONS = {
+    'st': 'street', 'str': 'street',
+    'ave': 'avenue', 'av': 'avenue',
+    'rd': 'road',
+    'blvd': 'boulevard',
+    'dr': 'drive',
+    'ln': 'lane',
+    'ct': 'court',
+    'pl': 'place',
+    'sq': 'square',
+    'hwy': 'highway',
+    'fwy': 'freeway',
+    'pkwy': 'parkway',
+    'expy': 'expressway',
+    'tpke': 'turnpike',
+    'ste': 'suite',
+    'apt': 'apartment',
+    'mt': 'mount',
+    'ft': 'fort',
+    'n': 'north', 's': 'south', 'e': 'east', 'w': 'west',
+    'ne': 'northeast', 'nw': 'northwest', 'se': 'southeast', 'sw': 'southwest',
+}
+
+COUNTRY_SUFFIXES = (('united', 'states', 'of', 'america'), ('united', 'states'), ('usa',))
+
+_NON_WORD = re.compile(r"[^\w\s]+")
+
+
+def address_tokens(address):
+    """
+    Words of an address with case, accents and punctuation folded away.
+    """
+    text = unicodedata.normalize('NFKD', address or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    return _NON_WORD.sub(' ', text).split()
+
+
+def normalize_address(address):
+    """
+    Normalize an address for cache lookups and duplicate detection: case,
+    accents, punctuation, whitespace and common abbreviations ("St" -> "street")
+    are folded away.
+    """
+    tokens = [ABBREVIATIONS.get(token, token) for token in address_tokens(address)]
+    for suffix in COUNTRY_SUFFIXES:
+        if len(tokens) > len(suffix) and tuple(tokens[-len(suffix):]) == suffix:
+            tokens = tokens[:-len(suffix)]
+            break
+    return ' '.join(tokens)
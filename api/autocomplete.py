@@ -0,0 +1,278 @@
+"""
+In-memory prefix index for address autocomplete.
+
+Known locations are kept as a sorted list of ``(normalized address, id)``
+pairs, so the addresses starting with a prefix are one contiguous slice
+found with two binary searches. Narrow slices are ranked by use on every
+query; wide ones (short prefixes such as "1" or "ch") are ranked once and
+the ranking is kept current as uses are recorded, so no query scans more
+than ``SCAN_LIMIT`` entries however many addresses are loaded.
+
+Uses are seeded from the trips referencing each location when the index is
+loaded and counted in-process after that.
+"""
+import bisect
+import heapq
+import threading
+import time
+from collections import namedtuple
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import Count
+
+from .addresses import ABBREVIATIONS, address_tokens, normalize_address
+
+AutocompleteMatch = namedtuple('AutocompleteMatch', ['id', 'address', 'latitude', 'longitude', 'uses'])
+
+# Prefix slices wider than this keep a standing ranking instead of being ranked per query
+SCAN_LIMIT = 1000
+# Most suggestions a query can ask for; also the length of the standing rankings
+MAX_RESULTS = 20
+
+# Sorts after any character an address key can contain
+_KEY_END = '\U0010ffff'
+
+
+def query_prefixes(text):
+    """
+    Normalized prefixes to search for partially typed ``text``. A word still
+    being typed is searched as typed and in its expanded form, so "Main St"
+    finds "main street" and "Main S" still finds "main south..." and "main st...".
+    """
+    tokens = address_tokens(text)
+    if not tokens:
+        return []
+    head = [ABBREVIATIONS.get(token, token) for token in tokens[:-1]]
+    last = tokens[-1]
+    finished = not text[-1].isalnum()
+    variants = [ABBREVIATIONS.get(last, last)]
+    if not finished and last not in variants:
+        variants.append(last)
+    return [' '.join(head + [variant]) for variant in variants]
+
+
+class AutocompleteIndex:
+    """
+    Prefix index over the Location table, built lazily on first query.
+
+    Saves and deletes made in this process are applied through signals;
+    rows inserted by other processes (or by ``bulk_create``) are picked up
+    incrementally by id at most every ``refresh_interval`` seconds.
+    """
+
+    def __init__(self, refresh_interval, scan_limit=SCAN_LIMIT):
+        self.refresh_interval = refresh_interval
+        self.scan_limit = scan_limit
+        self.loaded = False
+        self.max_id = 0
+        self.refreshed_at = 0.0
+        self._keys = []        # sorted (normalized address, location id)
+        self._locations = {}   # location id -> (normalized address, address, latitude, longitude)
+        self._uses = {}        # location id -> use count
+        self._ranked = {}      # prefix -> ids ranked by use, for prefixes wider than scan_limit
+        self._lock = threading.RLock()
+
+    def _rank(self, location_id):
+        return -self._uses.get(location_id, 0), self._locations[location_id][0], location_id
+
+    def load(self, rows, uses=None):
+        """
+        Add ``(id, address, normalized address, latitude, longitude)`` rows,
+        read in id order, and ``{id: count}`` uses.
+        """
+        with self._lock:
+            for location_id, count in (uses or {}).items():
+                self._uses[location_id] = self._uses.get(location_id, 0) + count
+            new = []
+            for location_id, address, normalized, latitude, longitude in rows:
+                self.max_id = max(self.max_id, location_id)
+                entry = self._entry(location_id, address, normalized, latitude, longitude)
+                if entry is not None:
+                    new.append(entry)
+
+            if len(new) > 100:
+                new.sort()
+                self._keys = list(heapq.merge(self._keys, new))
+                self._ranked = {}
+                self._warm()
+            else:
+                for entry in new:
+                    self._insert(entry)
+            self.refreshed_at = time.monotonic()
+
+    def _entry(self, location_id, address, normalized, latitude, longitude):
+        key = normalized or normalize_address(address)
+        if not key or location_id in self._locations:
+            return None
+        self._locations[location_id] = (key, address, latitude, longitude)
+        return key, location_id
+
+    def _insert(self, entry):
+        bisect.insort(self._keys, entry)
+        self._rerank(entry[1])
+
+    def _warm(self):
+        """
+        Rank every prefix wider than scan_limit up front, so no query pays for
+        ranking a large slice. Prefixes are walked depth first, one child per
+        distinct next character.
+        """
+        keys = self._keys
+        stack = ['']
+        while stack:
+            prefix = stack.pop()
+            lo = bisect.bisect_left(keys, (prefix,))
+            hi = bisect.bisect_left(keys, (prefix + _KEY_END,), lo)
+            if hi - lo <= self.scan_limit:
+                continue
+            if prefix:
+                self._top(prefix, MAX_RESULTS)
+            position = lo
+            while position < hi:
+                key = keys[position][0]
+                if len(key) == len(prefix):
+                    position += 1
+                    continue
+                child = key[:len(prefix) + 1]
+                stack.append(child)
+                position = bisect.bisect_left(keys, (child + _KEY_END,), position)
+
+    def _load_since(self, min_id):
+        from .models import Location, Trip
+
+        uses = {}
+        if min_id == 0:
+            for field in ('current_location', 'pickup_location', 'dropoff_location'):
+                counts = Trip.objects.values(field).annotate(n=Count('id')).order_by().values_list(field, 'n')
+                for location_id, count in counts:
+                    uses[location_id] = uses.get(location_id, 0) + count
+        rows = (Location.objects
+                .filter(id__gt=min_id, roadside=False)
+                .order_by('id')
+                .values_list('id', 'address', 'normalized_address', 'latitude', 'longitude'))
+        self.load(rows.iterator(chunk_size=10000), uses)
+
+    def ensure_current(self):
+        with self._lock:
+            if not self.loaded:
+                self._load_since(0)
+                self.loaded = True
+            elif time.monotonic() - self.refreshed_at >= self.refresh_interval:
+                self._load_since(self.max_id)
+
+    def _rerank(self, location_id):
+        """
+        Fold a new location or a higher use count into the standing rankings
+        of every prefix of its address. Counts only grow, so this is exact.
+        """
+        key = self._locations[location_id][0]
+        rank = self._rank(location_id)
+        for end in range(1, len(key) + 1):
+            ranked = self._ranked.get(key[:end])
+            if ranked is None:
+                continue
+            if location_id not in ranked:
+                if len(ranked) >= MAX_RESULTS and rank >= self._rank(ranked[-1]):
+                    continue
+                ranked.append(location_id)
+            ranked.sort(key=self._rank)
+            del ranked[MAX_RESULTS:]
+
+    def _forget(self, location_id):
+        key = self._locations.pop(location_id)[0]
+        position = bisect.bisect_left(self._keys, (key, location_id))
+        if position < len(self._keys) and self._keys[position] == (key, location_id):
+            del self._keys[position]
+        # Rankings that may have held it are rebuilt on their next query
+        for end in range(1, len(key) + 1):
+            self._ranked.pop(key[:end], None)
+
+    def added(self, location):
+        with self._lock:
+            if not self.loaded:
+                return
+            # max_id is left alone: lower ids inserted elsewhere are still to be picked up
+            entry = self._entry(location.id, location.address, location.normalized_address,
+                                location.latitude, location.longitude)
+            if entry is not None:
+                self._insert(entry)
+
+    def updated(self, location):
+        with self._lock:
+            if not self.loaded or (location.id not in self._locations and location.id > self.max_id):
+                return
+            if location.id in self._locations:
+                key, address, latitude, longitude = self._locations[location.id]
+                if (address, latitude, longitude) == (location.address, location.latitude, location.longitude):
+                    return
+                self._forget(location.id)
+            entry = self._entry(location.id, location.address, location.normalized_address,
+                                location.latitude, location.longitude)
+            if entry is not None:
+                self._insert(entry)
+
+    def removed(self, location):
+        with self._lock:
+            if location.id in self._locations:
+                self._forget(location.id)
+            self._uses.pop(location.id, None)
+
+    def record_use(self, location_ids):
+        """
+        Count one use (a trip stop, a geocode) of each location.
+        """
+        with self._lock:
+            if not self.loaded:
+                # Counted from the trips table when the index loads
+                return
+            for location_id in location_ids:
+                self._uses[location_id] = self._uses.get(location_id, 0) + 1
+                if location_id in self._locations:
+                    self._rerank(location_id)
+
+    def _top(self, prefix, limit):
+        keys = self._keys
+        lo = bisect.bisect_left(keys, (prefix,))
+        hi = bisect.bisect_left(keys, (prefix + _KEY_END,), lo)
+        if hi - lo <= self.scan_limit:
+            return heapq.nsmallest(limit, (location_id for _, location_id in keys[lo:hi]), key=self._rank)
+        ranked = self._ranked.get(prefix)
+        if ranked is None:
+            ranked = self._ranked[prefix] = heapq.nsmallest(
+                MAX_RESULTS, (location_id for _, location_id in islice(keys, lo, hi)), key=self._rank
+            )
+        return ranked[:limit]
+
+    def search(self, text, limit=10):
+        """
+        Up to ``limit`` known locations whose address starts with ``text``,
+        most used first.
+        """
+        self.ensure_current()
+        limit = min(limit, MAX_RESULTS)
+        with self._lock:
+            candidates = set()
+            for prefix in query_prefixes(text):
+                candidates.update(self._top(prefix, limit))
+            matches = []
+            for location_id in sorted(candidates, key=self._rank)[:limit]:
+                _, address, latitude, longitude = self._locations[location_id]
+                matches.append(AutocompleteMatch(location_id, address, latitude, longitude,
+                                                 self._uses.get(location_id, 0)))
+            return matches
+
+    def reset(self):
+        with self._lock:
+            self.loaded = False
+            self.max_id = 0
+            self._keys = []
+            self._locations = {}
+            self._uses = {}
+            self._ranked = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+
+autocomplete_index = AutocompleteIndex(refresh_interval=settings.LOCATION_INDEX_REFRESH)
@@ -0,0 +1,109 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Thread-safe in-process LRU cache whose entries expire after ``ttl`` seconds.
+    The least recently used entry is evicted once ``max_entries`` is reached.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        """
+        Store ``value``, expiring after ``ttl`` seconds (the cache's own TTL by default).
+        """
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def discard_where(self, predicate):
+        """
+        Remove every entry whose value matches ``predicate``.
+        """
+        with self._lock:
+            stale = [key for key, (value, _) in self._data.items() if predicate(value)]
+            for key in stale:
+                del self._data[key]
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class Counters:
+    """
+    Named, thread-safe counters for cache hit/miss and latency accounting.
+    """
+
+    def __init__(self, *names):
+        self._values = dict.fromkeys(names, 0)
+        self._lock = threading.Lock()
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self._values[name] = self._values.get(name, 0) + amount
+
+    def get(self, name):
+        return self._values.get(name, 0)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def reset(self):
+        with self._lock:
+            for name in self._values:
+                self._values[name] = 0
+
+
+def tiered_cache_stats(counters, memory):
+    """
+    Hit ratio and upstream savings of a two-tier cache whose ``counters``
+    track ``memory_hits``, ``db_hits``, ``misses``, ``upstream_calls`` and
+    ``upstream_ms``.
+    """
+    values = counters.snapshot()
+    hits = values['memory_hits'] + values['db_hits']
+    lookups = hits + values['misses']
+    calls = values['upstream_calls']
+    avg_upstream_ms = values['upstream_ms'] / calls if calls else 0
+    return {
+        'memory_hits': values['memory_hits'],
+        'db_hits': values['db_hits'],
+        'misses': values['misses'],
+        'hit_ratio': hits / lookups if lookups else 0,
+        'memory_entries': len(memory),
+        'upstream_calls': calls,
+        'avg_upstream_ms': round(avg_upstream_ms, 2),
+        'estimated_saved_ms': round(hits * avg_upstream_ms, 2),
+        'estimated_saved_calls': hits,
+    }
@@ -0,0 +1,276 @@
+import contextvars
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .caching import Counters, TTLCache, tiered_cache_stats
+from .maps_client import maps_client
+from .models import DirectionsCacheEntry
+from .polyline import decode, encode
+from .singleflight import SingleFlight
+
+METERS_PER_MILE = 1609.34
+
+# Intermediate stops Google Directions accepts in one request
+MAX_WAYPOINTS = 25
+
+# Keys per query when reading or writing the persistent tier (below SQLite's variable limit)
+DB_CHUNK_SIZE = 500
+
+# distance in miles, duration in minutes, geometry as an encoded polyline
+DirectionsResult = namedtuple('DirectionsResult', ['distance', 'duration', 'geometry'])
+
+
+def snap(latitude, longitude, grid):
+    """
+    Snap a coordinate to the nearest corner of a ``grid``-degree lattice.
+    """
+    return round(float(latitude) / grid) * grid, round(float(longitude) / grid) * grid
+
+
+def directions_key(origin, destination, grid=None):
+    """
+    Cache key for the lane from ``origin`` to ``destination`` (``(lat, lng)``
+    pairs), with both ends snapped to the cache grid.
+    """
+    grid = grid or settings.DIRECTIONS_CACHE_GRID
+    origin_lat, origin_lng = snap(*origin, grid)
+    destination_lat, destination_lng = snap(*destination, grid)
+    return f"{origin_lat:.5f},{origin_lng:.5f};{destination_lat:.5f},{destination_lng:.5f}"
+
+
+class DirectionsCache:
+    """
+    Two-tier directions cache keyed on snapped origin/destination.
+
+    The in-process tier is a TTL/LRU cache of DirectionsResult tuples; the
+    optional persistent tier is the DirectionsCacheEntry table, shared by
+    every worker and surviving restarts.
+    """
+
+    def __init__(self, max_entries, ttl, persist=True):
+        self.ttl = ttl
+        self.persist = persist
+        self.memory = TTLCache(max_entries, ttl)
+        self.counters = Counters('memory_hits', 'db_hits', 'misses', 'upstream_calls', 'upstream_ms')
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys):
+        """
+        Look up several lane keys at once; returns a dict of the ones found.
+        The persistent tier is read with one query per chunk of keys.
+        """
+        found = {}
+        pending = []
+        for key in keys:
+            result = self.memory.get(key)
+            if result is not None:
+                self.counters.incr('memory_hits')
+                found[key] = result
+            else:
+                pending.append(key)
+
+        db_hits = 0
+        if self.persist and pending:
+            cutoff = timezone.now() - timedelta(seconds=self.ttl)
+            for i in range(0, len(pending), DB_CHUNK_SIZE):
+                entries = DirectionsCacheEntry.objects.filter(key__in=pending[i:i + DB_CHUNK_SIZE], cached_at__gte=cutoff)
+                for entry in entries:
+                    db_hits += 1
+                    result = DirectionsResult(entry.distance, entry.duration, entry.geometry)
+                    self.memory.set(entry.key, result)
+                    found[entry.key] = result
+
+        self.counters.incr('db_hits', db_hits)
+        self.counters.incr('misses', len(pending) - db_hits)
+        return found
+
+    def put(self, key, result):
+        self.put_many([(key, result)])
+
+    def put_many(self, items):
+        """
+        Store ``(key, DirectionsResult)`` pairs in both tiers.
+        """
+        if self.persist:
+            now = timezone.now()
+            entries = [
+                DirectionsCacheEntry(
+                    key=key,
+                    distance=result.distance,
+                    duration=result.duration,
+                    geometry=result.geometry,
+                    cached_at=now,
+                )
+                for key, result in items
+            ]
+            for i in range(0, len(entries), DB_CHUNK_SIZE):
+                DirectionsCacheEntry.objects.bulk_create(
+                    entries[i:i + DB_CHUNK_SIZE],
+                    update_conflicts=True,
+                    unique_fields=['key'],
+                    update_fields=['distance', 'duration', 'geometry', 'cached_at'],
+                )
+        for key, result in items:
+            self.memory.set(key, result)
+
+    def record_upstream(self, elapsed_ms):
+        self.counters.incr('upstream_calls')
+        self.counters.incr('upstream_ms', elapsed_ms)
+
+    def stats(self):
+        return dict(tiered_cache_stats(self.counters, self.memory), persistent=self.persist)
+
+
+directions_cache = DirectionsCache(
+    max_entries=settings.DIRECTIONS_CACHE_MAX_ENTRIES,
+    ttl=settings.DIRECTIONS_CACHE_TTL,
+    persist=settings.DIRECTIONS_CACHE_PERSIST,
+)
+
+
+def _point(point):
+    return f"{point[0]},{point[1]}"
+
+
+def leg_geometry(leg):
+    """
+    Encoded polyline of a Directions API leg, joined from its steps' polylines.
+    """
+    points = []
+    for step in leg.get('steps', ()):
+        step_points = decode(step.get('polyline', {}).get('points', ''))
+        # Each step starts where the last one ended
+        if points and step_points and step_points[0] == points[-1]:
+            step_points = step_points[1:]
+        points.extend(step_points)
+    return encode(points) if points else ''
+
+
+def google_route(points):
+    """
+    Fetch the driving route through ``points`` (two or more ``(lat, lng)``
+    pairs) with one Google Directions call, the intermediate points being
+    stopovers. Returns one DirectionsResult per leg; geometry is joined from
+    the leg's steps, or for a single-leg route without steps is the route
+    overview. Raises ValueError if the API returns no route.
+    """
+    params = {'origin': _point(points[0]), 'destination': _point(points[-1])}
+    if len(points) > 2:
+        params['waypoints'] = '|'.join(_point(point) for point in points[1:-1])
+    data = maps_client.get_json('directions', params)
+    if data['status'] != 'OK':
+        raise ValueError(f"Google Maps API error: {data.get('status')} - {data.get('error_message', 'No error message')}")
+    route = data['routes'][0]
+    legs = route['legs']
+    if len(legs) != len(points) - 1:
+        raise ValueError(f"Google Maps API error: expected {len(points) - 1} legs, got {len(legs)}")
+    overview = route.get('overview_polyline', {}).get('points', '') if len(legs) == 1 else ''
+    return [
+        DirectionsResult(
+            distance=leg['distance']['value'] / METERS_PER_MILE,
+            duration=leg['duration']['value'] / 60,
+            geometry=leg_geometry(leg) or overview,
+        )
+        for leg in legs
+    ]
+
+
+# Coalesces concurrent cache misses for the same snapped lanes
+directions_flights = SingleFlight()
+
+
+def fetch_route(points):
+    """
+    Fetch the legs of a route upstream, timed into the cache's upstream stats.
+    """
+    def fetch():
+        started = time.perf_counter()
+        try:
+            return google_route(points)
+        finally:
+            directions_cache.record_upstream((time.perf_counter() - started) * 1000)
+
+    grid = settings.DIRECTIONS_CACHE_GRID
+    key = tuple(snap(*point, grid) for point in points)
+    return directions_flights.do(key, fetch)
+
+
+def _fetch_concurrently(calls, max_workers):
+    """
+    Run ``fetch_route`` for each list of points on a bounded thread pool and
+    return the results in order. Each call runs in a copy of the caller's
+    context so upstream time is still attributed to the request that
+    triggered it.
+    """
+    if len(calls) == 1:
+        return [fetch_route(calls[0])]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(calls))) as executor:
+        futures = [executor.submit(contextvars.copy_context().run, fetch_route, points) for points in calls]
+        return [future.result() for future in futures]
+
+
+def route_chunks(points):
+    """
+    Split a route into runs of at most ``MAX_WAYPOINTS`` intermediate stops,
+    consecutive runs sharing their end point.
+    """
+    step = MAX_WAYPOINTS + 1
+    return [points[i:i + step + 1] for i in range(0, len(points) - 1, step)]
+
+
+def get_route_legs(points, max_workers=None):
+    """
+    Directions for every leg of the route through ``points``, in order.
+
+    When every leg is cached no call is made. Otherwise the route is fetched
+    with one Directions call per ``MAX_WAYPOINTS`` stops (concurrently when
+    there are several), so upstream round-trips stay constant as legs are
+    added instead of growing with them.
+    """
+    return get_route_legs_many([points], max_workers)[0]
+
+
+def get_route_legs_many(routes, max_workers=None):
+    """
+    Directions for every leg of several routes; one list of legs per route.
+
+    All the routes' lanes are read from the cache in one pass. Each run of
+    ``MAX_WAYPOINTS`` stops with a lane still missing is fetched once, in a
+    single Directions call, unless the runs already scheduled cover its
+    missing lanes; the calls for every route share one thread pool.
+    """
+    max_workers = max_workers or settings.DIRECTIONS_WORKERS
+    routes = [[tuple(point) for point in points] for points in routes]
+    route_keys = [
+        [directions_key(origin, destination) for origin, destination in zip(points, points[1:])]
+        for points in routes
+    ]
+    results = directions_cache.get_many(list({key for keys in route_keys for key in keys}))
+
+    calls = []
+    covered = set()
+    for points, keys in zip(routes, route_keys):
+        if all(key in results or key in covered for key in keys):
+            continue
+        for chunk in route_chunks(points):
+            chunk_keys = [directions_key(origin, destination) for origin, destination in zip(chunk, chunk[1:])]
+            if any(key not in results and key not in covered for key in chunk_keys):
+                calls.append(chunk)
+                covered.update(chunk_keys)
+
+    if calls:
+        fetched = {}
+        for chunk, legs in zip(calls, _fetch_concurrently(calls, max_workers)):
+            for origin, destination, result in zip(chunk, chunk[1:], legs):
+                fetched[directions_key(origin, destination)] = result
+        directions_cache.put_many(list(fetched.items()))
+        results.update(fetched)
+
+    return [[results[key] for key in keys] for keys in route_keys]
@@ -0,0 +1,278 @@
+"""
+Offline gazetteer geocoder.
+
+Resolves US cities ("Chicago, IL"), ZIP centroids ("60601") and interstate
+exits ("I-40 Exit 1, AZ") without any network call. The gazetteer is a
+tab-separated file of ``key, display name, latitude, longitude`` lines sorted
+by key (see the ``build_gazetteer`` management command). It is memory-mapped
+on first use and searched in place: the sorted lines form the prefix index,
+so lookups are a binary search over the mapped bytes and nothing is loaded
+into Python objects up front, however large the file is.
+
+Keys are namespaced by kind: ``c <city> <state>``, ``z <zip>`` and
+``x i<route> <state> <exit>``.
+"""
+import hashlib
+import mmap
+import re
+import threading
+import unicodedata
+from collections import namedtuple
+
+from django.conf import settings
+
+GazetteerMatch = namedtuple('GazetteerMatch', ['name', 'latitude', 'longitude', 'kind', 'exact'])
+
+KINDS = {'c': 'city', 'z': 'zip', 'x': 'exit'}
+
+STATES = {
+    'alabama': 'al', 'alaska': 'ak', 'arizona': 'az', 'arkansas': 'ar', 'california': 'ca',
+    'colorado': 'co', 'connecticut': 'ct', 'delaware': 'de', 'district of columbia': 'dc',
+    'florida': 'fl', 'georgia': 'ga', 'hawaii': 'hi', 'idaho': 'id', 'illinois': 'il',
+    'indiana': 'in', 'iowa': 'ia', 'kansas': 'ks', 'kentucky': 'ky', 'louisiana': 'la',
+    'maine': 'me', 'maryland': 'md', 'massachusetts': 'ma', 'michigan': 'mi', 'minnesota': 'mn',
+    'mississippi': 'ms', 'missouri': 'mo', 'montana': 'mt', 'nebraska': 'ne', 'nevada': 'nv',
+    'new hampshire': 'nh', 'new jersey': 'nj', 'new mexico': 'nm', 'new york': 'ny',
+    'north carolina': 'nc', 'north dakota': 'nd', 'ohio': 'oh', 'oklahoma': 'ok', 'oregon': 'or',
+    'pennsylvania': 'pa', 'rhode island': 'ri', 'south carolina': 'sc', 'south dakota': 'sd',
+    'tennessee': 'tn', 'texas': 'tx', 'utah': 'ut', 'vermont': 'vt', 'virginia': 'va',
+    'washington': 'wa', 'west virginia': 'wv', 'wisconsin': 'wi', 'wyoming': 'wy',
+}
+STATE_CODES = set(STATES.values())
+
+# Canonical short forms for place-name words
+PLACE_WORDS = {'saint': 'st', 'ste': 'st', 'fort': 'ft', 'mount': 'mt'}
+
+COUNTRY_SUFFIXES = (('united', 'states', 'of', 'america'), ('united', 'states'), ('usa',), ('us',))
+
+# Longest place name (in tokens) tried when matching a city
+MAX_CITY_TOKENS = 4
+
+_NON_WORD = re.compile(r"[^\w\s]+")
+_ZIP = re.compile(r"^\d{5}$")
+
+
+def tokenize(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    tokens = _NON_WORD.sub(' ', text).split()
+
+    # "I-80" / "Interstate 80" -> "i80"
+    merged = []
+    for token in tokens:
+        if token.isdigit() and merged and merged[-1] in ('i', 'interstate'):
+            merged[-1] = f'i{token}'
+        else:
+            merged.append(token)
+    return merged
+
+
+def place_tokens(tokens):
+    return [PLACE_WORDS.get(token, token) for token in tokens]
+
+
+def city_key(city, state):
+    return 'c ' + ' '.join(place_tokens(tokenize(city))) + ' ' + state.lower()
+
+
+def zip_key(zip_code):
+    return f'z {zip_code}'
+
+
+def exit_key(route, state, exit_number):
+    route = str(route).lower().replace('-', '').replace(' ', '')
+    if not route.startswith('i'):
+        route = f'i{route}'
+    return f'x {route} {state.lower()} {str(exit_number).lower()}'
+
+
+def _strip_state(tokens):
+    """
+    Split a trailing state name or code off ``tokens``.
+    Returns ``(tokens, state_code)``; ``state_code`` is None if there is none.
+    """
+    for size in (3, 2, 1):
+        tail = ' '.join(tokens[-size:])
+        if len(tokens) >= size and tail in STATES:
+            return tokens[:-size], STATES[tail]
+    if tokens and tokens[-1] in STATE_CODES:
+        return tokens[:-1], tokens[-1]
+    return tokens, None
+
+
+class Gazetteer:
+    def __init__(self, path):
+        self.path = path
+        self._mm = None
+        self._lock = threading.Lock()
+
+    def _map(self):
+        if self._mm is None:
+            with self._lock:
+                if self._mm is None:
+                    with open(self.path, 'rb') as f:
+                        self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mm
+
+    def _line_start(self, mm, pos):
+        """
+        Offset of the first line starting at or after ``pos``.
+        """
+        if pos == 0:
+            return 0
+        newline = mm.find(b'\n', pos - 1)
+        return len(mm) if newline < 0 else newline + 1
+
+    def _lower_bound(self, mm, key):
+        """
+        Offset of the first line whose key sorts at or after ``key``.
+        """
+        lo, hi = 0, len(mm)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = self._line_start(mm, mid)
+            if start >= hi:
+                hi = mid
+                continue
+            end = mm.find(b'\t', start)
+            if mm[start:end] < key:
+                newline = mm.find(b'\n', start)
+                lo = len(mm) if newline < 0 else newline + 1
+            else:
+                hi = start
+        return lo
+
+    def _parse(self, line):
+        key, name, latitude, longitude = line.decode('utf-8').split('\t')
+        return key, name, float(latitude), float(longitude)
+
+    def get(self, key):
+        """
+        Exact lookup of a gazetteer key; returns ``(name, lat, lng)`` or None.
+        """
+        mm = self._map()
+        target = key.encode('utf-8')
+        start = self._lower_bound(mm, target)
+        end = mm.find(b'\n', start)
+        line = mm[start:end if end >= 0 else len(mm)]
+        if not line.startswith(target + b'\t'):
+            return None
+        _, name, latitude, longitude = self._parse(line)
+        return name, latitude, longitude
+
+    def prefix(self, prefix, limit=50):
+        """
+        Yield ``(key, name, lat, lng)`` for keys starting with ``prefix``, in key order.
+        """
+        mm = self._map()
+        target = prefix.encode('utf-8')
+        pos = self._lower_bound(mm, target)
+        for _ in range(limit):
+            if pos >= len(mm) or not mm[pos:pos + len(target)] == target:
+                return
+            end = mm.find(b'\n', pos)
+            end = len(mm) if end < 0 else end
+            yield self._parse(mm[pos:end])
+            pos = end + 1
+
+    def lookup(self, address):
+        """
+        Resolve an address to the most specific gazetteer entry it names.
+        Returns a GazetteerMatch, or None when nothing matches. ``exact`` is
+        True when the whole address was consumed by the match, i.e. the query
+        was place-level rather than a street address inside that place.
+        """
+        tokens = tokenize(address)
+        for suffix in COUNTRY_SUFFIXES:
+            if len(tokens) > len(suffix) and tuple(tokens[-len(suffix):]) == suffix:
+                tokens = tokens[:-len(suffix)]
+                break
+
+        zip_code = None
+        if len(tokens) >= 2 and len(tokens[-1]) == 4 and tokens[-1].isdigit() and _ZIP.match(tokens[-2]):
+            tokens = tokens[:-1]
+        if tokens and _ZIP.match(tokens[-1]):
+            zip_code = tokens[-1]
+            tokens = tokens[:-1]
+        rest, state = _strip_state(tokens)
+
+        match = self._match_exit(rest, state)
+        if match is not None:
+            return match
+
+        if rest or state is None:
+            city = self._match_city(rest, state)
+        else:
+            # "New York" or "Washington" on its own names the city, not the state
+            city = self._match_city(tokens, None)
+        if zip_code is not None:
+            found = self.get(zip_key(zip_code))
+            if found is not None:
+                name, latitude, longitude = found
+                # "Chicago, IL 60601" is still a place-level query
+                exact = not rest or (city is not None and city.exact)
+                return GazetteerMatch(name, latitude, longitude, 'zip', exact)
+        return city
+
+    def _match_exit(self, tokens, state):
+        if 'exit' not in tokens:
+            return None
+        routes = [token for token in tokens if re.match(r'^i\d+$', token)]
+        position = tokens.index('exit')
+        if not routes or position + 1 >= len(tokens):
+            return None
+        route, number = routes[0], tokens[position + 1]
+        if state is not None:
+            found = self.get(exit_key(route, state, number))
+            candidates = [found] if found else []
+        else:
+            candidates = [
+                (name, latitude, longitude)
+                for key, name, latitude, longitude in self.prefix(f'x {route} ')
+                if key.rsplit(' ', 1)[-1] == number
+            ]
+        if not candidates:
+            return None
+        name, latitude, longitude = candidates[0]
+        consumed = {'exit', route, number}
+        exact = len(candidates) == 1 and all(token in consumed or token == 'interstate' for token in tokens)
+        return GazetteerMatch(name, latitude, longitude, 'exit', exact)
+
+    def _match_city(self, tokens, state):
+        tokens = place_tokens(tokens)
+        for size in range(min(MAX_CITY_TOKENS, len(tokens)), 0, -1):
+            name_tokens = ' '.join(tokens[-size:])
+            if state is not None:
+                found = self.get(f'c {name_tokens} {state}')
+                candidates = [found] if found else []
+            else:
+                candidates = [
+                    (name, latitude, longitude)
+                    for key, name, latitude, longitude in self.prefix(f'c {name_tokens} ')
+                    if len(key.split(' ')) == size + 2
+                ]
+            if candidates:
+                name, latitude, longitude = candidates[0]
+                exact = size == len(tokens) and len(candidates) == 1
+                return GazetteerMatch(name, latitude, longitude, 'city', exact)
+        return None
+
+
+def _unit_hash(text, salt):
+    digest = hashlib.blake2b(f'{salt}:{text}'.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') / 2 ** 64
+
+
+def deterministic_point(text, center=None, spread=0.02):
+    """
+    Stable pseudo-coordinates for ``text``: within ``spread`` degrees of
+    ``center`` when given, otherwise inside the continental US.
+    """
+    if center is None:
+        return 30 + 15 * _unit_hash(text, 'lat'), -120 + 50 * _unit_hash(text, 'lng')
+    latitude, longitude = center
+    return (latitude + spread * (2 * _unit_hash(text, 'lat') - 1),
+            longitude + spread * (2 * _unit_hash(text, 'lng') - 1))
+
+
+gazetteer = Gazetteer(settings.GAZETTEER_PATH)
@@ -0,0 +1,283 @@
+import contextvars
+import hashlib
+import logging
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .addresses import normalize_address
+from .caching import Counters, TTLCache, tiered_cache_stats
+from .gazetteer import deterministic_point, gazetteer
+from .maps_client import maps_client
+from .singleflight import SingleFlight
+from .models import GeocodeCacheEntry, Location
+
+logger = logging.getLogger(__name__)
+
+# ``fallback`` marks an approximate offline answer given in place of the upstream geocoder's
+GeocodeResult = namedtuple('GeocodeResult', ['address', 'latitude', 'longitude', 'fallback'], defaults=[False])
+
+# Keys per query when reading or writing the shared tier (below SQLite's variable limit)
+DB_CHUNK_SIZE = 500
+
+
+def cache_key(normalized):
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+class GeocodeCache:
+    """
+    Two-tier geocode cache keyed on the normalized address.
+
+    The in-process tier is a TTL/LRU cache of Location instances; the shared
+    tier is the GeocodeCacheEntry table, which survives restarts and is seen
+    by every worker. Both tiers point at existing Location rows, so a hit
+    never inserts a new location. Fallback results are kept in memory only,
+    for ``fallback_ttl`` seconds, so they are retried upstream soon after.
+    """
+
+    def __init__(self, max_entries, ttl, fallback_ttl):
+        self.ttl = ttl
+        self.fallback_ttl = fallback_ttl
+        self.memory = TTLCache(max_entries, ttl)
+        self.counters = Counters('memory_hits', 'db_hits', 'misses', 'upstream_calls', 'upstream_ms')
+
+    def get(self, normalized):
+        return self.get_many([normalized]).get(normalized)
+
+    def get_many(self, normalized_addresses):
+        """
+        Look up several normalized addresses at once.
+        Returns a dict of the ones found; the shared tier is read with one
+        query per chunk of keys rather than one query per address.
+        """
+        found = {}
+        pending = {}
+        for normalized in normalized_addresses:
+            key = cache_key(normalized)
+            location = self.memory.get(key)
+            if location is not None:
+                self.counters.incr('memory_hits')
+                found[normalized] = location
+            else:
+                pending[key] = normalized
+
+        db_hits = 0
+        cutoff = timezone.now() - timedelta(seconds=self.ttl)
+        keys = list(pending)
+        for i in range(0, len(keys), DB_CHUNK_SIZE):
+            entries = (GeocodeCacheEntry.objects
+                       .select_related('location')
+                       .filter(key__in=keys[i:i + DB_CHUNK_SIZE], cached_at__gte=cutoff))
+            for entry in entries:
+                db_hits += 1
+                self.memory.set(entry.key, entry.location)
+                found[pending[entry.key]] = entry.location
+
+        self.counters.incr('db_hits', db_hits)
+        self.counters.incr('misses', len(pending) - db_hits)
+        return found
+
+    def put(self, normalized, location, fallback=False):
+        self.put_many([(normalized, location)], fallback)
+
+    def put_many(self, items, fallback=False):
+        """
+        Store ``(normalized_address, location)`` pairs in both tiers, or only
+        in memory for ``fallback_ttl`` seconds if they are ``fallback`` results.
+        """
+        if fallback:
+            for normalized, location in items:
+                self.memory.set(cache_key(normalized), location, self.fallback_ttl)
+            return
+        now = timezone.now()
+        entries = [
+            GeocodeCacheEntry(
+                key=cache_key(normalized),
+                normalized_address=normalized[:255],
+                location=location,
+                cached_at=now,
+            )
+            for normalized, location in items
+        ]
+        for i in range(0, len(entries), DB_CHUNK_SIZE):
+            GeocodeCacheEntry.objects.bulk_create(
+                entries[i:i + DB_CHUNK_SIZE],
+                update_conflicts=True,
+                unique_fields=['key'],
+                update_fields=['normalized_address', 'location', 'cached_at'],
+            )
+        for entry in entries:
+            self.memory.set(entry.key, entry.location)
+
+    def discard_location(self, location_id):
+        self.memory.discard_where(lambda location: location.id == location_id)
+
+    def record_upstream(self, elapsed_ms):
+        self.counters.incr('upstream_calls')
+        self.counters.incr('upstream_ms', elapsed_ms)
+
+    def stats(self):
+        return tiered_cache_stats(self.counters, self.memory)
+
+
+geocode_cache = GeocodeCache(
+    max_entries=settings.GEOCODE_CACHE_MAX_ENTRIES,
+    ttl=settings.GEOCODE_CACHE_TTL,
+    fallback_ttl=settings.GEOCODE_FALLBACK_TTL,
+)
+
+
+def google_geocode(address):
+    """
+    Resolve an address with the Google Geocoding API.
+    Returns a GeocodeResult, or None if the API could not resolve it.
+    """
+    data = maps_client.get_json('geocode', {'address': address})
+    if data['status'] != 'OK':
+        logger.warning("Geocoding failed: %s - %s", data.get('status'), data.get('error_message', 'No error message'))
+        return None
+    result = data['results'][0]
+    return GeocodeResult(
+        address=result['formatted_address'],
+        latitude=result['geometry']['location']['lat'],
+        longitude=result['geometry']['location']['lng'],
+    )
+
+
+def offline_geocode(address):
+    """
+    Resolve an address from the offline gazetteer only, deterministically.
+    Street-level addresses land at a stable point near the place they name;
+    addresses naming no known place get stable pseudo-coordinates. Only
+    exact gazetteer matches are not marked ``fallback``.
+    """
+    match = gazetteer.lookup(address)
+    if match is None:
+        latitude, longitude = deterministic_point(normalize_address(address))
+        return GeocodeResult(address=address, latitude=latitude, longitude=longitude, fallback=True)
+    if match.exact:
+        return GeocodeResult(address=match.name, latitude=match.latitude, longitude=match.longitude)
+    latitude, longitude = deterministic_point(normalize_address(address), center=(match.latitude, match.longitude))
+    return GeocodeResult(address=address, latitude=latitude, longitude=longitude, fallback=True)
+
+
+def resolve_upstream(address):
+    """
+    Resolve an address without consulting the cache.
+    Place-level addresses the offline gazetteer knows are answered locally;
+    everything else uses Google Maps API if available, otherwise the
+    offline geocoder.
+    """
+    if settings.GEOCODE_GAZETTEER_FIRST:
+        match = gazetteer.lookup(address)
+        if match is not None and match.exact:
+            return GeocodeResult(address=match.name, latitude=match.latitude, longitude=match.longitude)
+
+    if not settings.USE_MOCK_DATA and settings.GOOGLE_MAPS_API_KEY:
+        started = time.perf_counter()
+        try:
+            result = google_geocode(address)
+        except Exception as e:
+            logger.warning("Geocoding API error: %s", e)
+            result = None
+        finally:
+            geocode_cache.record_upstream((time.perf_counter() - started) * 1000)
+        if result is not None:
+            return result
+    return offline_geocode(address)
+
+
+# Coalesces concurrent cache misses for the same normalized address
+geocode_flights = SingleFlight()
+
+
+def geocode_address(address):
+    """
+    Geocode an address through the cache.
+    Returns ``(location, created)`` where ``created`` is True when a new
+    Location row had to be inserted.
+    """
+    normalized = normalize_address(address)
+    location = geocode_cache.get(normalized)
+    if location is not None:
+        return location, False
+    return geocode_flights.do(normalized, lambda: _geocode_miss(address, normalized))
+
+
+def _geocode_miss(address, normalized):
+    result = resolve_upstream(address)
+    location, created = Location.objects.resolve(result.address, result.latitude, result.longitude)
+    geocode_cache.put(normalized, location, fallback=result.fallback)
+    return location, created
+
+
+def geocode_many(addresses, resolver=None, max_workers=None):
+    """
+    Geocode a list of addresses through the cache.
+
+    Addresses are deduplicated on their normalized form, cache misses are
+    resolved concurrently on a bounded thread pool, and the results are
+    matched against existing locations before the rest are written in bulk.
+    Returns one ``(location, error)`` pair per input address, in input order.
+    """
+    resolver = resolver or resolve_upstream
+    max_workers = max_workers or settings.GEOCODE_BATCH_WORKERS
+
+    normalized_addresses = []
+    first_seen = {}
+    for address in addresses:
+        normalized = normalize_address(address) if isinstance(address, str) else ''
+        normalized_addresses.append(normalized)
+        if normalized and normalized not in first_seen:
+            first_seen[normalized] = address
+
+    locations = geocode_cache.get_many(list(first_seen))
+    misses = [normalized for normalized in first_seen if normalized not in locations]
+
+    errors = {}
+    resolved = []
+    if misses:
+        def resolve(normalized):
+            try:
+                return resolver(first_seen[normalized]), None
+            except Exception as e:
+                return None, str(e)
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(misses))) as executor:
+            # Run each task in a copy of the caller's context so upstream time is
+            # still attributed to the request that triggered it
+            futures = [executor.submit(contextvars.copy_context().run, resolve, normalized) for normalized in misses]
+            for normalized, future in zip(misses, futures):
+                result, error = future.result()
+                if result is None:
+                    errors[normalized] = error or "Address could not be geocoded"
+                else:
+                    resolved.append((normalized, result))
+
+    if resolved:
+        new_locations = Location.objects.resolve_many([
+            (result.address, result.latitude, result.longitude) for _, result in resolved
+        ])
+        for fallback in (False, True):
+            pairs = [
+                (normalized, location)
+                for (normalized, result), (location, _) in zip(resolved, new_locations)
+                if result.fallback == fallback
+            ]
+            geocode_cache.put_many(pairs, fallback)
+            locations.update(pairs)
+
+    results = []
+    for normalized in normalized_addresses:
+        if not normalized:
+            results.append((None, "Address must be a non-empty string"))
+        elif normalized in locations:
+            results.append((locations[normalized], None))
+        else:
+            results.append((None, errors[normalized]))
+    return results
@@ -0,0 +1,177 @@
+"""
+Route geometry: locating points by distance along a route, cutting leg
+lines into the stretches driven by each segment, and simplifying them for
+display at lower zoom levels.
+
+Simplification is Douglas-Peucker run once per line. Each interior point is
+ranked by the deviation at which the algorithm would keep it, capped at its
+parent's rank so that the ranks nest; the simplified line for any tolerance
+is then just the points ranked above it, so one pass serves every zoom level.
+"""
+import math
+from bisect import bisect_left, bisect_right
+
+from .polyline import decode, encode
+from .spatial import haversine_miles
+
+# Zoom levels with precomputed simplified geometry; closer in, the full
+# geometry is used
+ZOOM_LEVELS = (4, 6, 8, 10, 12)
+
+
+def pixel_degrees(zoom):
+    """
+    Degrees of longitude spanned by one pixel of a 256-pixel web map tile.
+    """
+    return 360 / (256 * 2 ** zoom)
+
+
+def significance(points):
+    """
+    Douglas-Peucker rank of each ``(lat, lng)`` point in degrees; the end
+    points rank infinitely high. Deviations are measured on an
+    equirectangular projection centred on the line.
+    """
+    count = len(points)
+    ranks = [math.inf] * count
+    if count < 3:
+        return ranks
+    scale = math.cos(math.radians(sum(latitude for latitude, _ in points) / count))
+    xs = [longitude * scale for _, longitude in points]
+    ys = [latitude for latitude, _ in points]
+    hypot = math.hypot
+
+    stack = [(0, count - 1, math.inf)]
+    while stack:
+        first, last, ceiling = stack.pop()
+        if last - first < 2:
+            continue
+        x1, y1 = xs[first], ys[first]
+        dx, dy = xs[last] - x1, ys[last] - y1
+        length = hypot(dx, dy)
+        best, index = -1.0, first + 1
+        for i in range(first + 1, last):
+            if length:
+                deviation = abs(dy * (xs[i] - x1) - dx * (ys[i] - y1)) / length
+            else:
+                deviation = hypot(xs[i] - x1, ys[i] - y1)
+            if deviation > best:
+                best, index = deviation, i
+        rank = min(best, ceiling)
+        ranks[index] = rank
+        stack.append((first, index, rank))
+        stack.append((index, last, rank))
+    return ranks
+
+
+def simplify(points, tolerance, ranks=None):
+    """
+    The points of a line that Douglas-Peucker keeps at ``tolerance`` degrees.
+    """
+    ranks = ranks or significance(points)
+    return [point for point, rank in zip(points, ranks) if rank > tolerance]
+
+
+def zoom_levels(points, zooms=ZOOM_LEVELS):
+    """
+    ``{zoom: encoded polyline}`` of a line simplified to one pixel at each
+    zoom level. Keys are strings, as they are stored in JSON.
+    """
+    ranks = significance(points)
+    return {str(zoom): encode(simplify(points, pixel_degrees(zoom), ranks)) for zoom in zooms}
+
+
+class Line:
+    """
+    A polyline that can be cut at fractions of its length.
+    """
+
+    def __init__(self, points):
+        self.points = [tuple(point) for point in points]
+        self.cumulative = [0.0]
+        for a, b in zip(self.points, self.points[1:]):
+            self.cumulative.append(self.cumulative[-1] + haversine_miles(*a, *b))
+
+    def point_at(self, fraction):
+        """
+        The point ``fraction`` of the way along the line.
+        """
+        if len(self.points) < 2:
+            return self.points[0]
+        return self._at(fraction * self.cumulative[-1])
+
+    def _at(self, distance):
+        cumulative = self.cumulative
+        index = min(max(bisect_right(cumulative, distance), 1), len(cumulative) - 1)
+        span = cumulative[index] - cumulative[index - 1]
+        t = (distance - cumulative[index - 1]) / span if span else 0.0
+        t = min(max(t, 0.0), 1.0)
+        (lat1, lng1), (lat2, lng2) = self.points[index - 1], self.points[index]
+        return lat1 + (lat2 - lat1) * t, lng1 + (lng2 - lng1) * t
+
+    def cut(self, start, end):
+        """
+        The stretch of the line between fractions ``start`` and ``end`` of its length.
+        """
+        if len(self.points) < 2:
+            return list(self.points)
+        total = self.cumulative[-1]
+        start_distance, end_distance = start * total, end * total
+        first = bisect_right(self.cumulative, start_distance)
+        last = bisect_left(self.cumulative, end_distance)
+        return [self._at(start_distance)] + self.points[first:last] + [self._at(end_distance)]
+
+
+class RouteLine:
+    """
+    The geometry of a routed trip, addressed by route mile: the distance
+    along the route as the router measured it, which is what the HOS
+    scheduler counts. A route mile is mapped to its leg by binary search over
+    the legs' starting miles, then to a point by the same fraction of the
+    leg's geometry, so each lookup is logarithmic in the legs and points.
+
+    ``legs`` are DirectionsResults and ``stops`` the ``(lat, lng)`` of the
+    ``len(legs) + 1`` stops; a leg without geometry is the straight line
+    between its stops. Leg lines are decoded on first use.
+    """
+
+    def __init__(self, legs, stops):
+        self.legs = legs
+        self.stops = [tuple(stop) for stop in stops]
+        self.starts = [0.0]
+        for leg in legs:
+            self.starts.append(self.starts[-1] + leg.distance)
+        self._lines = {}
+
+    @property
+    def length(self):
+        return self.starts[-1]
+
+    def line(self, leg):
+        """
+        The Line of leg number ``leg``.
+        """
+        line = self._lines.get(leg)
+        if line is None:
+            geometry = self.legs[leg].geometry
+            points = decode(geometry) if geometry else self.stops[leg:leg + 2]
+            line = self._lines[leg] = Line(points)
+        return line
+
+    def locate(self, mile):
+        """
+        ``(leg, fraction)`` of the point ``mile`` miles along the route.
+        """
+        leg = min(max(bisect_right(self.starts, mile) - 1, 0), len(self.legs) - 1)
+        distance = self.legs[leg].distance
+        fraction = (mile - self.starts[leg]) / distance if distance else 0.0
+        return leg, min(max(fraction, 0.0), 1.0)
+
+    def point_at(self, mile):
+        """
+        The ``(lat, lng)`` point ``mile`` miles along the route.
+        """
+        if not self.legs:
+            return self.stops[0]
+        leg, fraction = self.locate(mile)
+        return self.line(leg).point_at(fraction)
@@ -0,0 +1,184 @@
+"""
+Hours of Service scheduling for property-carrying drivers.
+
+``schedule`` turns the legs of a route into the ordered duty segments a
+driver needs to cover them legally: driving, 30-minute breaks, 10-hour
+resets, 34-hour restarts, fuel stops and the on-duty time at pickups and
+dropoffs. It works on plain numbers and returns plain tuples, so it can be
+tested and benchmarked without a database; persisting the result is up to
+the caller.
+
+All durations are in minutes and distances in miles.
+
+The cycle limit is applied to the total on-duty time since the last
+restart. Hours worked before the trip are never assumed to roll off the
+end of the 7/8-day window, which can only make the schedule more
+conservative.
+"""
+import math
+from collections import namedtuple
+
+# Segment kinds, matching RouteSegment.SEGMENT_TYPES
+DRIVE = 'drive'
+BREAK = 'rest'  # 30-minute interruption of driving
+RESET = 'sleep'  # 10 consecutive hours off duty, or a 34-hour restart
+FUEL = 'fuel'
+PICKUP = 'pickup'
+DROPOFF = 'dropoff'
+
+Rules = namedtuple('Rules', [
+    'max_driving',  # driving allowed after a reset
+    'duty_window',  # driving ends this long after coming on duty
+    'break_after',  # driving allowed without a 30-minute interruption
+    'break_duration',
+    'reset_duration',  # consecutive time off that starts a new duty period
+    'cycle_limit',  # on-duty time allowed in the 7/8-day cycle
+    'restart_duration',  # consecutive time off that starts a new cycle
+    'fuel_interval',  # miles between fuel stops
+    'fuel_duration',
+    'service_duration',  # on duty at each pickup and dropoff
+])
+
+PROPERTY_70_8 = Rules(
+    max_driving=11 * 60,
+    duty_window=14 * 60,
+    break_after=8 * 60,
+    break_duration=30,
+    reset_duration=10 * 60,
+    cycle_limit=70 * 60,
+    restart_duration=34 * 60,
+    fuel_interval=1000,
+    fuel_duration=30,
+    service_duration=60,
+)
+PROPERTY_60_7 = PROPERTY_70_8._replace(cycle_limit=60 * 60)
+
+# Where the driver stands when the trip starts
+DutyState = namedtuple(
+    'DutyState',
+    ['driving', 'window', 'since_break', 'cycle', 'since_fuel'],
+    defaults=[0, 0, 0, 0, 0],
+)
+
+# ``start`` is minutes from the start of the trip. ``leg`` is the leg the
+# segment is on and ``mile`` how far along that leg it starts; time spent at
+# a stop belongs to the leg arriving there (the first stop to leg 0, mile 0).
+Segment = namedtuple('Segment', ['kind', 'start', 'duration', 'distance', 'leg', 'mile'])
+
+# Tolerance for comparing accumulated minutes and miles
+EPSILON = 1e-6
+
+
+def schedule(legs, stop_types=None, state=None, rules=PROPERTY_70_8, fuel_stops=None):
+    """
+    Schedule a route of ``(miles, minutes)`` legs. ``stop_types`` gives the
+    type of each of the ``len(legs) + 1`` stops; pickups and dropoffs take
+    on-duty service time. Returns the list of Segments in order.
+
+    Without ``fuel_stops`` the truck is fuelled every ``fuel_interval``
+    miles wherever it is. Otherwise they are the ``(route mile, extra
+    minutes)`` of planned fuel stops in route order, each taking
+    ``fuel_duration`` plus its extra minutes (the detour to reach it); the
+    planner is then responsible for keeping them close enough together.
+
+    Time limits only restrict driving, so service at a stop is never delayed;
+    any non-driving period of at least ``break_duration`` counts as the
+    30-minute break, as it has since the 2020 rule change.
+    """
+    state = state or DutyState()
+    driving, window, since_break, cycle, since_fuel = state
+    (max_driving, duty_window, break_after, break_duration, reset_duration,
+     cycle_limit, restart_duration, fuel_interval, fuel_duration, service_duration) = rules
+    services = {PICKUP: service_duration, DROPOFF: service_duration}
+
+    segments = []
+    add = segments.append
+    clock = 0.0
+
+    # Route mile of the next fuel stop, and the minutes it takes
+    planned = iter(fuel_stops) if fuel_stops is not None else None
+    if planned is None:
+        fuel_at, fuel_minutes = fuel_interval - since_fuel, fuel_duration
+    else:
+        fuel_at, extra = next(planned, (math.inf, 0))
+        fuel_minutes = fuel_duration + extra
+    # Route miles before the current leg
+    leg_start = 0.0
+
+    first_service = services.get(stop_types[0]) if stop_types else None
+    if first_service:
+        add(Segment(stop_types[0], clock, first_service, 0.0, 0, 0.0))
+        clock += first_service
+        window += first_service
+        cycle += first_service
+        if first_service >= break_duration:
+            since_break = 0
+
+    for leg, (miles, minutes) in enumerate(legs):
+        if minutes <= 0:
+            add(Segment(DRIVE, clock, 0.0, miles, leg, 0.0))
+        else:
+            rate = miles / minutes
+            driven = 0.0
+            while minutes - driven > EPSILON:
+                if cycle_limit - cycle <= EPSILON:
+                    add(Segment(RESET, clock, restart_duration, 0.0, leg, driven * rate))
+                    clock += restart_duration
+                    driving = window = since_break = cycle = 0
+                elif max_driving - driving <= EPSILON or duty_window - window <= EPSILON:
+                    add(Segment(RESET, clock, reset_duration, 0.0, leg, driven * rate))
+                    clock += reset_duration
+                    driving = window = since_break = 0
+                elif rate and fuel_at - (leg_start + driven * rate) <= EPSILON:
+                    add(Segment(FUEL, clock, fuel_minutes, 0.0, leg, driven * rate))
+                    clock += fuel_minutes
+                    window += fuel_minutes
+                    cycle += fuel_minutes
+                    if fuel_minutes >= break_duration:
+                        since_break = 0
+                    if planned is None:
+                        fuel_at = leg_start + driven * rate + fuel_interval
+                    else:
+                        fuel_at, extra = next(planned, (math.inf, 0))
+                        fuel_minutes = fuel_duration + extra
+                elif break_after - since_break <= EPSILON:
+                    add(Segment(BREAK, clock, break_duration, 0.0, leg, driven * rate))
+                    clock += break_duration
+                    window += break_duration
+                    since_break = 0
+                else:
+                    chunk = min(
+                        minutes - driven, max_driving - driving, duty_window - window,
+                        cycle_limit - cycle, break_after - since_break,
+                        (fuel_at - leg_start) / rate - driven if rate else minutes,
+                    )
+                    add(Segment(DRIVE, clock, chunk, chunk * rate, leg, driven * rate))
+                    clock += chunk
+                    driven += chunk
+                    driving += chunk
+                    window += chunk
+                    since_break += chunk
+                    cycle += chunk
+        leg_start += miles
+
+        service = services.get(stop_types[leg + 1]) if stop_types else None
+        if service:
+            add(Segment(stop_types[leg + 1], clock, service, 0.0, leg, miles))
+            clock += service
+            window += service
+            cycle += service
+            if service >= break_duration:
+                since_break = 0
+
+    return segments
+
+
+def schedule_many(jobs, rules=PROPERTY_70_8):
+    """
+    ``schedule`` for each ``(legs, stop_types, state, fuel_stops)`` job; a
+    unit of work for a process pool.
+    """
+    return [
+        schedule(legs, stop_types, state, rules, fuel_stops)
+        for legs, stop_types, state, fuel_stops in jobs
+    ]
@@ -0,0 +1,137 @@
+"""
+Background jobs backed by the Job table, with no external broker.
+
+Requests ``enqueue`` a job and return at once; ``run_jobs`` worker
+processes claim jobs and run them. A worker claims a job with an UPDATE
+that only matches while the job is still queued (or its previous run has
+timed out), so when several workers race for one job exactly one update
+succeeds. Throughput grows with the number of worker processes, each of
+which claims and runs jobs in its own loop.
+
+Handlers are looked up by the job's ``kind`` and called with its
+``params``; what they return becomes the job's result and what they raise
+its error.
+"""
+import logging
+import os
+import socket
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+
+class JobError(Exception):
+    """
+    A job failed in an expected way; the message is reported as its error.
+    """
+
+
+def generate_eld_logs(trip_id, full=False):
+    from .eld import generate_logs
+    from .models import Trip
+    from .serializers import DailyLogSerializer
+
+    try:
+        trip = Trip.objects.select_related('current_location').get(id=trip_id)
+    except Trip.DoesNotExist:
+        raise JobError(f"Trip with ID {trip_id} not found")
+    daily_logs = generate_logs(trip, full=full)
+    if daily_logs is None:
+        raise JobError("No segments found for this trip")
+    return {"logs": DailyLogSerializer(daily_logs, many=True).data}
+
+
+def plan_route_batch(trips):
+    from .views import plan_batch
+
+    return {"results": plan_batch(trips)}
+
+
+HANDLERS = {
+    'generate_eld_logs': generate_eld_logs,
+    'plan_route_batch': plan_route_batch,
+}
+
+
+def enqueue(kind, **params):
+    """
+    Queue a job for the workers. Returns the Job.
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind {kind!r}")
+    return Job.objects.create(kind=kind, params=params)
+
+
+def worker_name(number=0):
+    return f"{socket.gethostname()}:{os.getpid()}:{number}"
+
+
+def claim(worker):
+    """
+    Claim the oldest job that is queued, or whose run has outlasted
+    JOB_TIMEOUT. Returns the claimed Job, or None if there is none.
+    """
+    now = timezone.now()
+    timed_out = now - timedelta(seconds=settings.JOB_TIMEOUT)
+    candidates = (
+        Job.objects
+        .filter(Q(status=Job.QUEUED) | Q(status=Job.RUNNING, started_at__lt=timed_out))
+        .order_by('created_at', 'id')
+        .values_list('id', 'status', 'started_at')[:10]
+    )
+    for job_id, status, started_at in candidates:
+        # Only matches if no other worker claimed the job since it was read
+        claimed = Job.objects.filter(id=job_id, status=status, started_at=started_at).update(
+            status=Job.RUNNING, worker=worker, started_at=now, attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return Job.objects.get(id=job_id)
+    return None
+
+
+def run(job):
+    """
+    Run a claimed Job and record its outcome, unless another worker has
+    since reclaimed it.
+    """
+    outcome = {'status': Job.SUCCEEDED, 'result': None, 'error': ''}
+    try:
+        if job.attempts > settings.JOB_MAX_ATTEMPTS:
+            raise JobError(f"Gave up after {settings.JOB_MAX_ATTEMPTS} attempts")
+        outcome['result'] = HANDLERS[job.kind](**job.params)
+    except JobError as e:
+        outcome.update(status=Job.FAILED, error=str(e))
+    except Exception as e:
+        logger.exception("Job %s (%s) failed", job.id, job.kind)
+        outcome.update(status=Job.FAILED, error=f"{type(e).__name__}: {e}")
+    Job.objects.filter(id=job.id, worker=job.worker, started_at=job.started_at).update(
+        finished_at=timezone.now(), **outcome
+    )
+    return outcome['status']
+
+
+def work(worker, once=False, poll_interval=None):
+    """
+    Claim and run jobs until there are none left (with ``once``) or forever,
+    polling every ``poll_interval`` seconds while the queue is empty.
+    Returns the number of jobs run.
+    """
+    poll_interval = poll_interval if poll_interval is not None else settings.JOB_POLL_INTERVAL
+    count = 0
+    while True:
+        job = claim(worker)
+        if job is not None:
+            status = run(job)
+            count += 1
+            logger.info("Job %s (%s) %s on %s", job.id, job.kind, status, worker)
+        elif once:
+            return count
+        else:
+            time.sleep(poll_interval)
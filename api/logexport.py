@@ -0,0 +1,260 @@
+"""
+PDF export of daily logs: a page per log (more if its entries do not fit)
+with the log's header, its duty status graph and its entries.
+
+The PDF is produced as a stream of byte chunks. Each page is sent as soon
+as it is drawn, and only the byte offset of each object is kept for the
+cross-reference table at the end. Logs are read with a chunked iterator
+that prefetches their entries a chunk at a time. Memory use therefore
+depends on the chunk size, not on the number of pages. The file header
+goes out before the first query runs. Under ASGI, Django buffers a sync
+iterator in full before sending it, so the export view hands ASGI servers
+``async_chunks`` of the same stream instead.
+
+The writer uses the standard Helvetica fonts, which viewers supply, so no
+PDF library or font files are needed.
+"""
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Prefetch
+
+from .loggraph import (
+    DUTY, GRID, GRID_WIDTH, HEIGHT, LEFT, PALETTE, WIDTH, duration_label, duty_periods, grid_lines, labels,
+    minute_x, row_y,
+)
+from .models import LogEntry
+
+# US Letter, landscape, in points
+PAGE_WIDTH = 792
+PAGE_HEIGHT = 612
+MARGIN = 36
+
+# The graph spans the page between the margins, below the header
+GRAPH_SCALE = (PAGE_WIDTH - 2 * MARGIN) / WIDTH
+GRAPH_TOP = PAGE_HEIGHT - MARGIN - 60
+
+# Entries table: column left edges and widths, and row height
+TABLE_COLUMNS = (('Status', 0, 50), ('Start', 50, 50), ('End', 100, 50), ('Location', 150, 300), ('Remarks', 450, 270))
+TABLE_ROW = 12
+TABLE_FONT = 8
+FIRST_TABLE_TOP = GRAPH_TOP - HEIGHT * GRAPH_SCALE - 24
+CONTINUED_TABLE_TOP = PAGE_HEIGHT - MARGIN - 40
+
+
+def pdf_string(text):
+    """
+    A PDF string literal of ``text``; characters outside Latin-1 become '?'.
+    """
+    text = str(text).replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+    return f"({text})"
+
+
+def fit(text, width, size):
+    """
+    ``text`` cut to about ``width`` points at font ``size``.
+    """
+    limit = int(width / (size * 0.5))
+    text = str(text)
+    return text if len(text) <= limit else text[:limit - 3] + '...'
+
+
+def color(index, operator):
+    return ' '.join(f"{channel / 255:.3f}" for channel in PALETTE[index]) + f" {operator}"
+
+
+def text(x, y, value, size=9, font='F1', anchor='start'):
+    if anchor == 'middle':
+        x -= len(str(value)) * size * 0.25
+    return f"BT /{font} {size} Tf {x:.2f} {y:.2f} Td {pdf_string(value)} Tj ET"
+
+
+def graph_point(x, y):
+    return MARGIN + x * GRAPH_SCALE, GRAPH_TOP - y * GRAPH_SCALE
+
+
+def graph_grid():
+    ops = [color(GRID, 'RG'), '0.5 w']
+    for x1, y1, x2, y2 in grid_lines():
+        (left, top), (right, bottom) = graph_point(x1, y1), graph_point(x2, y2)
+        ops.append(f"{left:.2f} {top:.2f} m {right:.2f} {bottom:.2f} l")
+    ops.append('S 0 g')
+    for x, y, label, anchor in labels():
+        left, middle = graph_point(x, y)
+        ops.append(text(left, middle - 2.5, label, size=7, anchor=anchor))
+    return '\n'.join(ops)
+
+
+# Drawn once: the same on every page
+PDF_GRID = graph_grid()
+
+
+def graph_ops(date, entries):
+    """
+    Drawing operators of the duty status graph of a day's ``(status,
+    start_time, end_time)`` entries.
+    """
+    periods, totals = duty_periods(date, entries)
+    ops = [PDF_GRID]
+    if periods:
+        ops.extend([color(DUTY, 'RG'), '1.5 w 1 j'])
+        for number, (row, first, last) in enumerate(periods):
+            (left, y), (right, _) = graph_point(minute_x(first), row_y(row)), graph_point(minute_x(last), row_y(row))
+            ops.append(f"{left:.2f} {y:.2f} {'m' if number == 0 else 'l'} {right:.2f} {y:.2f} l")
+        ops.append('S 0 g')
+    for row, total in enumerate(totals):
+        left, middle = graph_point(LEFT + GRID_WIDTH + 8, row_y(row))
+        ops.append(text(left, middle - 3, duration_label(total), size=8))
+    return ops
+
+
+def table_ops(top, entries):
+    ops = [text(MARGIN + left, top, title, size=TABLE_FONT, font='F2') for title, left, _ in TABLE_COLUMNS]
+    y = top - TABLE_ROW
+    for entry in entries:
+        values = (
+            entry.status, entry.start_time.strftime('%H:%M'), entry.end_time.strftime('%H:%M'),
+            entry.location, entry.remarks,
+        )
+        for (_, left, width), value in zip(TABLE_COLUMNS, values):
+            ops.append(text(MARGIN + left, y, fit(value, width - 6, TABLE_FONT), size=TABLE_FONT))
+        y -= TABLE_ROW
+    return ops
+
+
+def table_capacity(top):
+    return int((top - MARGIN) // TABLE_ROW) - 1
+
+
+def log_pages(daily_log, entries):
+    """
+    Content streams of the pages of a DailyLog with its entries in order:
+    the header, graph and as many entries as fit, then as many continuation
+    pages as the rest of the entries need.
+    """
+    title = f"Driver's Daily Log - {daily_log.date.isoformat()} (UTC)"
+    ops = [
+        text(MARGIN, PAGE_HEIGHT - MARGIN - 14, title, size=14, font='F2'),
+        text(MARGIN, PAGE_HEIGHT - MARGIN - 30,
+             f"Driver: {daily_log.driver_name}    Carrier: {daily_log.carrier_name}    "
+             f"Truck: {daily_log.truck_number}    Trailer: {daily_log.trailer_number}"),
+        text(MARGIN, PAGE_HEIGHT - MARGIN - 43,
+             f"Odometer: {daily_log.start_odometer} - {daily_log.end_odometer}    "
+             f"Total miles: {daily_log.total_miles:g}    Trip: {daily_log.trip_id}"),
+    ]
+    ops.extend(graph_ops(daily_log.date, [(entry.status, entry.start_time, entry.end_time) for entry in entries]))
+    capacity = table_capacity(FIRST_TABLE_TOP)
+    ops.extend(table_ops(FIRST_TABLE_TOP, entries[:capacity]))
+    yield '\n'.join(ops)
+
+    rest = entries[capacity:]
+    capacity = table_capacity(CONTINUED_TABLE_TOP)
+    for start in range(0, len(rest), capacity):
+        yield '\n'.join([
+            text(MARGIN, PAGE_HEIGHT - MARGIN - 14, f"{title} (continued)", size=14, font='F2'),
+            *table_ops(CONTINUED_TABLE_TOP, rest[start:start + capacity]),
+        ])
+
+
+class PdfStream:
+    """
+    Serializes PDF objects in the order they are written, keeping only
+    their byte offsets for the cross-reference table.
+    """
+
+    def __init__(self):
+        self.offsets = []
+        self.position = 0
+
+    def emit(self, data):
+        self.position += len(data)
+        return data
+
+    def reserve(self):
+        """
+        Number a new object, to be referred to before it is written.
+        """
+        self.offsets.append(None)
+        return len(self.offsets)
+
+    def header(self):
+        return self.emit(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def write(self, number, body):
+        self.offsets[number - 1] = self.position
+        return self.emit(b'%d 0 obj\n%s\nendobj\n' % (number, body))
+
+    def stream(self, number, content):
+        data = zlib.compress(content.encode('latin-1', 'replace'))
+        return self.write(number, b'<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream' % (len(data), data))
+
+    def trailer(self, root):
+        xref = self.position
+        lines = [b'xref\n0 %d\n0000000000 65535 f \n' % (len(self.offsets) + 1)]
+        lines.extend(b'%010d 00000 n \n' % offset for offset in self.offsets)
+        lines.append(b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(self.offsets) + 1, root, xref))
+        return self.emit(b''.join(lines))
+
+
+def render_pdf(daily_logs):
+    """
+    The PDF of DailyLogs (with their entries loaded in order), as an
+    iterator of byte chunks.
+    """
+    pdf = PdfStream()
+    catalog, pages, regular, bold = (pdf.reserve() for _ in range(4))
+    yield pdf.header()
+    yield pdf.write(catalog, b'<< /Type /Catalog /Pages %d 0 R >>' % pages)
+    for number, name in ((regular, b'Helvetica'), (bold, b'Helvetica-Bold')):
+        yield pdf.write(number, b'<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>' % name)
+    page_dict = (
+        b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Resources << /Font << /F1 %d 0 R /F2 %d 0 R >> >>'
+        % (pages, PAGE_WIDTH, PAGE_HEIGHT, regular, bold)
+    )
+
+    kids = []
+    for daily_log in daily_logs:
+        entries = list(daily_log.entries.all())
+        # Prefetched entries refer back to their log; dropping the log's side
+        # of that cycle frees each chunk as soon as it is done, not at the next
+        # garbage collection
+        daily_log._prefetched_objects_cache = {}
+        for content in log_pages(daily_log, entries):
+            contents, page = pdf.reserve(), pdf.reserve()
+            yield pdf.stream(contents, content)
+            yield pdf.write(page, page_dict + b' /Contents %d 0 R >>' % contents)
+            kids.append(page)
+
+    yield pdf.write(pages, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+        b' '.join(b'%d 0 R' % kid for kid in kids), len(kids),
+    ))
+    yield pdf.trailer(catalog)
+
+
+def export_logs(queryset, chunk_size=None):
+    """
+    Stream the PDF of a DailyLog queryset in date order, reading the logs
+    ``chunk_size`` (LOG_EXPORT_CHUNK_SIZE) at a time with their entries.
+    """
+    logs = (
+        queryset.order_by('date', 'trip_id', 'id')
+        .prefetch_related(Prefetch('entries', queryset=LogEntry.objects.order_by('start_time', 'id')))
+        .iterator(chunk_size=chunk_size or settings.LOG_EXPORT_CHUNK_SIZE)
+    )
+    return render_pdf(logs)
+
+
+async def async_chunks(chunks):
+    """
+    An iterator of byte chunks as an async iterator. Each chunk is produced
+    in the thread the ORM runs in under ASGI, one at a time, so the stream
+    still starts at once and its memory use stays bounded.
+    """
+    chunks = iter(chunks)
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    while True:
+        chunk = await next_chunk(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
@@ -0,0 +1,392 @@
+"""
+The 24-hour duty status graph of a DailyLog, rendered as SVG or PNG.
+
+The graph has the four rows of the paper log (off duty, sleeper berth,
+driving, on duty) against the hours of the UTC day, with the driver's
+status drawn as one line and the hours in each status totalled on the
+right. The PNG is drawn into a palette bitmap with a built-in pixel font
+and compressed with zlib, so neither format needs an imaging library. The
+grid is drawn once and copied for each graph.
+
+Graphs are cached by a hash of what they show (the day and its entries), in
+memory and on disk (LOG_GRAPH_CACHE_DIR, least recently used files evicted
+past LOG_GRAPH_CACHE_MAX_BYTES), so an unchanged log is never rendered
+twice and the hash serves as its ETag.
+"""
+import hashlib
+import json
+import logging
+import os
+import struct
+import threading
+import zlib
+from pathlib import Path
+
+from django.conf import settings
+
+from .caching import TTLCache
+from .eld import day_bounds
+
+logger = logging.getLogger(__name__)
+
+# Bump when the drawing changes, so cached graphs are not served
+RENDER_VERSION = 1
+
+# Rows of the graph, top to bottom
+ROWS = ('OFF', 'SB', 'D', 'ON')
+HOUR_LABELS = ['M'] + [str(hour) for hour in range(1, 12)] + ['N'] + [str(hour) for hour in range(1, 12)] + ['M']
+
+# Layout in pixels
+LEFT = 48
+TOP = 22
+RIGHT = 56
+BOTTOM = 6
+HOUR_WIDTH = 36
+ROW_HEIGHT = 28
+GRID_WIDTH = 24 * HOUR_WIDTH
+GRID_HEIGHT = len(ROWS) * ROW_HEIGHT
+WIDTH = LEFT + GRID_WIDTH + RIGHT
+HEIGHT = TOP + GRID_HEIGHT + BOTTOM
+
+# PNG palette: background, grid, text, duty line
+PALETTE = ((255, 255, 255), (185, 185, 185), (60, 60, 60), (0, 90, 200))
+BACKGROUND, GRID, INK, DUTY = range(len(PALETTE))
+SVG_COLORS = ['#%02x%02x%02x' % color for color in PALETTE]
+
+# 3x5 pixel font for the PNG labels, drawn at FONT_SCALE
+FONT_SCALE = 2
+FONT = {
+    '0': ('###', '#.#', '#.#', '#.#', '###'),
+    '1': ('.#.', '##.', '.#.', '.#.', '###'),
+    '2': ('###', '..#', '###', '#..', '###'),
+    '3': ('###', '..#', '###', '..#', '###'),
+    '4': ('#.#', '#.#', '###', '..#', '..#'),
+    '5': ('###', '#..', '###', '..#', '###'),
+    '6': ('###', '#..', '###', '#.#', '###'),
+    '7': ('###', '..#', '..#', '..#', '..#'),
+    '8': ('###', '#.#', '###', '#.#', '###'),
+    '9': ('###', '#.#', '###', '..#', '###'),
+    'B': ('##.', '#.#', '##.', '#.#', '##.'),
+    'D': ('##.', '#.#', '#.#', '#.#', '##.'),
+    'F': ('###', '#..', '##.', '#..', '#..'),
+    'M': ('#.#', '###', '#.#', '#.#', '#.#'),
+    'N': ('##.', '#.#', '#.#', '#.#', '#.#'),
+    'O': ('.#.', '#.#', '#.#', '#.#', '.#.'),
+    'S': ('.##', '#..', '.#.', '..#', '##.'),
+    ':': ('...', '.#.', '...', '.#.', '...'),
+}
+GLYPH_WIDTH = 3 * FONT_SCALE
+GLYPH_HEIGHT = 5 * FONT_SCALE
+GLYPH_ADVANCE = GLYPH_WIDTH + FONT_SCALE
+
+# Rendered graphs never go stale (they are keyed by content); the TTL only
+# bounds how long an unused one holds memory
+MEMORY_TTL = 24 * 60 * 60
+# Once the disk tier is over its size limit, files are evicted down to this
+# fraction of it, so eviction does not run again on the next write
+PRUNE_TO = 0.8
+
+
+def graph_key(date, entries):
+    """
+    Hash of everything a log's graph shows: its day and its ``(status,
+    start_time, end_time)`` entries.
+    """
+    payload = json.dumps([
+        RENDER_VERSION, date.isoformat(),
+        [(status, start.isoformat(), end.isoformat()) for status, start, end in entries],
+    ])
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+def duty_periods(date, entries):
+    """
+    ``(row, start minute, end minute)`` of each entry in the rows of the
+    graph, clipped to the day, and the minutes spent in each row.
+    """
+    day_start = day_bounds(date)[0]
+    periods = []
+    totals = [0.0] * len(ROWS)
+    for status, start, end in entries:
+        if status not in ROWS:
+            continue
+        row = ROWS.index(status)
+        first = min(max((start - day_start).total_seconds() / 60, 0), 24 * 60)
+        last = min(max((end - day_start).total_seconds() / 60, 0), 24 * 60)
+        if last < first:
+            continue
+        periods.append((row, first, last))
+        totals[row] += last - first
+    return periods, totals
+
+
+def minute_x(minute):
+    return LEFT + round(minute * HOUR_WIDTH / 60)
+
+
+def row_y(row):
+    return TOP + row * ROW_HEIGHT + ROW_HEIGHT // 2
+
+
+def duration_label(minutes):
+    minutes = round(minutes)
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def grid_lines():
+    """
+    ``(x1, y1, x2, y2)`` of the lines of the empty grid: the row borders,
+    the hour lines and the quarter-hour ticks, which are longer at the half hour.
+    """
+    lines = [(LEFT, TOP + row * ROW_HEIGHT, LEFT + GRID_WIDTH, TOP + row * ROW_HEIGHT) for row in range(len(ROWS) + 1)]
+    for quarter in range(24 * 4 + 1):
+        x = LEFT + quarter * HOUR_WIDTH // 4
+        if quarter % 4 == 0:
+            lines.append((x, TOP, x, TOP + GRID_HEIGHT))
+            continue
+        tick = ROW_HEIGHT // 2 if quarter % 2 == 0 else ROW_HEIGHT // 4
+        for row in range(len(ROWS)):
+            lines.append((x, TOP + row * ROW_HEIGHT, x, TOP + row * ROW_HEIGHT + tick))
+    return lines
+
+
+def labels():
+    """
+    ``(x, y, text, anchor)`` of the static labels, with ``y`` the middle of the text.
+    """
+    items = [(LEFT + hour * HOUR_WIDTH, TOP - 9, label, 'middle') for hour, label in enumerate(HOUR_LABELS)]
+    items.extend((6, row_y(row), label, 'start') for row, label in enumerate(ROWS))
+    return items
+
+
+# SVG
+
+SVG_GRID = (
+    f'<path d="{"".join(f"M{x1} {y1}V{y2}" if x1 == x2 else f"M{x1} {y1}H{x2}" for x1, y1, x2, y2 in grid_lines())}" '
+    f'stroke="{SVG_COLORS[GRID]}" fill="none" shape-rendering="crispEdges"/>'
+    f'<g font-family="sans-serif" font-size="10" fill="{SVG_COLORS[INK]}" dominant-baseline="central">'
+    + ''.join(f'<text x="{x}" y="{y}" text-anchor="{anchor}">{text}</text>' for x, y, text, anchor in labels())
+    + '</g>'
+)
+
+
+def render_svg(date, entries):
+    """
+    The graph of a day's ``(status, start_time, end_time)`` entries, in
+    start order, as SVG bytes.
+    """
+    periods, totals = duty_periods(date, entries)
+    points = []
+    for row, first, last in periods:
+        y = row_y(row)
+        points.append(f"{minute_x(first)},{y} {minute_x(last)},{y}")
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{WIDTH}" height="{HEIGHT}" viewBox="0 0 {WIDTH} {HEIGHT}">',
+        f'<title>Duty status {date.isoformat()}</title>',
+        f'<rect width="{WIDTH}" height="{HEIGHT}" fill="{SVG_COLORS[BACKGROUND]}"/>',
+        SVG_GRID,
+    ]
+    if points:
+        parts.append(
+            f'<polyline points="{" ".join(points)}" stroke="{SVG_COLORS[DUTY]}" stroke-width="3" '
+            'fill="none" stroke-linejoin="round"/>'
+        )
+    parts.append(f'<g font-family="sans-serif" font-size="10" fill="{SVG_COLORS[INK]}" dominant-baseline="central">')
+    parts.extend(
+        f'<text x="{LEFT + GRID_WIDTH + 8}" y="{row_y(row)}">{duration_label(total)}</text>'
+        for row, total in enumerate(totals)
+    )
+    parts.append('</g></svg>')
+    return ''.join(parts).encode()
+
+
+# PNG
+
+# Each row of the bitmap starts with its PNG filter byte (0, none)
+STRIDE = WIDTH + 1
+
+
+def fill(bitmap, x1, y1, x2, y2, color):
+    """
+    Fill the pixels from ``(x1, y1)`` to ``(x2, y2)`` inclusive.
+    """
+    run = bytes([color]) * (x2 - x1 + 1)
+    for y in range(y1, y2 + 1):
+        offset = y * STRIDE + 1
+        bitmap[offset + x1:offset + x2 + 1] = run
+
+
+def draw_text(bitmap, x, y, text, color, anchor='start'):
+    width = len(text) * GLYPH_ADVANCE - FONT_SCALE
+    if anchor == 'middle':
+        x -= width // 2
+    y -= GLYPH_HEIGHT // 2
+    for char in text:
+        for glyph_row, pixels in enumerate(FONT.get(char, ())):
+            for glyph_column, pixel in enumerate(pixels):
+                if pixel == '#':
+                    left, top = x + glyph_column * FONT_SCALE, y + glyph_row * FONT_SCALE
+                    fill(bitmap, left, top, left + FONT_SCALE - 1, top + FONT_SCALE - 1, color)
+        x += GLYPH_ADVANCE
+
+
+def grid_bitmap():
+    bitmap = bytearray(STRIDE * HEIGHT)
+    for x1, y1, x2, y2 in grid_lines():
+        fill(bitmap, x1, y1, x2, y2, GRID)
+    for x, y, text, anchor in labels():
+        draw_text(bitmap, x, y, text, INK, anchor)
+    return bytes(bitmap)
+
+
+PNG_GRID = grid_bitmap()
+
+
+def png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def render_png(date, entries):
+    """
+    The graph of a day's ``(status, start_time, end_time)`` entries, in
+    start order, as PNG bytes.
+    """
+    periods, totals = duty_periods(date, entries)
+    bitmap = bytearray(PNG_GRID)
+    previous = None
+    for row, first, last in periods:
+        x1, x2, y = minute_x(first), minute_x(last), row_y(row)
+        if previous is not None and previous != y:
+            fill(bitmap, x1 - 1, min(previous, y) - 1, x1 + 1, max(previous, y) + 1, DUTY)
+        fill(bitmap, x1, y - 1, x2, y + 1, DUTY)
+        previous = y
+    for row, total in enumerate(totals):
+        draw_text(bitmap, LEFT + GRID_WIDTH + 8, row_y(row), duration_label(total), INK)
+
+    return b''.join([
+        b'\x89PNG\r\n\x1a\n',
+        png_chunk(b'IHDR', struct.pack('>IIBBBBB', WIDTH, HEIGHT, 8, 3, 0, 0, 0)),
+        png_chunk(b'PLTE', bytes(channel for color in PALETTE for channel in color)),
+        png_chunk(b'IDAT', zlib.compress(bytes(bitmap), 6)),
+        png_chunk(b'IEND', b''),
+    ])
+
+
+# Renderer and content type of each format
+FORMATS = {
+    'svg': (render_svg, 'image/svg+xml'),
+    'png': (render_png, 'image/png'),
+}
+
+
+class GraphCache:
+    """
+    Rendered graphs by name: an in-process LRU tier over files in
+    ``directory`` (none if it is empty), which are shared between worker
+    processes and survive restarts. Names are content hashes, so entries are
+    never invalidated, only evicted.
+
+    Files are touched when read, and the least recently used ones are deleted
+    when the directory grows past ``max_bytes``. The size is measured on the
+    first write, then estimated from this process's writes and measured again
+    once the estimate is over the limit.
+    """
+
+    def __init__(self, directory, max_entries, max_bytes):
+        self.directory = Path(directory) if directory else None
+        self.memory = TTLCache(max_entries, MEMORY_TTL)
+        self.max_bytes = max_bytes
+        self.disk_bytes = None
+        self._lock = threading.Lock()
+
+    def path(self, name):
+        return self.directory / name[:2] / name
+
+    def get(self, name):
+        content = self.memory.get(name)
+        if content is None and self.directory is not None:
+            path = self.path(name)
+            try:
+                content = path.read_bytes()
+                os.utime(path)
+            except OSError:
+                return None
+            self.memory.set(name, content)
+        return content
+
+    def set(self, name, content):
+        self.memory.set(name, content)
+        if self.directory is None:
+            return
+        path = self.path(name)
+        # Written aside and renamed, so readers never see a partial file; the
+        # name is per thread, as threads may write the same graph at once
+        temporary = path.with_name(f"{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temporary.write_bytes(content)
+            os.replace(temporary, path)
+        except OSError as e:
+            logger.warning("Log graph %s not cached on disk: %s", name, e)
+            return
+        with self._lock:
+            if self.disk_bytes is not None:
+                self.disk_bytes += len(content)
+            if self.disk_bytes is None or self.disk_bytes > self.max_bytes:
+                self.disk_bytes = self.prune()
+
+    def prune(self):
+        """
+        Delete the least recently used files until the directory is within
+        ``max_bytes`` (down to PRUNE_TO of it). Returns the bytes left.
+        """
+        files = []
+        for path in self.directory.glob('*/*'):
+            if path.suffix == '.tmp':
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        if total <= self.max_bytes:
+            return total
+        files.sort(key=lambda item: item[0])
+        for _, size, path in files:
+            if total <= self.max_bytes * PRUNE_TO:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning("Log graph %s not evicted: %s", path.name, e)
+                continue
+            total -= size
+        return total
+
+    def clear(self):
+        self.memory.clear()
+
+
+graph_cache = GraphCache(
+    settings.LOG_GRAPH_CACHE_DIR,
+    max_entries=settings.LOG_GRAPH_CACHE_MAX_ENTRIES,
+    max_bytes=settings.LOG_GRAPH_CACHE_MAX_BYTES,
+)
+
+
+def log_graph(date, entries, fmt, key=None, cache=None):
+    """
+    The graph of a day's entries in format ``fmt`` (``svg`` or ``png``),
+    from the cache if it has been rendered before. ``key`` is the
+    ``graph_key`` of the entries, if already known.
+    """
+    cache = cache or graph_cache
+    name = f"{key or graph_key(date, entries)}.{fmt}"
+    content = cache.get(name)
+    if content is None:
+        content = FORMATS[fmt][0](date, entries)
+        cache.set(name, content)
+    return content
@@ -0,0 +1,50 @@
+import csv
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.gazetteer import city_key, exit_key, zip_key
+
+
+class Command(BaseCommand):
+    help = 'Builds the sorted offline gazetteer index from one or more CSV files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'sources', nargs='*',
+            help='CSV files with columns kind,name,state,code,latitude,longitude '
+                 '(defaults to api/data/gazetteer_seed.csv)'
+        )
+        parser.add_argument('--output', default=str(settings.GAZETTEER_PATH), help='Path of the index to write')
+
+    def handle(self, *args, **options):
+        sources = options['sources'] or [str(settings.BASE_DIR / 'api' / 'data' / 'gazetteer_seed.csv')]
+        entries = {}
+
+        for source in sources:
+            with open(source, newline='', encoding='utf-8') as f:
+                rows = csv.DictReader(line for line in f if not line.startswith('#'))
+                for row in rows:
+                    try:
+                        key, name = self.entry(row)
+                        latitude, longitude = float(row['latitude']), float(row['longitude'])
+                    except (KeyError, ValueError) as e:
+                        raise CommandError(f"{source}: invalid row {row}: {e}")
+                    entries[key] = f"{key}\t{name}\t{latitude:.6f}\t{longitude:.6f}\n"
+
+        # Sorted by UTF-8 bytes, the order the gazetteer binary-searches in
+        lines = sorted(entries.values(), key=lambda line: line.encode('utf-8'))
+        with open(options['output'], 'w', encoding='utf-8', newline='\n') as f:
+            f.writelines(lines)
+
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(lines)} gazetteer entries to {options['output']}"))
+
+    def entry(self, row):
+        kind, name, state, code = row['kind'], row['name'].strip(), row['state'].strip().upper(), row['code'].strip()
+        if kind == 'city':
+            return city_key(name, state), f"{name}, {state}"
+        if kind == 'zip':
+            return zip_key(code), f"{name}, {state} {code}"
+        if kind == 'exit':
+            return exit_key(name, state, code), f"{name} Exit {code}, {state}"
+        raise ValueError(f"unknown kind {kind!r}")
@@ -0,0 +1,82 @@
+import csv
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.roadgraph import largest_component, neighbour_edges, write_graph
+from api.spatial import haversine_miles
+
+
+class Command(BaseCommand):
+    help = 'Builds the memory-mapped road graph used by the offline routing backend'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nodes', help='CSV with columns name,latitude,longitude '
+                                            '(defaults to the cities in api/data/gazetteer_seed.csv)')
+        parser.add_argument('--edges', help='CSV with columns from,to and optional miles,mph naming nodes; '
+                                            'without it each node is joined to its nearest neighbours')
+        parser.add_argument('--neighbors', type=int, default=8, help='Neighbours joined per node (default 8)')
+        parser.add_argument('--max-edge-miles', type=float, default=400, help='Longest neighbour edge (default 400)')
+        parser.add_argument('--circuity', type=float, default=1.1,
+                            help='Road miles per straight-line mile for edges without miles (default 1.1)')
+        parser.add_argument('--speed', type=float, default=55, help='Speed for edges without mph (default 55)')
+        parser.add_argument('--landmarks', type=int, default=8, help='ALT landmarks to precompute (default 8)')
+        parser.add_argument('--output', default=str(settings.ROAD_GRAPH_PATH), help='Path of the graph to write')
+
+    def handle(self, *args, **options):
+        names, latitudes, longitudes = self.read_nodes(options['nodes'])
+        if options['edges']:
+            edges = self.read_edges(options['edges'], names, latitudes, longitudes, options)
+        else:
+            edges = neighbour_edges(latitudes, longitudes, options['neighbors'], options['max_edge_miles'],
+                                    options['circuity'], options['speed'])
+
+        # Routing needs one connected network; outlying nodes are dropped
+        keep = largest_component(len(names), edges)
+        if len(keep) < len(names):
+            dropped = sorted(set(range(len(names))) - set(keep))
+            self.stdout.write(self.style.WARNING(
+                f"Dropping {len(dropped)} unconnected nodes: {', '.join(names[node] for node in dropped[:10])}"
+            ))
+        renumber = {node: index for index, node in enumerate(keep)}
+        edges = [(renumber[a], renumber[b], miles, minutes) for a, b, miles, minutes in edges if a in renumber]
+
+        nodes, edge_count, landmarks = write_graph(
+            options['output'], [latitudes[node] for node in keep], [longitudes[node] for node in keep],
+            edges, options['landmarks'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {nodes} nodes, {edge_count} edges and {landmarks} landmarks to {options['output']}"
+        ))
+
+    def read_nodes(self, path):
+        names, latitudes, longitudes = [], [], []
+        source = path or str(settings.BASE_DIR / 'api' / 'data' / 'gazetteer_seed.csv')
+        with open(source, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(line for line in f if not line.startswith('#')):
+                if not path and row['kind'] != 'city':
+                    continue
+                try:
+                    name = row['name'] if path else f"{row['name']}, {row['state']}"
+                    latitude, longitude = float(row['latitude']), float(row['longitude'])
+                except (KeyError, ValueError) as e:
+                    raise CommandError(f"{source}: invalid row {row}: {e}")
+                names.append(name)
+                latitudes.append(latitude)
+                longitudes.append(longitude)
+        return names, latitudes, longitudes
+
+    def read_edges(self, path, names, latitudes, longitudes, options):
+        ids = {name: node for node, name in enumerate(names)}
+        edges = []
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(line for line in f if not line.startswith('#')):
+                try:
+                    a, b = ids[row['from']], ids[row['to']]
+                    straight = haversine_miles(latitudes[a], longitudes[a], latitudes[b], longitudes[b])
+                    miles = float(row.get('miles') or straight * options['circuity'])
+                    mph = float(row.get('mph') or options['speed'])
+                except (KeyError, ValueError) as e:
+                    raise CommandError(f"{path}: invalid row {row}: {e}")
+                edges.append((a, b, miles, miles / mph * 60))
+        return edges
@@ -1,6 +1,6 @@
 from django.core.management.base import BaseCommand
 from django.db import connection
-from api.models import Task, Location, Trip, RouteSegment, DailyLog, LogEntry
+from api.models import Task, Location, GeocodeCacheEntry, DirectionsCacheEntry, Trip, RouteSegment, DailyLog, LogEntry, Job
 
 class Command(BaseCommand):
     help = 'Clears all data from all tables while maintaining the database structure'
@@ -11,8 +11,11 @@ class Command(BaseCommand):
         DailyLog.objects.all().delete()
         RouteSegment.objects.all().delete()
         Trip.objects.all().delete()
+        GeocodeCacheEntry.objects.all().delete()
+        DirectionsCacheEntry.objects.all().delete()
         Location.objects.all().delete()
         Task.objects.all().delete()
+        Job.objects.all().delete()
 
         # Reset SQLite auto-increment counters
         with connection.cursor() as cursor:
@@ -23,5 +26,8 @@ class Command(BaseCommand):
             cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('api_routesegment', 0)")
             cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('api_dailylog', 0)")
             cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('api_logentry', 0)")
+            cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('api_geocodecacheentry', 0)")
+            cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('api_directionscacheentry', 0)")
+            cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('api_job', 0)")
 
         self.stdout.write(self.style.SUCCESS('Successfully cleared all tables')) 
\ No newline at end of file
@@ -0,0 +1,89 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+from django.utils import timezone
+
+from api.models import Location
+from api.spatial import GridIndex, haversine_miles
+
+
+class Command(BaseCommand):
+    help = ('Merges duplicate locations into the oldest matching row, re-pointing foreign keys '
+            'in small transactions so the database is never locked for long')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=200,
+                            help='Duplicates merged per transaction (default 200)')
+        parser.add_argument('--tolerance', type=float, default=settings.LOCATION_DEDUPE_TOLERANCE,
+                            help='Locations this close (miles) are duplicates whatever their address')
+        parser.add_argument('--address-radius', type=float, default=settings.LOCATION_DEDUPE_ADDRESS_RADIUS,
+                            help='Locations with the same normalized address this close (miles) are duplicates')
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help='Seconds to sleep between transactions to let other writers in')
+        parser.add_argument('--dry-run', action='store_true', help='Report duplicates without merging them')
+
+    def handle(self, *args, **options):
+        merges = self.find_duplicates(options['tolerance'], options['address_radius'])
+        self.stdout.write(f"Found {len(merges)} duplicate locations "
+                          f"across {len(set(merges.values()))} distinct locations")
+        if options['dry_run'] or not merges:
+            return
+
+        # Re-pointed rows get their auto_now fields set as a save would, so
+        # change tracking (RouteSegment.updated_at, read by ELD regeneration) sees them
+        references = [
+            (relation.related_model, relation.field.attname,
+             [field.attname for field in relation.related_model._meta.concrete_fields if getattr(field, 'auto_now', False)])
+            for relation in Location._meta.related_objects
+            if relation.one_to_many
+        ]
+        duplicates = sorted(merges)
+        chunk_size = options['chunk_size']
+        for i in range(0, len(duplicates), chunk_size):
+            chunk = duplicates[i:i + chunk_size]
+            with transaction.atomic():
+                now = timezone.now()
+                for model, attname, touched in references:
+                    target = models.Case(
+                        *[models.When(**{attname: duplicate}, then=models.Value(merges[duplicate])) for duplicate in chunk],
+                        output_field=models.BigIntegerField(),
+                    )
+                    model.objects.filter(**{f'{attname}__in': chunk}).update(
+                        **{attname: target}, **dict.fromkeys(touched, now)
+                    )
+                Location.objects.filter(id__in=chunk).delete()
+            self.stdout.write(f"Merged {min(i + chunk_size, len(duplicates))}/{len(duplicates)}")
+            if options['pause']:
+                time.sleep(options['pause'])
+
+        self.stdout.write(self.style.SUCCESS(f"Merged {len(duplicates)} duplicate locations"))
+
+    def find_duplicates(self, tolerance, address_radius):
+        """
+        Map each duplicate location id to the id of the oldest location it
+        matches. Only canonical rows are indexed, so merges never chain.
+        Roadside locations are left alone.
+        """
+        grid = GridIndex(settings.LOCATION_INDEX_CELL_SIZE)
+        by_address = {}
+        merges = {}
+
+        rows = Location.objects.filter(roadside=False).order_by('id').values_list('id', 'normalized_address', 'latitude', 'longitude')
+        for location_id, normalized, latitude, longitude in rows.iterator(chunk_size=5000):
+            canonical = None
+            for candidate_id, candidate_lat, candidate_lng in by_address.get(normalized, ()) if normalized else ():
+                if haversine_miles(latitude, longitude, candidate_lat, candidate_lng) <= address_radius:
+                    canonical = candidate_id
+                    break
+            if canonical is None:
+                nearest = grid.nearest(latitude, longitude, tolerance)
+                canonical = nearest[0][1] if nearest else None
+
+            if canonical is not None:
+                merges[location_id] = canonical
+            else:
+                grid.add(location_id, latitude, longitude)
+                by_address.setdefault(normalized, []).append((location_id, latitude, longitude))
+        return merges
@@ -0,0 +1,41 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from api.jobs import work, worker_name
+
+
+def start_worker():
+    # Worker processes set Django up themselves when not forked from a set-up
+    # parent, and never share the parent's database connections
+    django.setup()
+    connections.close_all()
+
+
+def run_worker(number, once, poll_interval):
+    return work(worker_name(number), once, poll_interval)
+
+
+class Command(BaseCommand):
+    help = 'Runs queued background jobs (ELD generation, batch planning) in a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=settings.JOB_WORKERS,
+                            help='Worker processes (default JOB_WORKERS); 1 runs jobs in this process')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+        parser.add_argument('--poll-interval', type=float, default=settings.JOB_POLL_INTERVAL,
+                            help='Seconds between checks of an empty queue (default JOB_POLL_INTERVAL)')
+
+    def handle(self, *args, **options):
+        processes, once, poll_interval = options['processes'], options['once'], options['poll_interval']
+        if processes <= 1:
+            count = work(worker_name(), once, poll_interval)
+        else:
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=processes, initializer=start_worker) as executor:
+                futures = [executor.submit(run_worker, number, once, poll_interval) for number in range(processes)]
+                count = sum(future.result() for future in futures)
+        self.stdout.write(self.style.SUCCESS(f"Ran {count} jobs"))
@@ -18,7 +18,7 @@ class Command(BaseCommand):
         
         for i in range(num):
             city = random.choice(cities)
-            location = Location.objects.create(
+            location, _ = Location.objects.resolve(
                 address=f"{random.randint(100, 9999)} Main St, {city}, USA",
                 latitude=random.uniform(25, 48),
                 longitude=random.uniform(-123, -75)
@@ -0,0 +1,245 @@
+"""
+Shared outbound HTTP client for every Google Maps call.
+
+One pooled ``requests.Session`` is reused across requests so calls skip the
+TCP+TLS handshake, every call has connect/read timeouts, transient failures
+(5xx, OVER_QUERY_LIMIT) are retried with jittered exponential backoff, and a
+circuit breaker makes callers fail over to their fallback path immediately
+while the provider is degraded. Identical concurrent calls are coalesced
+into a single upstream request.
+"""
+import contextvars
+import logging
+import random
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .caching import Counters
+from .singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Google API statuses that indicate a transient condition worth retrying
+RETRYABLE_STATUSES = ('OVER_QUERY_LIMIT', 'UNKNOWN_ERROR')
+
+# Upstream time spent on behalf of the current request (see UpstreamTimingMiddleware)
+_request_timer = contextvars.ContextVar('maps_request_timer', default=None)
+
+
+class MapsUnavailable(Exception):
+    """
+    The maps provider could not be reached, kept failing after retries,
+    or the circuit breaker is open.
+    """
+
+
+class RequestTimer:
+    def __init__(self):
+        self.calls = 0
+        self.elapsed_ms = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, elapsed_ms):
+        with self._lock:
+            self.calls += 1
+            self.elapsed_ms += elapsed_ms
+
+
+def start_request_timer():
+    timer = RequestTimer()
+    return timer, _request_timer.set(timer)
+
+
+def stop_request_timer(token):
+    _request_timer.reset(token)
+
+
+class CircuitBreaker:
+    """
+    Opens after ``failure_threshold`` consecutive failed calls and rejects
+    calls for ``reset_timeout`` seconds; then lets a single trial call through
+    (half-open) and closes again if it succeeds.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning("Maps circuit breaker opened after %s failures", self.failures)
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class MapsClient:
+    def __init__(self, base_url, api_key, connect_timeout, read_timeout, max_retries,
+                 retry_backoff, pool_size, breaker):
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.breaker = breaker
+        self.flights = SingleFlight()
+        self.counters = Counters('calls', 'errors', 'retries', 'rejected', 'request_ms', 'request_upstream_ms')
+        self._latency = {}
+        self._lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            base_url=settings.GOOGLE_MAPS_BASE_URL,
+            api_key=settings.GOOGLE_MAPS_API_KEY,
+            connect_timeout=settings.MAPS_CONNECT_TIMEOUT,
+            read_timeout=settings.MAPS_READ_TIMEOUT,
+            max_retries=settings.MAPS_MAX_RETRIES,
+            retry_backoff=settings.MAPS_RETRY_BACKOFF,
+            pool_size=settings.MAPS_POOL_SIZE,
+            breaker=CircuitBreaker(settings.MAPS_BREAKER_THRESHOLD, settings.MAPS_BREAKER_RESET),
+        )
+
+    def get_json(self, endpoint, params):
+        """
+        GET ``{base_url}/{endpoint}/json`` and return the decoded payload.
+        Concurrent identical calls share one upstream request, so the payload
+        must be treated as read-only. Raises MapsUnavailable when the call
+        cannot be completed.
+        """
+        return self.flights.do(self._flight_key(endpoint, params), lambda: self._fetch(endpoint, params))
+
+    @staticmethod
+    def _flight_key(endpoint, params):
+        return (endpoint, tuple(sorted((name, str(value)) for name, value in params.items())))
+
+    def _fetch(self, endpoint, params):
+        if not self.breaker.allow():
+            self.counters.incr('rejected')
+            raise MapsUnavailable("Maps provider circuit is open")
+
+        url = f"{self.base_url}/{endpoint}/json"
+        params = dict(params, key=self.api_key)
+        try:
+            data, error = self._attempt(endpoint, url, params)
+        except BaseException:
+            # Whatever went wrong is recorded, so a half-open breaker is never
+            # left waiting on a trial call that will not report back
+            self.counters.incr('errors')
+            self.breaker.record_failure()
+            raise
+        if data is not None:
+            self.breaker.record_success()
+            return data
+
+        self.counters.incr('errors')
+        self.breaker.record_failure()
+        raise MapsUnavailable(f"Maps {endpoint} request failed: {error}")
+
+    def _attempt(self, endpoint, url, params):
+        """
+        Make the call, retrying transient failures. Returns ``(payload,
+        None)``, or ``(None, error)`` once it has failed for good.
+        """
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.counters.incr('retries')
+                time.sleep(random.uniform(0, self.retry_backoff * 2 ** (attempt - 1)))
+
+            started = time.perf_counter()
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+                if response.status_code >= 500:
+                    error = f"HTTP {response.status_code}"
+                    continue
+                response.raise_for_status()
+                data = response.json()
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = str(e)
+                continue
+            except (requests.RequestException, ValueError) as e:
+                error = str(e)
+                break
+            finally:
+                self._record(endpoint, (time.perf_counter() - started) * 1000)
+
+            if data.get('status') in RETRYABLE_STATUSES:
+                error = data.get('status')
+                continue
+            return data, None
+        return None, error
+
+    def _record(self, endpoint, elapsed_ms):
+        self.counters.incr('calls')
+        with self._lock:
+            stats = self._latency.setdefault(endpoint, {'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            stats['calls'] += 1
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+        timer = _request_timer.get()
+        if timer is not None:
+            timer.add(elapsed_ms)
+
+    def record_request(self, total_ms, upstream_ms):
+        self.counters.incr('request_ms', total_ms)
+        self.counters.incr('request_upstream_ms', upstream_ms)
+
+    def stats(self):
+        values = self.counters.snapshot()
+        with self._lock:
+            endpoints = {
+                endpoint: {
+                    'calls': stats['calls'],
+                    'avg_ms': round(stats['total_ms'] / stats['calls'], 2),
+                    'max_ms': round(stats['max_ms'], 2),
+                }
+                for endpoint, stats in self._latency.items()
+            }
+        request_ms = values['request_ms']
+        return {
+            'calls': values['calls'],
+            'errors': values['errors'],
+            'retries': values['retries'],
+            'rejected': values['rejected'],
+            'coalesced': self.flights.stats()['shared'],
+            'circuit': self.breaker.state,
+            'endpoints': endpoints,
+            'upstream_share': round(values['request_upstream_ms'] / request_ms, 4) if request_ms else 0,
+        }
+
+
+maps_client = MapsClient.from_settings()
@@ -0,0 +1,31 @@
+import time
+
+from .maps_client import maps_client, start_request_timer, stop_request_timer
+
+
+class UpstreamTimingMiddleware:
+    """
+    Attribute the time spent in Google Maps calls to the request that made them.
+    Adds a ``Server-Timing`` header and feeds the upstream share of request time
+    reported by ``GET /api/maps/stats/``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer, token = start_request_timer()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            stop_request_timer(token)
+        total_ms = (time.perf_counter() - started) * 1000
+
+        if timer.calls:
+            maps_client.record_request(total_ms, timer.elapsed_ms)
+            response['Server-Timing'] = (
+                f'upstream;dur={timer.elapsed_ms:.1f};desc="{timer.calls} maps calls", '
+                f'total;dur={total_ms:.1f}'
+            )
+        return response
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_logentry_end_location_logentry_start_location'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodeCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('normalized_address', models.CharField(max_length=255)),
+                ('cached_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='geocode_cache_entries', to='api.location')),
+            ],
+        ),
+    ]
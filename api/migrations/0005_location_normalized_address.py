@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:40
+
+from django.db import migrations, models
+
+from api.addresses import normalize_address
+
+
+def backfill_normalized_address(apps, schema_editor):
+    Location = apps.get_model('api', 'Location')
+    batch = []
+    for location in Location.objects.only('id', 'address').iterator(chunk_size=2000):
+        location.normalized_address = normalize_address(location.address)[:255]
+        batch.append(location)
+        if len(batch) >= 2000:
+            Location.objects.bulk_update(batch, ['normalized_address'])
+            batch = []
+    if batch:
+        Location.objects.bulk_update(batch, ['normalized_address'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_geocodecacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='normalized_address',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(backfill_normalized_address, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:45
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_location_normalized_address'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DirectionsCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('distance', models.FloatField()),
+                ('duration', models.FloatField()),
+                ('geometry', models.TextField(blank=True, default='')),
+                ('cached_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_directionscacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='routesegment',
+            name='geometry',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='routesegment',
+            name='geometry_levels',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_routesegment_geometry'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='routesegment',
+            options={'ordering': ['start_time', 'id']},
+        ),
+        migrations.AddField(
+            model_name='routesegment',
+            name='details',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_routesegment_details'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailylog',
+            name='generated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='logentry',
+            name='segment',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='log_entries', to='api.routesegment'),
+        ),
+        migrations.AddField(
+            model_name='routesegment',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='routesegment',
+            index=models.Index(fields=['trip', 'updated_at'], name='api_routese_trip_id_32bb22_idx'),
+        ),
+    ]
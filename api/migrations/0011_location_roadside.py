@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='roadside',
+            field=models.BooleanField(default=False),
+        ),
+    ]
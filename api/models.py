@@ -1,7 +1,22 @@
-from django.db import models
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+import threading
+
+from django.db import IntegrityError, models, transaction
+from django.utils import timezone
+
+from .addresses import normalize_address
+from .spatial import bounding_box, haversine_miles
 
 # Create your models here.
 
+# Batches up to this size look up nearby locations with one query per point
+NEARBY_QUERY_LIMIT = 20
+
+# Serializes matching and inserting locations between threads of this process;
+# the ``locations`` Lock row does so between processes
+RESOLVE_LOCK = threading.Lock()
+
 class Task(models.Model):
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True)
@@ -12,16 +27,154 @@ class Task(models.Model):
     def __str__(self):
         return self.title
 
+class LocationManager(models.Manager):
+    def resolve(self, address, latitude, longitude):
+        """
+        Return ``(location, created)`` for an address/coordinate pair, reusing an
+        existing location when one matches instead of inserting a duplicate.
+        """
+        return self.resolve_many([(address, latitude, longitude)])[0]
+
+    def resolve_many(self, items):
+        """
+        Resolve ``(address, latitude, longitude)`` tuples to locations.
+
+        An existing location matches when its normalized address is the same
+        and it lies within LOCATION_DEDUPE_ADDRESS_RADIUS miles, or when it lies
+        within LOCATION_DEDUPE_TOLERANCE miles whatever its address. Roadside
+        locations never match. Unmatched items are inserted with one bulk
+        insert (items that match each other share a row). Returns
+        ``(location, created)`` pairs in input order.
+
+        Matching and inserting run in one transaction holding the
+        ``locations`` Lock, so concurrent calls for the same place cannot
+        both insert it.
+        """
+        with RESOLVE_LOCK, transaction.atomic():
+            Lock.acquire('locations')
+            return self._resolve_many(items)
+
+    def _resolve_many(self, items):
+        address_radius = settings.LOCATION_DEDUPE_ADDRESS_RADIUS
+        tolerance = settings.LOCATION_DEDUPE_TOLERANCE
+        items = [(address or '', float(latitude), float(longitude)) for address, latitude, longitude in items]
+        normalized = [normalize_address(address)[:255] for address, _, _ in items]
+
+        by_address = {}
+        names = sorted({name for name in normalized if name})
+        for i in range(0, len(names), 500):
+            for location in self.filter(normalized_address__in=names[i:i + 500], roadside=False):
+                by_address.setdefault(location.normalized_address, []).append(location)
+
+        def match(name, latitude, longitude, candidates):
+            for location in candidates.get(name, ()) if name else ():
+                if haversine_miles(latitude, longitude, location.latitude, location.longitude) <= address_radius:
+                    return location
+            return None
+
+        results = [None] * len(items)
+        unmatched = []
+        for index, ((address, latitude, longitude), name) in enumerate(zip(items, normalized)):
+            location = match(name, latitude, longitude, by_address)
+            if location is not None:
+                results[index] = (location, False)
+            else:
+                unmatched.append(index)
+
+        nearby = self._nearby_many([items[index][1:] for index in unmatched], tolerance)
+        pending = []
+        for index, location in zip(unmatched, nearby):
+            if location is not None:
+                results[index] = (location, False)
+            else:
+                pending.append(index)
+
+        # Items without a stored match may still match each other
+        new_locations, created_by_address, owners = [], {}, {}
+        for index in pending:
+            address, latitude, longitude = items[index]
+            name = normalized[index]
+            location = match(name, latitude, longitude, created_by_address) or next(
+                (candidate for candidate in new_locations
+                 if haversine_miles(latitude, longitude, candidate.latitude, candidate.longitude) <= tolerance),
+                None
+            )
+            if location is None:
+                location = self.model(address=address, normalized_address=name, latitude=latitude, longitude=longitude)
+                new_locations.append(location)
+                created_by_address.setdefault(name, []).append(location)
+            owners[index] = location
+
+        if new_locations:
+            self.bulk_create(new_locations)
+        created_ids = set()
+        for index in pending:
+            location = owners[index]
+            results[index] = (location, id(location) not in created_ids)
+            created_ids.add(id(location))
+        return results
+
+    def _nearby_many(self, points, tolerance):
+        """
+        The closest location within ``tolerance`` miles of each point, or None.
+        A few points use bounding-box queries on the (latitude, longitude)
+        index; larger batches use the in-memory spatial index and fetch the
+        candidate rows in one query.
+        """
+        if len(points) <= NEARBY_QUERY_LIMIT:
+            return [self._nearby(latitude, longitude, tolerance) for latitude, longitude in points]
+
+        from .spatial import location_index
+        candidate_ids = [
+            [location_id for _, location_id in location_index.nearest(latitude, longitude, tolerance, k=3)]
+            for latitude, longitude in points
+        ]
+        rows = self.filter(roadside=False).in_bulk({location_id for ids in candidate_ids for location_id in ids})
+        results = []
+        for (latitude, longitude), ids in zip(points, candidate_ids):
+            best = None
+            for location in (rows[location_id] for location_id in ids if location_id in rows):
+                distance = haversine_miles(latitude, longitude, location.latitude, location.longitude)
+                if distance <= tolerance and (best is None or distance < best[0]):
+                    best = (distance, location)
+            results.append(best[1] if best else None)
+        return results
+
+    def _nearby(self, latitude, longitude, tolerance):
+        min_lat, max_lat, min_lng, max_lng = bounding_box(latitude, longitude, tolerance)
+        candidates = self.filter(
+            latitude__range=(min_lat, max_lat),
+            longitude__range=(min_lng, max_lng),
+            roadside=False,
+        )
+        best = None
+        for location in candidates:
+            distance = haversine_miles(latitude, longitude, location.latitude, location.longitude)
+            if distance <= tolerance and (best is None or distance < best[0]):
+                best = (distance, location)
+        return best[1] if best else None
+
+
 class Location(models.Model):
     address = models.CharField(max_length=255, db_index=True)
+    normalized_address = models.CharField(max_length=255, db_index=True, blank=True, default='', editable=False)
     latitude = models.FloatField()
     longitude = models.FloatField()
+    # A point on a route where a stop was made away from any named place
+    # ("Roadside, route mile N"): never matched, indexed or suggested
+    roadside = models.BooleanField(default=False)
+    
+    objects = LocationManager()
     
     class Meta:
         indexes = [
             models.Index(fields=['latitude', 'longitude']),
         ]
     
+    def save(self, *args, **kwargs):
+        self.normalized_address = normalize_address(self.address)[:255]
+        super().save(*args, **kwargs)
+    
     def __str__(self):
         return self.address
 
@@ -63,10 +216,24 @@ class RouteSegment(models.Model):
     duration = models.IntegerField(default=0)  # in minutes
     start_time = models.DateTimeField(db_index=True)
     end_time = models.DateTimeField()
+    # Route driven, as an encoded polyline, and simplified to each zoom level
+    # ({"4": polyline, ...}); empty for segments spent at a stop
+    geometry = models.TextField(blank=True, default='')
+    geometry_levels = models.JSONField(blank=True, default=dict)
+    # Where and why the segment was placed; for fuel stops, the station chosen
+    # and the detour to reach it
+    details = models.JSONField(blank=True, default=dict)
+    # Touched by every save(); code that changes segments with update() must
+    # set it too, or incremental ELD regeneration will miss the change
+    updated_at = models.DateTimeField(auto_now=True)
+    # Deferred wherever segments are read for anything but drawing the route
+    GEOMETRY_FIELDS = ('geometry', 'geometry_levels')
     
     class Meta:
+        ordering = ['start_time', 'id']
         indexes = [
             models.Index(fields=['trip', 'segment_type']),
+            models.Index(fields=['trip', 'updated_at']),
             models.Index(fields=['start_time', 'end_time']),
         ]
     
@@ -83,6 +250,8 @@ class DailyLog(models.Model):
     start_odometer = models.IntegerField(default=0)
     end_odometer = models.IntegerField(default=0)
     total_miles = models.FloatField(default=0)
+    # When the log was last brought up to date with the trip's segments
+    generated_at = models.DateTimeField(null=True, blank=True)
     
     class Meta:
         indexes = [
@@ -108,6 +277,11 @@ class LogEntry(models.Model):
     start_location = models.ForeignKey(Location, on_delete=models.SET_NULL, null=True, blank=True, related_name='entries_as_start')
     end_location = models.ForeignKey(Location, on_delete=models.SET_NULL, null=True, blank=True, related_name='entries_as_end')
     remarks = models.CharField(max_length=255, blank=True)
+    # The route segment the entry was generated from; null for the default
+    # entry of a day without segments, and once the segment is deleted
+    segment = models.ForeignKey(
+        'RouteSegment', on_delete=models.SET_NULL, null=True, blank=True, related_name='log_entries'
+    )
     
     class Meta:
         indexes = [
@@ -117,3 +291,94 @@ class LogEntry(models.Model):
     
     def __str__(self):
         return f"{self.get_status_display()} from {self.start_time} to {self.end_time}"
+
+class GeocodeCacheEntry(models.Model):
+    """
+    Shared geocode cache tier: maps a normalized address to the Location it
+    resolved to, so repeat lookups survive restarts and skip the upstream API.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    normalized_address = models.CharField(max_length=255)
+    location = models.ForeignKey(Location, on_delete=models.CASCADE, related_name='geocode_cache_entries')
+    cached_at = models.DateTimeField(default=timezone.now, db_index=True)
+    
+    def __str__(self):
+        return f"{self.normalized_address} -> {self.location}"
+
+class DirectionsCacheEntry(models.Model):
+    """
+    Persistent directions cache tier: the distance, duration and geometry of a
+    lane, keyed on its origin and destination snapped to the cache grid.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    distance = models.FloatField()  # in miles
+    duration = models.FloatField()  # in minutes
+    geometry = models.TextField(blank=True, default='')  # encoded polyline
+    cached_at = models.DateTimeField(default=timezone.now, db_index=True)
+    
+    def __str__(self):
+        return f"{self.key}: {self.distance:.1f} mi"
+
+class Job(models.Model):
+    """
+    A unit of background work, run by the ``run_jobs`` worker command (see
+    api/jobs.py). Workers claim queued jobs with a conditional UPDATE, so no
+    broker is needed and each job runs once however many workers there are.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUSES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+    
+    kind = models.CharField(max_length=50)
+    params = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    result = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    error = models.TextField(blank=True)
+    # Worker that claimed the job, and how many times it has been claimed
+    worker = models.CharField(max_length=100, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind} job {self.id} ({self.status})"
+
+class Lock(models.Model):
+    """
+    A named lock held until the end of the transaction that acquires it.
+    Acquiring it updates its row, which blocks every other writer of the row
+    (of the whole database, on SQLite) until that transaction ends.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    acquired_at = models.DateTimeField(null=True, blank=True)
+    
+    @classmethod
+    def acquire(cls, name):
+        """
+        Take the lock ``name``; call inside ``transaction.atomic()``.
+        """
+        now = timezone.now()
+        if cls.objects.filter(name=name).update(acquired_at=now):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(name=name, acquired_at=now)
+        except IntegrityError:
+            # Created meanwhile by another transaction, now committed
+            cls.objects.filter(name=name).update(acquired_at=now)
+    
+    def __str__(self):
+        return self.name
@@ -0,0 +1,385 @@
+"""
+Trip planning: schedule routes in memory, then save them in bulk transactions.
+"""
+import hashlib
+import json
+import logging
+import math
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+
+from .autocomplete import autocomplete_index
+from .caching import TTLCache
+from .hos import BREAK, DRIVE, FUEL, PROPERTY_70_8, RESET, DutyState, schedule, schedule_many
+from .geometry import RouteLine, zoom_levels
+from .models import Location, RouteSegment, Trip
+from .polyline import encode
+from .routing import route_many_with_fallback
+from .stations import plan_fuel_stops, station_catalog
+
+logger = logging.getLogger(__name__)
+
+# ``stops`` are ``(address, latitude, longitude)`` tuples and ``stop_types``
+# their types; ``cycle_hours`` are the hours already used in the HOS cycle
+TripRequest = namedtuple('TripRequest', ['stops', 'stop_types', 'start_time', 'cycle_hours'])
+
+# A TripRequest with its routed ``legs`` (DirectionsResults), their RouteLine,
+# the HOS schedule and the Place of each of its segments
+ScheduledTrip = namedtuple('ScheduledTrip', ['route', 'legs', 'line', 'plan', 'places'])
+
+# Where a segment made away from the trip's stops happens, and the
+# RouteSegment details saying why; ``roadside`` when it is at no station
+Place = namedtuple('Place', ['address', 'latitude', 'longitude', 'details', 'roadside'], defaults=[False])
+
+# Smaller batches are scheduled in-process: a trip schedules in tens of
+# microseconds, so starting workers would cost more than it saves
+PROCESS_POOL_MIN_TRIPS = 500
+# Chunks handed to each worker process, to even out uneven trip lengths
+CHUNKS_PER_PROCESS = 4
+
+
+def leg_times(legs):
+    """
+    ``(miles, minutes)`` of each DirectionsResult, as the HOS scheduler takes them.
+    """
+    return [(leg.distance, leg.duration) for leg in legs]
+
+
+def fuel_times(fuel_stops):
+    """
+    ``(route mile, extra minutes)`` of each FuelStop, as the HOS scheduler takes them.
+    """
+    return [(stop.route_mile, stop.detour_minutes) for stop in fuel_stops]
+
+
+def station_details(station):
+    return station and {
+        'name': station.name, 'kind': station.kind,
+        'latitude': station.latitude, 'longitude': station.longitude,
+    }
+
+
+def fuel_details(stop):
+    """
+    RouteSegment details of a fuel segment made at a FuelStop.
+    """
+    return {
+        'route_mile': round(stop.route_mile, 1),
+        'station': station_details(stop.station),
+        'detour_miles': round(stop.detour_miles, 1),
+        'detour_minutes': round(stop.detour_minutes, 1),
+    }
+
+
+def roadside(route_mile, latitude, longitude):
+    """
+    Place for a stop made on the route away from any station.
+    """
+    return f"Roadside, route mile {round(route_mile)}", latitude, longitude
+
+
+def place_segments(line, plan, fuel_stops, radius=None, catalog=None):
+    """
+    The Place of each segment of a schedule along a RouteLine, or None for
+    ones recorded at the trip's own stops: drive segments and anything done
+    at a stop. Fuel stops are made at their station. Breaks and rests that
+    fall due on the road are made at the rest area or truck stop nearest to
+    the point where the limit is reached, if one is within ``radius``
+    miles; either way the stop is placed by one interpolation along the
+    route and one grid lookup. Stops with no station are placed on the
+    route itself.
+    """
+    radius = radius or settings.REST_SEARCH_RADIUS_MILES
+    catalog = catalog or station_catalog
+    fuel_stops = iter(fuel_stops)
+    places = []
+    for segment in plan:
+        place = None
+        if segment.kind == FUEL:
+            stop = next(fuel_stops)
+            station = stop.station
+            if station:
+                address = station.name, station.latitude, station.longitude
+            else:
+                address = roadside(stop.route_mile, *line.point_at(stop.route_mile))
+            place = Place(*address, fuel_details(stop), station is None)
+        elif segment.kind in (BREAK, RESET) and 0 < segment.mile < line.legs[segment.leg].distance:
+            route_mile = line.starts[segment.leg] + segment.mile
+            latitude, longitude = line.point_at(route_mile)
+            found = catalog.nearest(latitude, longitude, radius)
+            if found:
+                distance, station = found
+                address = station.name, station.latitude, station.longitude
+            else:
+                distance, station = 0.0, None
+                address = roadside(route_mile, latitude, longitude)
+            place = Place(*address, {
+                'route_mile': round(route_mile, 1),
+                'station': station_details(station),
+                'off_route_miles': round(distance, 1),
+            }, station is None)
+        places.append(place)
+    return places
+
+
+def route_line(route, legs):
+    """
+    RouteLine of a TripRequest routed as ``legs``.
+    """
+    return RouteLine(legs, [stop[1:] for stop in route.stops])
+
+
+def schedule_trip(route, legs):
+    """
+    Plan the fuel stops of a TripRequest routed as ``legs``, schedule it
+    under the HOS rules and place its stops. Returns a ScheduledTrip.
+    """
+    line = route_line(route, legs)
+    fuel_stops = plan_fuel_stops(line, PROPERTY_70_8.fuel_interval)
+    plan = schedule(
+        leg_times(legs), route.stop_types, DutyState(cycle=route.cycle_hours * 60),
+        fuel_stops=fuel_times(fuel_stops),
+    )
+    return ScheduledTrip(route, legs, line, plan, place_segments(line, plan, fuel_stops))
+
+
+def build_segments(trip, scheduled, locations, places, start_time, geometry=True):
+    """
+    Unsaved RouteSegments for a ScheduledTrip. ``places`` has the Location
+    of each segment's Place, or None; segments without one are recorded at
+    the stop they happen at, or at the start of the leg for ones made along
+    the way. Driving resumed after a stop with a Place starts from there.
+    With ``geometry``, each drive segment gets the stretch of its leg's
+    geometry it covers (a straight line if the router gave none) and its
+    simplified zoom levels.
+    """
+    segments = []
+    legs = scheduled.legs
+    previous = None
+    for segment, place, place_location in zip(scheduled.plan, scheduled.places, places):
+        origin = locations[segment.leg]
+        destination = locations[segment.leg + 1]
+        leg = legs[segment.leg]
+        if segment.kind != DRIVE:
+            origin = destination = destination if segment.mile >= leg.distance else origin
+        elif previous is not None:
+            origin = previous
+        if place_location:
+            origin = destination = place_location
+        previous = place_location
+        segment_start = start_time + timedelta(minutes=segment.start)
+        route_segment = RouteSegment(
+            trip=trip,
+            segment_type=segment.kind,
+            start_location=origin,
+            end_location=destination,
+            distance=segment.distance,
+            duration=round(segment.duration),
+            start_time=segment_start,
+            end_time=segment_start + timedelta(minutes=segment.duration),
+            details=place.details if place else {},
+        )
+        if geometry and segment.kind == DRIVE:
+            line = scheduled.line.line(segment.leg)
+            if leg.distance:
+                points = line.cut(segment.mile / leg.distance, (segment.mile + segment.distance) / leg.distance)
+            else:
+                points = line.points
+            route_segment.geometry = encode(points)
+            route_segment.geometry_levels = zoom_levels(points)
+        segments.append(route_segment)
+    return segments
+
+
+def build_trip(route, legs, plan, locations):
+    """
+    Unsaved Trip for a TripRequest scheduled as ``plan``, given the Location
+    of each stop.
+    """
+    return Trip(
+        current_location=locations[0],
+        pickup_location=next(
+            (location for location, stop_type in zip(locations, route.stop_types) if stop_type == 'pickup'),
+            locations[0]
+        ),
+        dropoff_location=locations[-1],
+        current_cycle_hours=route.cycle_hours,
+        total_distance=sum(leg.distance for leg in legs),
+        total_duration=round(sum(leg.duration for leg in legs)),
+        start_time=route.start_time,
+        end_time=route.start_time + timedelta(minutes=plan[-1].start + plan[-1].duration),
+    )
+
+
+def attach_segments(trip, segments):
+    """
+    Make ``trip.segments.all()`` return ``segments`` without a query, as if
+    they had been prefetched.
+    """
+    queryset = RouteSegment.objects.filter(trip=trip)
+    queryset._result_cache = list(segments)
+    queryset._prefetch_done = True
+    trip._prefetched_objects_cache = {'segments': queryset}
+
+
+def trip_places(scheduled):
+    """
+    ``(address, latitude, longitude)`` of a ScheduledTrip's stops, followed
+    by those of its segments' Places at stations.
+    """
+    return list(scheduled.route.stops) + [place[:3] for place in scheduled.places if place and not place.roadside]
+
+
+def roadside_locations(scheduled):
+    """
+    Unsaved Locations of a ScheduledTrip's roadside Places, in order. Each
+    is a new row: they are never matched against other locations.
+    """
+    return [
+        Location(address=place.address, latitude=place.latitude, longitude=place.longitude, roadside=True)
+        for place in scheduled.places if place and place.roadside
+    ]
+
+
+def split_locations(scheduled, locations, roadside):
+    """
+    Split the Locations of a ScheduledTrip's ``trip_places`` into the stop
+    Locations and one Location (or None) per segment, taking those of
+    roadside Places from ``roadside``.
+    """
+    stations = iter(locations[len(scheduled.route.stops):])
+    roadside = iter(roadside)
+    return (
+        locations[:len(scheduled.route.stops)],
+        [None if place is None else next(roadside if place.roadside else stations) for place in scheduled.places],
+    )
+
+
+def save_trips(items):
+    """
+    Save ScheduledTrips in one transaction: the stop and station locations
+    of every trip are resolved together, roadside locations are inserted as
+    new rows, then the trips and all their segments are written with one
+    bulk insert each. Returns the saved Trips with their segments attached,
+    so serializing them needs no further queries.
+    """
+    with transaction.atomic():
+        # Reuse known locations for the stops instead of inserting duplicates
+        stops = [trip_places(scheduled) for scheduled in items]
+        resolved = Location.objects.resolve_many([stop for trip_stops in stops for stop in trip_stops])
+        roadside = [roadside_locations(scheduled) for scheduled in items]
+        Location.objects.bulk_create([location for trip_roadside in roadside for location in trip_roadside])
+        trips, trip_segments, stop_ids = [], [], []
+        position = 0
+        for scheduled, trip_stops, trip_roadside in zip(items, stops, roadside):
+            route = scheduled.route
+            count = len(trip_stops)
+            locations, places = split_locations(
+                scheduled, [location for location, _ in resolved[position:position + count]], trip_roadside
+            )
+            position += count
+            stop_ids.extend(location.id for location in locations)
+            trip = build_trip(route, scheduled.legs, scheduled.plan, locations)
+            trips.append(trip)
+            trip_segments.append(build_segments(trip, scheduled, locations, places, route.start_time))
+        Trip.objects.bulk_create(trips)
+        RouteSegment.objects.bulk_create([segment for segments in trip_segments for segment in segments])
+
+    for trip, segments in zip(trips, trip_segments):
+        attach_segments(trip, segments)
+    # Rank the stops higher in address autocomplete
+    autocomplete_index.record_use(stop_ids)
+    return trips
+
+
+def plan_trip(route, legs):
+    """
+    Schedule a TripRequest's legs (DirectionsResults) under the HOS rules
+    and save the trip. The schedule is worked out before touching the
+    database; the stop locations, the trip and its segments are then written
+    in a single transaction.
+    """
+    return save_trips([schedule_trip(route, legs)])[0]
+
+
+def preview_trip(route, legs):
+    """
+    Schedule a TripRequest like ``plan_trip`` without touching the database.
+    Returns an unsaved Trip with unsaved stop Locations; its segments are in
+    ``preview_segments``.
+    """
+    scheduled = schedule_trip(route, legs)
+    locations, places = split_locations(scheduled, [
+        Location(address=address, latitude=latitude, longitude=longitude)
+        for address, latitude, longitude in trip_places(scheduled)
+    ], roadside_locations(scheduled))
+    trip = build_trip(route, legs, scheduled.plan, locations)
+    trip.preview_segments = build_segments(trip, scheduled, locations, places, route.start_time, geometry=False)
+    return trip
+
+
+def preview_key(route, backend):
+    """
+    Hash of everything a preview depends on: the request and the routing backend.
+    """
+    payload = json.dumps([
+        route.stops, route.stop_types, route.start_time.isoformat(), route.cycle_hours, backend,
+    ])
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+# Serialized previews by preview_key
+preview_cache = TTLCache(settings.ROUTE_PREVIEW_CACHE_MAX_ENTRIES, settings.ROUTE_PREVIEW_CACHE_TTL)
+
+
+def schedule_all(jobs, processes=None):
+    """
+    ``schedule`` for each ``(legs, stop_types, state, fuel_stops)`` job, spread over a
+    pool of worker processes when there are enough jobs to be worth it.
+    """
+    processes = processes or settings.PLANNING_PROCESSES
+    if processes <= 1 or len(jobs) < PROCESS_POOL_MIN_TRIPS:
+        return schedule_many(jobs)
+    size = math.ceil(len(jobs) / (processes * CHUNKS_PER_PROCESS))
+    chunks = [jobs[i:i + size] for i in range(0, len(jobs), size)]
+    with ProcessPoolExecutor(max_workers=min(processes, len(chunks))) as executor:
+        return [plan for plans in executor.map(schedule_many, chunks) for plan in plans]
+
+
+def plan_trips(routes, chunk_size=None, processes=None):
+    """
+    Plan and save many TripRequests. Returns one ``(trip, error)`` pair per
+    route, in order.
+
+    Every route is sent to the routing backend in one batch, so lanes shared
+    between trips are fetched once. The HOS schedules are worked out on a
+    process pool, then the trips are saved ``chunk_size`` at a time, one
+    transaction per chunk; a chunk that fails to save reports its error for
+    each of its trips and the other chunks are unaffected.
+    """
+    chunk_size = chunk_size or settings.PLANNING_DB_CHUNK_SIZE
+    legs = route_many_with_fallback([[stop[1:] for stop in route.stops] for route in routes])
+    lines = [route_line(route, trip_legs) for route, trip_legs in zip(routes, legs)]
+    fuel_stops = [plan_fuel_stops(line, PROPERTY_70_8.fuel_interval) for line in lines]
+    plans = schedule_all([
+        (leg_times(trip_legs), route.stop_types, DutyState(cycle=route.cycle_hours * 60), fuel_times(stops))
+        for route, trip_legs, stops in zip(routes, legs, fuel_stops)
+    ], processes)
+
+    items = [
+        ScheduledTrip(route, trip_legs, line, plan, place_segments(line, plan, stops))
+        for route, trip_legs, line, stops, plan in zip(routes, legs, lines, fuel_stops, plans)
+    ]
+    results = []
+    for i in range(0, len(items), chunk_size):
+        chunk = items[i:i + chunk_size]
+        try:
+            results.extend((trip, None) for trip in save_trips(chunk))
+        except Exception as e:
+            logger.warning("Failed to save %s planned trips: %s", len(chunk), e)
+            results.extend((None, f"Failed to save trip: {str(e)}") for _ in chunk)
+    return results
@@ -0,0 +1,48 @@
+"""
+Encoded polyline format (the one Google Maps uses for route geometry).
+"""
+
+
+def encode(points, precision=5):
+    """
+    Encode ``(lat, lng)`` pairs as a polyline string.
+    """
+    factor = 10 ** precision
+    chunks = []
+    previous_lat = previous_lng = 0
+    for latitude, longitude in points:
+        lat, lng = int(round(latitude * factor)), int(round(longitude * factor))
+        for delta in (lat - previous_lat, lng - previous_lng):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            chunks.append(chr(value + 63))
+        previous_lat, previous_lng = lat, lng
+    return ''.join(chunks)
+
+
+def decode(text, precision=5):
+    """
+    Decode a polyline string into a list of ``(lat, lng)`` pairs.
+    """
+    factor = 10 ** precision
+    points = []
+    index = lat = lng = 0
+    length = len(text)
+    while index < length:
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                byte = ord(text[index]) - 63
+                index += 1
+                result |= (byte & 0x1f) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lng += deltas[1]
+        points.append((lat / factor, lng / factor))
+    return points
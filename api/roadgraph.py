@@ -0,0 +1,298 @@
+"""
+Offline road-graph router.
+
+The graph is an undirected road network stored in a compact binary file
+(see ``write_graph`` and the ``build_road_graph`` management command) and
+memory-mapped on first use, so loading it costs a header read however large
+it is. Adjacency is in CSR form: the edges leaving node ``v`` are
+``targets[offsets[v]:offsets[v + 1]]`` with their lengths in ``distances``
+(miles) and travel times in ``durations`` (minutes).
+
+Shortest paths are found with A* on travel time using ALT (A*, landmarks,
+triangle inequality) lower bounds. For a handful of landmark nodes the
+file stores the travel time from the landmark to every node; for any node
+``v`` and target ``t``, ``|d(L, t) - d(L, v)|`` can never exceed the true
+time from ``v`` to ``t``, and the best bound over all landmarks steers the
+search towards the target far more tightly than straight-line distance.
+"""
+import heapq
+import math
+import mmap
+import struct
+import sys
+import threading
+
+from django.conf import settings
+
+from .directions import DirectionsResult
+from .polyline import encode
+from .spatial import GridIndex
+
+MAGIC = b'RGRAPH01'
+# magic, node count, edge count (directed), landmark count
+HEADER = struct.Struct('<8sIII')
+
+# Off-network access legs to and from the nearest node
+ACCESS_CIRCUITY = 1.3
+ACCESS_SPEED_MPH = 30
+# Points further than this from every node are not routable
+MAX_SNAP_MILES = 250
+
+
+class RoutingError(Exception):
+    pass
+
+
+def _sections(node_count, edge_count, landmark_count):
+    """
+    ``(name, typecode, length)`` of each array in file order.
+    """
+    return [
+        ('latitudes', 'd', node_count),
+        ('longitudes', 'd', node_count),
+        ('offsets', 'I', node_count + 1),
+        ('targets', 'I', edge_count),
+        ('distances', 'f', edge_count),
+        ('durations', 'f', edge_count),
+        ('landmarks', 'I', landmark_count),
+        ('landmark_durations', 'f', landmark_count * node_count),
+    ]
+
+
+def _aligned(size):
+    return (size + 7) // 8 * 8
+
+
+def shortest_durations(offsets, targets, durations, source):
+    """
+    Travel time in minutes from ``source`` to every node (Dijkstra);
+    unreachable nodes are ``math.inf``.
+    """
+    best = [math.inf] * (len(offsets) - 1)
+    best[source] = 0.0
+    heap = [(0.0, source)]
+    while heap:
+        cost, node = heapq.heappop(heap)
+        if cost > best[node]:
+            continue
+        for edge in range(offsets[node], offsets[node + 1]):
+            candidate = cost + durations[edge]
+            target = targets[edge]
+            if candidate < best[target]:
+                best[target] = candidate
+                heapq.heappush(heap, (candidate, target))
+    return best
+
+
+def write_graph(path, latitudes, longitudes, edges, landmark_count=8):
+    """
+    Write a graph file from node coordinates and undirected
+    ``(a, b, miles, minutes)`` edges. Landmarks are chosen farthest-first:
+    each new landmark is the node furthest in travel time from those already
+    chosen, which spreads them around the edge of the network where their
+    bounds are tightest. Every node must be reachable from every other.
+    """
+    node_count = len(latitudes)
+    adjacency = [[] for _ in range(node_count)]
+    for a, b, miles, minutes in edges:
+        adjacency[a].append((b, miles, minutes))
+        adjacency[b].append((a, miles, minutes))
+
+    offsets, targets, distances, durations = [0], [], [], []
+    for neighbours in adjacency:
+        for target, miles, minutes in sorted(neighbours):
+            targets.append(target)
+            distances.append(miles)
+            durations.append(minutes)
+        offsets.append(len(targets))
+
+    landmarks, landmark_durations = [], []
+    nearest = [math.inf] * node_count
+    candidate = 0
+    for _ in range(min(landmark_count, node_count)):
+        times = shortest_durations(offsets, targets, durations, candidate)
+        if math.inf in times:
+            raise ValueError("road graph is not connected")
+        landmarks.append(candidate)
+        landmark_durations.extend(times)
+        nearest = [min(a, b) for a, b in zip(nearest, times)]
+        candidate = max(range(node_count), key=nearest.__getitem__)
+
+    values = {
+        'latitudes': latitudes, 'longitudes': longitudes, 'offsets': offsets, 'targets': targets,
+        'distances': distances, 'durations': durations, 'landmarks': landmarks,
+        'landmark_durations': landmark_durations,
+    }
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, node_count, len(targets), len(landmarks)).ljust(_aligned(HEADER.size), b'\0'))
+        for name, typecode, length in _sections(node_count, len(targets), len(landmarks)):
+            data = struct.pack(f'<{length}{typecode}', *values[name])
+            f.write(data.ljust(_aligned(len(data)), b'\0'))
+    return node_count, len(targets) // 2, len(landmarks)
+
+
+class RoadGraph:
+    def __init__(self, path):
+        self.path = path
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            if sys.byteorder != 'little':
+                raise RoutingError("road graph files are little-endian")
+            with open(self.path, 'rb') as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, node_count, edge_count, landmark_count = HEADER.unpack_from(self._mm)
+            if magic != MAGIC:
+                raise RoutingError(f"{self.path} is not a road graph file")
+
+            view = memoryview(self._mm)
+            position = _aligned(HEADER.size)
+            for name, typecode, length in _sections(node_count, edge_count, landmark_count):
+                size = length * struct.calcsize(typecode)
+                setattr(self, name, view[position:position + size].cast(typecode))
+                position += _aligned(size)
+            self.node_count = node_count
+            self.landmark_count = landmark_count
+
+            # A few thousand nodes at most need snapping; index them in memory
+            self._nodes = GridIndex(cell_size=1.0)
+            for node in range(node_count):
+                self._nodes.add(node, self.latitudes[node], self.longitudes[node])
+            self._loaded = True
+
+    def nearest_node(self, latitude, longitude):
+        """
+        ``(miles, node)`` of the node closest to a point, or None.
+        """
+        self._load()
+        matches = self._nodes.nearest(latitude, longitude, MAX_SNAP_MILES)
+        return matches[0] if matches else None
+
+    def _lower_bounds(self, target):
+        node_count = self.node_count
+        landmark_durations = self.landmark_durations
+        return [
+            (landmark_durations[i * node_count + target], i * node_count)
+            for i in range(self.landmark_count)
+        ]
+
+    def shortest_path(self, source, target):
+        """
+        ``(nodes, minutes)`` of the fastest path between two nodes, or None
+        if there is none.
+        """
+        self._load()
+        offsets, targets, durations = self.offsets, self.targets, self.durations
+        landmark_durations = self.landmark_durations
+        bounds = self._lower_bounds(target)
+
+        def heuristic(node):
+            return max((abs(to_target - landmark_durations[base + node]) for to_target, base in bounds), default=0.0)
+
+        best = {source: 0.0}
+        previous = {}
+        heap = [(heuristic(source), 0.0, source)]
+        while heap:
+            _, cost, node = heapq.heappop(heap)
+            if node == target:
+                path = [node]
+                while node in previous:
+                    node = previous[node]
+                    path.append(node)
+                return path[::-1], cost
+            if cost > best[node]:
+                continue
+            for edge in range(offsets[node], offsets[node + 1]):
+                neighbour = targets[edge]
+                candidate = cost + durations[edge]
+                if candidate < best.get(neighbour, math.inf):
+                    best[neighbour] = candidate
+                    previous[neighbour] = node
+                    heapq.heappush(heap, (candidate + heuristic(neighbour), candidate, neighbour))
+        return None
+
+    def route(self, origin, destination):
+        """
+        DirectionsResult for the fastest route between two ``(lat, lng)``
+        points: each end is joined to its nearest node by a short access leg.
+        Raises RoutingError if either end is off the network.
+        """
+        ends = []
+        for point in (origin, destination):
+            snapped = self.nearest_node(*point)
+            if snapped is None:
+                raise RoutingError(f"{point} is more than {MAX_SNAP_MILES} miles from the road graph")
+            ends.append(snapped)
+        (origin_miles, source), (destination_miles, target) = ends
+
+        found = self.shortest_path(source, target)
+        if found is None:
+            raise RoutingError(f"No road route between {origin} and {destination}")
+        nodes, minutes = found
+
+        offsets, targets, distances = self.offsets, self.targets, self.distances
+        miles = 0.0
+        for a, b in zip(nodes, nodes[1:]):
+            for edge in range(offsets[a], offsets[a + 1]):
+                if targets[edge] == b:
+                    miles += distances[edge]
+                    break
+
+        access_miles = (origin_miles + destination_miles) * ACCESS_CIRCUITY
+        points = [tuple(origin)] + [(self.latitudes[node], self.longitudes[node]) for node in nodes] + [tuple(destination)]
+        return DirectionsResult(
+            distance=miles + access_miles,
+            duration=minutes + access_miles / ACCESS_SPEED_MPH * 60,
+            geometry=encode(points),
+        )
+
+    def route_legs(self, points):
+        return [self.route(origin, destination) for origin, destination in zip(points, points[1:])]
+
+
+def neighbour_edges(latitudes, longitudes, neighbours=8, max_miles=400, circuity=1.1, speed_mph=55):
+    """
+    Approximate a road network by joining every node to its ``neighbours``
+    nearest nodes within ``max_miles``. Edge length is the straight-line
+    distance times ``circuity``; travel time assumes ``speed_mph``.
+    """
+    index = GridIndex(cell_size=1.0)
+    for node, (latitude, longitude) in enumerate(zip(latitudes, longitudes)):
+        index.add(node, latitude, longitude)
+
+    edges = {}
+    for node, (latitude, longitude) in enumerate(zip(latitudes, longitudes)):
+        for straight, other in index.nearest(latitude, longitude, max_miles, k=neighbours + 1):
+            if other != node:
+                miles = straight * circuity
+                edges[min(node, other), max(node, other)] = (miles, miles / speed_mph * 60)
+    return [(a, b, miles, minutes) for (a, b), (miles, minutes) in sorted(edges.items())]
+
+
+def largest_component(node_count, edges):
+    """
+    Node ids of the largest connected component.
+    """
+    parent = list(range(node_count))
+
+    def find(node):
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    for a, b, _, _ in edges:
+        parent[find(a)] = find(b)
+    components = {}
+    for node in range(node_count):
+        components.setdefault(find(node), []).append(node)
+    return max(components.values(), key=len)
+
+
+road_graph = RoadGraph(settings.ROAD_GRAPH_PATH)
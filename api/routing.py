@@ -0,0 +1,112 @@
+"""
+Routing backends for the route calculator.
+
+Every backend has a ``route_legs(points)`` method returning one
+DirectionsResult per leg of the route through ``points`` (``(lat, lng)``
+pairs), and a ``route_many(routes)`` method doing the same for several
+routes at once. Both raise on failure so the caller can fall back to the
+estimator (see ``route_with_fallback``).
+"""
+import logging
+
+from django.conf import settings
+
+from .directions import get_route_legs, get_route_legs_many
+from .estimate import estimate_legs, estimate_routes
+from .roadgraph import road_graph
+
+logger = logging.getLogger(__name__)
+
+
+class GoogleRouter:
+    name = 'google'
+
+    def route_legs(self, points):
+        return get_route_legs(points)
+
+    def route_many(self, routes):
+        return get_route_legs_many(routes)
+
+
+class GraphRouter:
+    """
+    Zero-network router over the bundled road graph.
+    """
+    name = 'graph'
+
+    def __init__(self, graph=None):
+        self.graph = graph or road_graph
+
+    def route_legs(self, points):
+        return self.graph.route_legs(points)
+
+    def route_many(self, routes):
+        # Lanes shared between routes are searched once
+        lanes = {}
+        for points in routes:
+            for origin, destination in zip(points, points[1:]):
+                lane = (tuple(origin), tuple(destination))
+                if lane not in lanes:
+                    lanes[lane] = self.graph.route(*lane)
+        return [
+            [lanes[tuple(origin), tuple(destination)] for origin, destination in zip(points, points[1:])]
+            for points in routes
+        ]
+
+
+class EstimateRouter:
+    """
+    Deterministic straight-line estimates; the mock data backend.
+    """
+    name = 'estimate'
+
+    def route_legs(self, points):
+        return estimate_legs(points)
+
+    def route_many(self, routes):
+        return estimate_routes(routes)
+
+
+ROUTERS = {router.name: router for router in (GoogleRouter(), GraphRouter(), EstimateRouter())}
+ROUTERS['mock'] = ROUTERS['estimate']
+
+
+def get_router(name=None):
+    """
+    The named routing backend, by default ROUTING_BACKEND; when that is unset,
+    Google Maps if an API key is configured and mock data is off, otherwise
+    the estimator.
+    """
+    name = name or settings.ROUTING_BACKEND
+    if not name:
+        name = 'google' if not settings.USE_MOCK_DATA and settings.GOOGLE_MAPS_API_KEY else 'estimate'
+    try:
+        return ROUTERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown routing backend {name!r}; expected one of {', '.join(ROUTERS)}")
+
+
+def route_with_fallback(points, router=None):
+    """
+    The legs of a route from ``router`` (by default the configured backend),
+    or from the estimator if it fails.
+    """
+    router = router or get_router()
+    try:
+        return router.route_legs(points)
+    except Exception as e:
+        logger.warning("Error using %s routing: %s", router.name, e)
+        return ROUTERS['estimate'].route_legs(points)
+
+
+def route_many_with_fallback(routes, router=None):
+    """
+    The legs of each route, fetched together. If the batch fails, routes are
+    retried one at a time so only the ones that fail again are estimated.
+    """
+    router = router or get_router()
+    try:
+        return router.route_many(routes)
+    except Exception as e:
+        logger.warning("Error using %s routing for %s routes: %s", router.name, len(routes), e)
+    return [route_with_fallback(points, router) for points in routes]
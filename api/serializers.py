@@ -1,5 +1,8 @@
+from django.conf import settings
+
 from rest_framework import serializers
-from .models import Task, Location, Trip, RouteSegment, DailyLog, LogEntry
+from .autocomplete import MAX_RESULTS as AUTOCOMPLETE_MAX_RESULTS
+from .models import Task, Location, Trip, RouteSegment, DailyLog, LogEntry, Job
 
 
 class TaskSerializer(serializers.ModelSerializer):
@@ -20,7 +23,7 @@ class RouteSegmentSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = RouteSegment
-        fields = ['id', 'segment_type', 'distance', 'duration', 'start_time', 'end_time', 'start_location', 'end_location']
+        fields = ['id', 'segment_type', 'distance', 'duration', 'start_time', 'end_time', 'start_location', 'end_location', 'details']
 
 
 # Simplified serializer for location data in list views
@@ -69,9 +72,10 @@ class TripSerializer(serializers.ModelSerializer):
         pickup_location_data = validated_data.pop('pickup_location')
         dropoff_location_data = validated_data.pop('dropoff_location')
         
-        current_location = Location.objects.create(**current_location_data)
-        pickup_location = Location.objects.create(**pickup_location_data)
-        dropoff_location = Location.objects.create(**dropoff_location_data)
+        (current_location, _), (pickup_location, _), (dropoff_location, _) = Location.objects.resolve_many([
+            (data['address'], data['latitude'], data['longitude'])
+            for data in (current_location_data, pickup_location_data, dropoff_location_data)
+        ])
         
         trip = Trip.objects.create(
             current_location=current_location,
@@ -83,6 +87,13 @@ class TripSerializer(serializers.ModelSerializer):
         return trip
 
 
+class TripPreviewSerializer(TripSerializer):
+    """
+    TripSerializer for an unsaved trip, whose segments are in ``preview_segments``.
+    """
+    segments = RouteSegmentSerializer(many=True, read_only=True, source='preview_segments')
+
+
 class LogEntrySerializer(serializers.ModelSerializer):
     start_location = LocationSerializer()
     end_location = LocationSerializer()
@@ -108,5 +119,70 @@ class TripPlanRequestSerializer(serializers.Serializer):
     current_cycle_hours = serializers.FloatField(min_value=0, max_value=70)
 
 
+class RouteStopSerializer(serializers.Serializer):
+    # pickup and dropoff stops add loading/unloading time; plain stops add none
+    STOP_TYPES = ['pickup', 'dropoff', 'stop']
+    
+    address = serializers.CharField(required=False, allow_blank=True, default='')
+    latitude = serializers.FloatField(min_value=-90, max_value=90)
+    longitude = serializers.FloatField(min_value=-180, max_value=180)
+    type = serializers.ChoiceField(choices=STOP_TYPES, required=False)
+
+
+class RouteRequestSerializer(serializers.Serializer):
+    stops = RouteStopSerializer(many=True, min_length=2, max_length=settings.ROUTE_MAX_STOPS)
+
+
+class RouteBatchRequestSerializer(serializers.Serializer):
+    # Trips are validated one by one so one bad entry doesn't fail the batch
+    trips = serializers.ListField(
+        child=serializers.DictField(), allow_empty=False, max_length=settings.ROUTE_BATCH_MAX_TRIPS
+    )
+
+
+class TripGeometryQuerySerializer(serializers.Serializer):
+    zoom = serializers.IntegerField(min_value=0, max_value=22, required=False)
+    decode = serializers.BooleanField(default=False)
+
+
 class EldLogsRequestSerializer(serializers.Serializer):
-    trip_id = serializers.IntegerField() 
\ No newline at end of file
+    trip_id = serializers.IntegerField()
+    # Rebuild every day instead of only those touched by changed segments
+    full = serializers.BooleanField(default=False)
+
+
+class LogExportQuerySerializer(serializers.Serializer):
+    trip_id = serializers.IntegerField(required=False)
+    start_date = serializers.DateField(required=False)
+    end_date = serializers.DateField(required=False)
+
+    def validate(self, data):
+        if 'trip_id' not in data and 'start_date' not in data:
+            raise serializers.ValidationError("A trip_id or a start_date is required.")
+        if 'start_date' in data and 'end_date' in data and data['end_date'] < data['start_date']:
+            raise serializers.ValidationError("end_date must not be before start_date.")
+        return data
+
+
+class JobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = ['id', 'kind', 'status', 'error', 'attempts', 'created_at', 'started_at', 'finished_at']
+
+
+class GeocodeBatchRequestSerializer(serializers.Serializer):
+    # Items are validated per address so one bad entry doesn't fail the batch
+    addresses = serializers.ListField(allow_empty=False, max_length=settings.GEOCODE_BATCH_MAX_ADDRESSES)
+
+
+class NearbyLocationsQuerySerializer(serializers.Serializer):
+    lat = serializers.FloatField(min_value=-90, max_value=90)
+    lng = serializers.FloatField(min_value=-180, max_value=180)
+    radius = serializers.FloatField(min_value=0, max_value=100, default=5)  # in miles
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20)
+
+
+class AutocompleteQuerySerializer(serializers.Serializer):
+    # Trailing whitespace marks the last word as finished
+    q = serializers.CharField(max_length=255, trim_whitespace=False)
+    limit = serializers.IntegerField(min_value=1, max_value=AUTOCOMPLETE_MAX_RESULTS, default=10)
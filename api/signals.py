@@ -0,0 +1,60 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .autocomplete import autocomplete_index
+from .models import Location, Trip
+from .spatial import location_index
+
+
+@receiver(post_delete, sender=Location)
+def forget_deleted_location(sender, instance, **kwargs):
+    """
+    Drop a deleted location from the in-process geocode cache tier, the
+    spatial index and the autocomplete index.
+    """
+    from .geocoding import geocode_cache
+    geocode_cache.discard_location(instance.id)
+    location_index.removed(instance)
+    autocomplete_index.removed(instance)
+
+
+@receiver(pre_save, sender=Location)
+def remember_indexed_position(sender, instance, **kwargs):
+    """
+    Record where an existing location sits in the spatial index before it is updated.
+    """
+    if instance.pk and location_index.loaded:
+        instance._indexed_position = (Location.objects
+                                      .filter(pk=instance.pk)
+                                      .values_list('latitude', 'longitude')
+                                      .first())
+
+
+@receiver(post_save, sender=Location)
+def index_saved_location(sender, instance, created, **kwargs):
+    """
+    Keep the spatial and autocomplete indexes in step with locations saved
+    in this process. Roadside locations are never indexed.
+    """
+    if instance.roadside:
+        return
+    position = getattr(instance, '_indexed_position', None)
+    if created or position is None:
+        location_index.added(instance)
+    elif position != (instance.latitude, instance.longitude):
+        location_index.moved(instance, *position)
+    if created:
+        autocomplete_index.added(instance)
+    else:
+        autocomplete_index.updated(instance)
+
+
+@receiver(post_save, sender=Trip)
+def count_trip_stops(sender, instance, created, **kwargs):
+    """
+    Rank a new trip's stops higher in address autocomplete.
+    """
+    if created:
+        autocomplete_index.record_use([
+            instance.current_location_id, instance.pickup_location_id, instance.dropoff_location_id,
+        ])
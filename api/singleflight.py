@@ -0,0 +1,60 @@
+"""
+Single-flight coalescing of identical in-flight calls.
+
+While a call for a key is running, every other caller asking for the same
+key waits for that call and receives its result (or exception) instead of
+starting its own. Callers are threads: WSGI workers, thread pools, and the
+threads Django runs sync views in under ASGI.
+"""
+import threading
+from concurrent.futures import Future
+
+from .caching import Counters
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.counters = Counters('leaders', 'shared')
+
+    def _join(self, key):
+        """
+        Return ``(future, leader)`` for ``key``; the leader must run the call.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.counters.incr('shared')
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            self.counters.incr('leaders')
+            return future, True
+
+    def _finish(self, key):
+        with self._lock:
+            self._calls.pop(key, None)
+
+    def do(self, key, fn):
+        """
+        Call ``fn()`` unless an identical call is already in flight, in which
+        case wait for it and return its result. Results are shared between
+        callers and must be treated as read-only.
+        """
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._finish(key)
+
+    def stats(self):
+        return self.counters.snapshot()
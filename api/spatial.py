@@ -0,0 +1,232 @@
+"""
+In-memory spatial index for point lookups ("what is within 5 miles of here").
+
+Points are bucketed into a uniform latitude/longitude grid. A radius query
+only visits the cells overlapping the circle's bounding box, drops points
+outside the box with cheap comparisons, and refines the survivors with a
+batched haversine pass. Each cell keeps its ids and coordinates in compact
+``array`` columns, so a million points cost tens of megabytes.
+"""
+import math
+import threading
+import time
+from array import array
+
+from django.conf import settings
+
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEGREE_LAT = 69.05
+
+
+def haversine_miles(lat1, lng1, lat2, lng2):
+    """
+    Great-circle distance in miles between two points.
+    """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(min(1.0, math.sqrt(a)))
+
+
+def haversine_many(lat, lng, lats, lngs):
+    """
+    Distances in miles from one point to each of the points in ``lats``/``lngs``.
+    The origin's terms are computed once and the loop body is kept to the
+    per-point arithmetic.
+    """
+    sin, cos, asin, sqrt, rad = math.sin, math.cos, math.asin, math.sqrt, math.radians
+    phi1 = rad(lat)
+    cos_phi1 = cos(phi1)
+    lmb1 = rad(lng)
+    diameter = 2 * EARTH_RADIUS_MILES
+    distances = []
+    append = distances.append
+    for lat2, lng2 in zip(lats, lngs):
+        phi2 = rad(lat2)
+        a = sin((phi2 - phi1) / 2) ** 2 + cos_phi1 * cos(phi2) * sin((rad(lng2) - lmb1) / 2) ** 2
+        append(diameter * asin(sqrt(a) if a < 1 else 1.0))
+    return distances
+
+
+def bounding_box(lat, lng, radius_miles):
+    """
+    ``(min_lat, max_lat, min_lng, max_lng)`` enclosing a circle of ``radius_miles``.
+    """
+    dlat = radius_miles / MILES_PER_DEGREE_LAT
+    cos_lat = math.cos(math.radians(lat))
+    dlng = 180.0 if cos_lat < 1e-6 else min(180.0, dlat / cos_lat)
+    return lat - dlat, lat + dlat, lng - dlng, lng + dlng
+
+
+class GridIndex:
+    def __init__(self, cell_size=0.1):
+        self.cell_size = cell_size
+        self._cells = {}
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def _cell(self, lat, lng):
+        return int(math.floor(lat / self.cell_size)), int(math.floor(lng / self.cell_size))
+
+    def add(self, point_id, lat, lng):
+        key = self._cell(lat, lng)
+        with self._lock:
+            cell = self._cells.get(key)
+            if cell is None:
+                cell = self._cells[key] = (array('q'), array('d'), array('d'))
+            ids, lats, lngs = cell
+            ids.append(point_id)
+            lats.append(lat)
+            lngs.append(lng)
+            self._size += 1
+
+    def remove(self, point_id, lat, lng):
+        """
+        Remove a point; ``lat``/``lng`` must be the coordinates it was added with.
+        """
+        key = self._cell(lat, lng)
+        with self._lock:
+            cell = self._cells.get(key)
+            if cell is None:
+                return False
+            ids, lats, lngs = cell
+            try:
+                position = ids.index(point_id)
+            except ValueError:
+                return False
+            # Swap with the last point so the arrays stay dense
+            last = len(ids) - 1
+            ids[position], lats[position], lngs[position] = ids[last], lats[last], lngs[last]
+            del ids[last], lats[last], lngs[last]
+            if not ids:
+                del self._cells[key]
+            self._size -= 1
+            return True
+
+    def within(self, lat, lng, radius_miles, limit=None):
+        """
+        ``(distance, id)`` pairs for points within ``radius_miles``, nearest first.
+        """
+        min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius_miles)
+        min_i, min_j = self._cell(min_lat, min_lng)
+        max_i, max_j = self._cell(max_lat, max_lng)
+
+        candidate_ids, candidate_lats, candidate_lngs = [], [], []
+        cells = self._cells
+        for i in range(min_i, max_i + 1):
+            for j in range(min_j, max_j + 1):
+                cell = cells.get((i, j))
+                if cell is None:
+                    continue
+                ids, lats, lngs = cell
+                for point_id, point_lat, point_lng in zip(ids, lats, lngs):
+                    if min_lat <= point_lat <= max_lat and min_lng <= point_lng <= max_lng:
+                        candidate_ids.append(point_id)
+                        candidate_lats.append(point_lat)
+                        candidate_lngs.append(point_lng)
+
+        distances = haversine_many(lat, lng, candidate_lats, candidate_lngs)
+        matches = sorted(
+            (distance, point_id)
+            for distance, point_id in zip(distances, candidate_ids)
+            if distance <= radius_miles
+        )
+        return matches[:limit] if limit else matches
+
+    def nearest(self, lat, lng, max_radius_miles, k=1):
+        """
+        Up to ``k`` nearest points within ``max_radius_miles``, searching
+        outward in growing rings so close matches never scan far cells.
+        """
+        radius = min(max_radius_miles, self.cell_size * MILES_PER_DEGREE_LAT)
+        while True:
+            matches = self.within(lat, lng, radius, limit=k)
+            if len(matches) >= k or radius >= max_radius_miles:
+                return matches
+            radius = min(max_radius_miles, radius * 2)
+
+    def clear(self):
+        with self._lock:
+            self._cells = {}
+            self._size = 0
+
+    def __len__(self):
+        return self._size
+
+
+class LocationIndex:
+    """
+    Grid index over the Location table, built lazily on first query.
+
+    Saves and deletes made in this process are applied through signals;
+    rows inserted by other processes (or by ``bulk_create``) are picked up
+    incrementally by id at most every ``LOCATION_INDEX_REFRESH`` seconds.
+    """
+
+    def __init__(self, cell_size, refresh_interval):
+        self.grid = GridIndex(cell_size)
+        self.refresh_interval = refresh_interval
+        self.loaded = False
+        self.max_id = 0
+        self.refreshed_at = 0.0
+        # Ids above max_id already added through signals, skipped by the next refresh
+        self._added = set()
+        self._lock = threading.Lock()
+
+    def _load_since(self, min_id):
+        from .models import Location
+
+        rows = (Location.objects
+                .filter(id__gt=min_id, roadside=False)
+                .order_by('id')
+                .values_list('id', 'latitude', 'longitude'))
+        for location_id, latitude, longitude in rows.iterator(chunk_size=10000):
+            if location_id not in self._added:
+                self.grid.add(location_id, latitude, longitude)
+            self.max_id = location_id
+        self._added = {location_id for location_id in self._added if location_id > self.max_id}
+        self.refreshed_at = time.monotonic()
+
+    def ensure_current(self):
+        with self._lock:
+            if not self.loaded:
+                self._load_since(0)
+                self.loaded = True
+            elif time.monotonic() - self.refreshed_at >= self.refresh_interval:
+                self._load_since(self.max_id)
+
+    def added(self, location):
+        with self._lock:
+            if self.loaded and location.id > self.max_id and location.id not in self._added:
+                self.grid.add(location.id, location.latitude, location.longitude)
+                self._added.add(location.id)
+
+    def moved(self, location, old_latitude, old_longitude):
+        if self.loaded and self.grid.remove(location.id, old_latitude, old_longitude):
+            self.grid.add(location.id, location.latitude, location.longitude)
+
+    def removed(self, location):
+        if self.loaded:
+            self.grid.remove(location.id, location.latitude, location.longitude)
+
+    def within(self, lat, lng, radius_miles, limit=None):
+        self.ensure_current()
+        return self.grid.within(lat, lng, radius_miles, limit)
+
+    def nearest(self, lat, lng, max_radius_miles, k=1):
+        self.ensure_current()
+        return self.grid.nearest(lat, lng, max_radius_miles, k)
+
+    def reset(self):
+        with self._lock:
+            self.grid.clear()
+            self.loaded = False
+            self.max_id = 0
+            self._added = set()
+
+
+location_index = LocationIndex(
+    cell_size=settings.LOCATION_INDEX_CELL_SIZE,
+    refresh_interval=settings.LOCATION_INDEX_REFRESH,
+)
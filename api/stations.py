@@ -0,0 +1,165 @@
+"""
+Station catalog: the truck stops and rest areas trips can stop at.
+
+The catalog is a CSV of ``kind, name, latitude, longitude`` rows (see
+STATION_CATALOG_PATH; the bundled one is synthetic seed data), loaded on
+first use into grid indexes by kind. Fuel stops are planned by searching
+the route corridor: points are sampled along the route every corridor
+radius through the search window, and each sample is one grid lookup, so
+the cost of a search depends on the window and not on the catalog size.
+Breaks and rests are made at the station nearest to where they fall due,
+one grid lookup each.
+"""
+import csv
+import logging
+import math
+import threading
+from collections import namedtuple
+
+from django.conf import settings
+
+from .roadgraph import ACCESS_CIRCUITY, ACCESS_SPEED_MPH
+from .spatial import GridIndex
+
+logger = logging.getLogger(__name__)
+
+TRUCK_STOP = 'truck_stop'
+REST_AREA = 'rest_area'
+KINDS = (TRUCK_STOP, REST_AREA)
+# Station kinds that sell diesel
+FUEL_KINDS = (TRUCK_STOP,)
+
+# Miles of range given up by fuelling early, weighed against miles of detour
+EARLY_FUEL_WEIGHT = 0.05
+
+Station = namedtuple('Station', ['kind', 'name', 'latitude', 'longitude'])
+
+# A planned fuel stop ``route_mile`` miles along the route; ``station`` is
+# None when no station was found in the window and the truck fuels where it is
+FuelStop = namedtuple('FuelStop', ['route_mile', 'station', 'detour_miles', 'detour_minutes'])
+
+
+def detour(off_route_miles):
+    """
+    ``(miles, minutes)`` of the round trip to a station ``off_route_miles``
+    from the route, driven like a road-graph access leg.
+    """
+    miles = 2 * off_route_miles * ACCESS_CIRCUITY
+    return miles, miles / ACCESS_SPEED_MPH * 60
+
+
+class StationCatalog:
+    def __init__(self, path=None, stations=None, cell_size=0.1):
+        self.path = path
+        self.cell_size = cell_size
+        self.stations = list(stations) if stations is not None else None
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self.stations is not None:
+            return
+        with self._lock:
+            if self.stations is not None:
+                return
+            try:
+                self.stations = self.read(self.path)
+            except OSError as e:
+                logger.warning("Station catalog %s not loaded: %s", self.path, e)
+                self.stations = []
+
+    @staticmethod
+    def read(path):
+        stations = []
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(line for line in f if not line.startswith('#')):
+                if row['kind'] not in KINDS:
+                    raise ValueError(f"{path}: unknown station kind {row['kind']!r}")
+                stations.append(Station(row['kind'], row['name'], float(row['latitude']), float(row['longitude'])))
+        return stations
+
+    def index(self, kinds):
+        """
+        GridIndex over the stations of ``kinds``; ids are positions in ``stations``.
+        """
+        index = self._indexes.get(kinds)
+        if index is None:
+            self._load()
+            with self._lock:
+                index = self._indexes.get(kinds)
+                if index is None:
+                    index = GridIndex(self.cell_size)
+                    for station_id, station in enumerate(self.stations):
+                        if station.kind in kinds:
+                            index.add(station_id, station.latitude, station.longitude)
+                    self._indexes[kinds] = index
+        return index
+
+    def nearest(self, latitude, longitude, radius, kinds=KINDS):
+        """
+        ``(miles, Station)`` of the station of ``kinds`` nearest to a point,
+        or None if there is none within ``radius`` miles.
+        """
+        matches = self.index(kinds).nearest(latitude, longitude, radius)
+        if not matches:
+            return None
+        distance, station_id = matches[0]
+        return distance, self.stations[station_id]
+
+    def best_fuel_stop(self, line, start, end, radius=None):
+        """
+        The best FuelStop for a RouteLine between route miles ``start`` and
+        ``end``, or None if no truck stop is within ``radius`` miles of the
+        route there. Stations are scored by detour, plus a small penalty for
+        each mile before ``end`` that they are reached.
+        """
+        radius = radius or settings.STATION_CORRIDOR_MILES
+        index = self.index(FUEL_KINDS)
+        if not len(index):
+            return None
+        # Each station's nearest sample: (off-route miles, route mile)
+        found = {}
+        mile = end
+        while mile >= start:
+            latitude, longitude = line.point_at(mile)
+            for distance, station_id in index.within(latitude, longitude, radius):
+                if station_id not in found or distance < found[station_id][0]:
+                    found[station_id] = (distance, mile)
+            mile -= radius
+
+        best, best_score = None, math.inf
+        for station_id, (distance, mile) in found.items():
+            miles, minutes = detour(distance)
+            score = miles + EARLY_FUEL_WEIGHT * (end - mile)
+            if score < best_score:
+                best, best_score = FuelStop(mile, self.stations[station_id], miles, minutes), score
+        return best
+
+    def reset(self):
+        with self._lock:
+            self._indexes = {}
+            if self.path is not None:
+                self.stations = None
+
+
+station_catalog = StationCatalog(settings.STATION_CATALOG_PATH)
+
+
+def plan_fuel_stops(line, interval, window=None, radius=None, catalog=None):
+    """
+    FuelStops for a RouteLine, fuelling at least every ``interval`` miles:
+    each stop is the best truck stop in the ``window`` miles before the
+    point the tank would run out, or that point itself if there is none.
+    """
+    window = window or settings.FUEL_SEARCH_WINDOW_MILES
+    catalog = catalog or station_catalog
+    stops = []
+    last = 0.0
+    while line.length - (last + interval) > 1e-6:
+        mark = last + interval
+        # Never search back to the previous stop, so every stop moves on
+        start = max(mark - window, last + min(window, interval) / 2)
+        stop = catalog.best_fuel_stop(line, start, mark, radius) or FuelStop(mark, None, 0.0, 0.0)
+        stops.append(stop)
+        last = stop.route_mile
+    return stops
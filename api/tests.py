@@ -1,3 +1,1983 @@
-from django.test import TestCase
+import json
+import math
+import os
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+import zlib
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .autocomplete import AutocompleteIndex, autocomplete_index
+from .directions import DirectionsResult, directions_cache, get_route_legs, get_route_legs_many
+from .eld import day_bounds, duty_status, split_days
+from .estimate import estimate_legs, estimate_many
+from .gazetteer import Gazetteer
+from .geocoding import GeocodeCache, GeocodeResult, geocode_address, geocode_cache, geocode_many, resolve_upstream
+from .geometry import ZOOM_LEVELS, Line, RouteLine, pixel_degrees, significance, simplify
+from .hos import BREAK, PROPERTY_60_7, RESET, DutyState, schedule
+from .jobs import claim, enqueue, generate_eld_logs, run
+from .logexport import export_logs
+from .loggraph import HEIGHT, WIDTH, GraphCache, graph_key, log_graph, render_png, render_svg, row_y
+from .maps_client import CircuitBreaker, MapsClient, MapsUnavailable
+from .middleware import UpstreamTimingMiddleware
+from .models import (
+    DailyLog, DirectionsCacheEntry, GeocodeCacheEntry, Job, Location, LocationManager, LogEntry, RouteSegment, Trip,
+)
+from .planning import (
+    PROCESS_POOL_MIN_TRIPS, TripRequest, leg_times, place_segments, plan_trips, preview_cache, schedule_all,
+)
+from .polyline import decode, encode
+from .roadgraph import RoadGraph, road_graph, shortest_durations, write_graph
+from .routing import route_with_fallback
+from .serializers import TripSerializer
+from .spatial import haversine_miles, location_index
+from .stations import FuelStop, Station, StationCatalog, detour, plan_fuel_stops
+
+
+class FakeGeocoder:
+    """
+    Local stand-in for the upstream geocoder with a fixed per-call latency.
+    """
+
+    def __init__(self, latency=0.0, failing=()):
+        self.latency = latency
+        self.failing = set(failing)
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, address):
+        with self._lock:
+            self.calls.append(address)
+        time.sleep(self.latency)
+        if address in self.failing:
+            raise ValueError(f"Cannot geocode {address}")
+        # Distinct, stable coordinates per address so results don't dedupe onto one location
+        offset = zlib.crc32(address.encode()) % 10000 / 1000
+        return GeocodeResult(address=address.title(), latitude=35.0 + offset, longitude=-90.0 - offset)
+
+
+def directions_response(query, meters, seconds):
+    """
+    Directions API payload with one leg per stop in ``query``, each ``meters`` long.
+    """
+    waypoints = parse_qs(query).get('waypoints', [''])[0]
+    legs = len(waypoints.split('|')) + 1 if waypoints else 1
+    leg = {"distance": {"value": meters}, "duration": {"value": seconds}}
+    return {"status": "OK", "routes": [{"legs": [leg] * legs, "overview_polyline": {"points": ""}}]}
+
+
+class FakeMapsServer:
+    """
+    Local HTTP server standing in for the Google Maps API. Every request
+    waits ``delay`` seconds and is answered by ``handler(path, query)``.
+    """
+
+    def __init__(self, handler=None, delay=0.0):
+        self.handler = handler or (lambda path, query: {"status": "OK"})
+        self.delay = delay
+        self.hits = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with server._lock:
+                    server.hits += 1
+                time.sleep(server.delay)
+                path, _, query = self.path.partition('?')
+                body = json.dumps(server.handler(path, query)).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        # Clients that gave up (timed out) are not an error here
+        self.httpd.handle_error = lambda request, client_address: None
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}"
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def client(self):
+        return MapsClient(
+            base_url=self.url, api_key='test', connect_timeout=1, read_timeout=5,
+            max_retries=0, retry_backoff=0, pool_size=32, breaker=CircuitBreaker(5, 30),
+        )
+
+
+class MapsClientTests(SimpleTestCase):
+    def client_for(self, server, **options):
+        options = dict(dict(
+            connect_timeout=1, read_timeout=5, max_retries=0, retry_backoff=0, pool_size=4,
+            breaker=CircuitBreaker(5, 30),
+        ), **options)
+        return MapsClient(base_url=server.url, api_key='test', **options)
+
+    def test_transient_failures_are_retried_with_jittered_backoff(self):
+        statuses = iter(['OVER_QUERY_LIMIT', 'UNKNOWN_ERROR', 'OK'])
+        with FakeMapsServer(handler=lambda path, query: {"status": next(statuses)}) as server:
+            client = self.client_for(server, max_retries=2, retry_backoff=0.01)
+            with mock.patch('api.maps_client.random.uniform', return_value=0) as uniform:
+                self.assertEqual(client.get_json('geocode', {'address': 'x'}), {"status": "OK"})
+        self.assertEqual(server.hits, 3)
+        # Each wait is drawn at random up to a doubling limit
+        self.assertEqual(uniform.call_args_list, [mock.call(0, 0.01), mock.call(0, 0.02)])
+        self.assertEqual(client.stats()['retries'], 2)
+        self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_slow_calls_time_out(self):
+        with FakeMapsServer(delay=0.5) as server:
+            client = self.client_for(server, read_timeout=0.05)
+            started = time.perf_counter()
+            with self.assertRaises(MapsUnavailable):
+                client.get_json('geocode', {'address': 'x'})
+            self.assertLess(time.perf_counter() - started, 0.4)
+        self.assertEqual(client.stats()['errors'], 1)
+
+    def test_breaker_opens_and_recovers_after_a_trial_call(self):
+        status = {'value': 'UNKNOWN_ERROR'}
+        with FakeMapsServer(handler=lambda path, query: {"status": status['value']}) as server:
+            client = self.client_for(server, breaker=CircuitBreaker(2, 0.05))
+            for _ in range(2):
+                with self.assertRaises(MapsUnavailable):
+                    client.get_json('geocode', {'address': 'x'})
+            self.assertEqual(client.breaker.state, CircuitBreaker.OPEN)
+
+            # Open: calls fail fast without reaching the provider
+            with self.assertRaises(MapsUnavailable):
+                client.get_json('geocode', {'address': 'x'})
+            self.assertEqual((server.hits, client.stats()['rejected']), (2, 1))
+
+            # Half-open: a failed trial opens it again, a good one closes it
+            time.sleep(0.06)
+            with self.assertRaises(MapsUnavailable):
+                client.get_json('geocode', {'address': 'x'})
+            self.assertEqual(client.breaker.state, CircuitBreaker.OPEN)
+            time.sleep(0.06)
+            status['value'] = 'OK'
+            self.assertEqual(client.get_json('geocode', {'address': 'x'}), {"status": "OK"})
+            self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+            self.assertEqual(server.hits, 4)
+
+    def test_unexpected_errors_in_a_trial_call_reopen_the_breaker(self):
+        with FakeMapsServer() as server:
+            client = self.client_for(server, breaker=CircuitBreaker(1, 0.05))
+            with mock.patch.object(client.session, 'get', side_effect=RuntimeError("boom")):
+                with self.assertRaises(RuntimeError):
+                    client.get_json('geocode', {'address': 'x'})
+                self.assertEqual(client.breaker.state, CircuitBreaker.OPEN)
+                time.sleep(0.06)
+                with self.assertRaises(RuntimeError):
+                    client.get_json('geocode', {'address': 'x'})
+                # Not stuck half-open: the failed trial was recorded
+                self.assertEqual(client.breaker.state, CircuitBreaker.OPEN)
+            time.sleep(0.06)
+            self.assertEqual(client.get_json('geocode', {'address': 'x'}), {"status": "OK"})
+            self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_server_timing_reports_upstream_time(self):
+        with FakeMapsServer(delay=0.02) as server:
+            client = self.client_for(server)
+
+            def view(request):
+                client.get_json('geocode', {'address': 'a'})
+                client.get_json('geocode', {'address': 'b'})
+                return HttpResponse('ok')
+
+            with mock.patch('api.middleware.maps_client') as shared:
+                response = UpstreamTimingMiddleware(view)(None)
+                quiet = UpstreamTimingMiddleware(lambda request: HttpResponse('ok'))(None)
+
+        upstream, total = response['Server-Timing'].split(', ')
+        self.assertTrue(upstream.startswith('upstream;dur='))
+        self.assertIn('desc="2 maps calls"', upstream)
+        upstream_ms = float(upstream.split(';')[1][4:])
+        self.assertGreaterEqual(upstream_ms, 40)
+        self.assertLessEqual(upstream_ms, float(total.split('=')[1]))
+        shared.record_request.assert_called_once()
+        # Requests that make no maps calls get no header
+        self.assertNotIn('Server-Timing', quiet)
+
+
+class GeocodeBatchTests(TestCase):
+    def setUp(self):
+        geocode_cache.memory.clear()
+        self.client = APIClient()
+
+    def test_wall_time_scales_with_concurrency(self):
+        addresses = [f"{n} Main St, Springfield" for n in range(16)]
+
+        geocoder = FakeGeocoder(latency=0.05)
+        started = time.perf_counter()
+        geocode_many(addresses, resolver=geocoder, max_workers=1)
+        serial = time.perf_counter() - started
+
+        geocode_cache.memory.clear()
+        Location.objects.all().delete()
+
+        geocoder = FakeGeocoder(latency=0.05)
+        started = time.perf_counter()
+        geocode_many(addresses, resolver=geocoder, max_workers=8)
+        concurrent = time.perf_counter() - started
+
+        self.assertEqual(len(geocoder.calls), 16)
+        self.assertGreater(serial, 0.05 * 16)
+        self.assertLess(concurrent, serial / 3)
+
+    def test_batch_endpoint_dedupes_and_keeps_input_order(self):
+        geocoder = FakeGeocoder(failing={"Nowhere"})
+        addresses = ["10 Elm St", "Nowhere", "10 elm street", "", "20 Oak Ave"]
+
+        with mock.patch('api.geocoding.resolve_upstream', geocoder):
+            response = self.client.post('/api/locations/geocode/batch/', {"addresses": addresses}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([r['address'] for r in results], addresses)
+        self.assertEqual(results[0]['location'], results[2]['location'])
+        self.assertIn('error', results[1])
+        self.assertIn('error', results[3])
+        self.assertEqual(results[4]['location']['address'], "20 Oak Ave")
+        self.assertEqual(sorted(geocoder.calls), ["10 Elm St", "20 Oak Ave", "Nowhere"])
+        self.assertEqual(Location.objects.count(), 2)
+
+    def test_batch_reuses_cached_locations(self):
+        geocoder = FakeGeocoder()
+        geocode_many(["10 Elm St"], resolver=geocoder)
+        geocode_cache.memory.clear()
+
+        results = geocode_many(["10 ELM STREET", "30 Pine Rd"], resolver=geocoder)
+
+        self.assertEqual(geocoder.calls, ["10 Elm St", "30 Pine Rd"])
+        self.assertEqual(results[0][0].address, "10 Elm St")
+        self.assertEqual(Location.objects.count(), 2)
+
+
+class GeocodeCacheTests(TestCase):
+    def setUp(self):
+        self.cache = GeocodeCache(max_entries=10, ttl=60, fallback_ttl=5)
+        self.location = Location.objects.create(address="10 Elm St", latitude=35.0, longitude=-90.0)
+
+    def test_hits_come_from_memory_then_the_shared_tier(self):
+        self.cache.put("10 elm st", self.location)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.cache.get("10 elm st"), self.location)
+
+        # A fresh process only has the shared tier, which refills its memory
+        restarted = GeocodeCache(max_entries=10, ttl=60, fallback_ttl=5)
+        with self.assertNumQueries(1):
+            self.assertEqual(restarted.get("10 elm st"), self.location)
+        with self.assertNumQueries(0):
+            self.assertEqual(restarted.get("10 elm st"), self.location)
+
+        with self.assertNumQueries(1):
+            self.assertIsNone(restarted.get("20 oak ave"))
+        self.assertEqual(
+            {name: restarted.counters.get(name) for name in ('memory_hits', 'db_hits', 'misses')},
+            {'memory_hits': 1, 'db_hits': 1, 'misses': 1},
+        )
+        self.assertEqual(restarted.stats()['hit_ratio'], 2 / 3)
+
+    def test_entries_expire_in_both_tiers(self):
+        self.cache.put("10 elm st", self.location)
+        later = time.monotonic() + 61
+        with mock.patch('api.caching.time.monotonic', return_value=later):
+            # Memory has expired; the shared tier is still fresh
+            self.assertEqual(self.cache.get("10 elm st"), self.location)
+        self.assertEqual(self.cache.counters.get('db_hits'), 1)
+
+        self.cache.memory.clear()
+        GeocodeCacheEntry.objects.update(cached_at=timezone.now() - timedelta(seconds=61))
+        self.assertIsNone(self.cache.get("10 elm st"))
+        self.assertEqual(self.cache.counters.get('misses'), 1)
+
+    def test_put_overwrites_the_shared_entry(self):
+        other = Location.objects.create(address="12 Elm St", latitude=35.1, longitude=-90.1)
+        self.cache.put("10 elm st", self.location)
+        self.cache.put("10 elm st", other)
+
+        self.assertEqual(GeocodeCacheEntry.objects.get().location, other)
+        self.assertEqual(GeocodeCache(max_entries=10, ttl=60, fallback_ttl=5).get("10 elm st"), other)
+
+    def test_a_hit_reuses_the_location_instead_of_inserting_one(self):
+        geocode_cache.memory.clear()
+        geocoder = FakeGeocoder()
+
+        with mock.patch('api.geocoding.resolve_upstream', geocoder):
+            first, created = geocode_address("30 Pine Rd")
+            self.assertTrue(created)
+            geocode_cache.memory.clear()
+            with CaptureQueriesContext(connection) as queries:
+                again, created_again = geocode_address("30 PINE ROAD")
+
+        self.assertFalse(created_again)
+        self.assertEqual(again.id, first.id)
+        self.assertEqual(geocoder.calls, ["30 Pine Rd"])
+        self.assertFalse(any(query['sql'].startswith('INSERT') for query in queries.captured_queries))
+        self.assertEqual(Location.objects.filter(address="30 Pine Rd").count(), 1)
+
+    @override_settings(USE_MOCK_DATA=False, GOOGLE_MAPS_API_KEY='key')
+    def test_fallbacks_during_an_outage_are_retried_once_it_recovers(self):
+        geocode_cache.memory.clear()
+        address = "1200 Industrial Pkwy, Springfield"
+        google = GeocodeResult("1200 Industrial Pkwy, Springfield, IL 62702, USA", 39.8300, -89.5800)
+        with mock.patch('api.geocoding.google_geocode', side_effect=MapsUnavailable("circuit is open")):
+            fallback, _ = geocode_address(address)
+            [(batch_fallback, _)] = geocode_many(["1300 Industrial Pkwy, Springfield"])
+        self.assertFalse(GeocodeCacheEntry.objects.exists())
+        # Served from memory until it expires
+        with mock.patch('api.geocoding.google_geocode') as recovered:
+            self.assertEqual(geocode_address(address)[0], fallback)
+        recovered.assert_not_called()
+
+        later = time.monotonic() + geocode_cache.fallback_ttl + 1
+        with mock.patch('api.geocoding.google_geocode', return_value=google) as recovered, \
+                mock.patch('api.caching.time.monotonic', return_value=later):
+            location, _ = geocode_address(address)
+            geocode_many(["1300 Industrial Pkwy, Springfield"])
+        self.assertEqual(recovered.call_count, 2)
+        self.assertEqual((location.latitude, location.longitude), (39.83, -89.58))
+        self.assertNotEqual(location.id, fallback.id)
+        self.assertEqual(GeocodeCacheEntry.objects.count(), 2)
+
+        geocode_cache.memory.clear()
+        with mock.patch('api.geocoding.google_geocode') as again:
+            self.assertEqual(geocode_address(address)[0], location)
+        again.assert_not_called()
+
+
+class LocationDedupeTests(TestCase):
+    ORIGIN = (40.0, -100.0)
+
+    def setUp(self):
+        location_index.reset()
+        self.addCleanup(location_index.reset)
+        self.stored = Location.objects.create(address="10 Elm Street", latitude=40.0, longitude=-100.0)
+
+    def north(self, miles):
+        return self.ORIGIN[0] + miles / 69.05, self.ORIGIN[1]
+
+    def test_any_address_within_the_tolerance_matches(self):
+        results = Location.objects.resolve_many([
+            ("Somewhere Else", *self.north(0.03)),
+            ("Somewhere Else", *self.north(0.1)),
+        ])
+        self.assertEqual(results[0], (self.stored, False))
+        self.assertTrue(results[1][1])
+        self.assertEqual(Location.objects.count(), 2)
+
+    def test_the_same_address_matches_within_the_address_radius(self):
+        results = Location.objects.resolve_many([
+            ("10 ELM ST", *self.north(0.8)),
+            ("10 Elm St", *self.north(1.5)),
+            # Only the first of two new items with one address is inserted
+            ("10 elm street", *self.north(1.6)),
+        ])
+        self.assertEqual(results[0], (self.stored, False))
+        self.assertTrue(results[1][1])
+        self.assertEqual(results[2], (results[1][0], False))
+        self.assertEqual(Location.objects.count(), 2)
+
+    def test_large_batches_match_through_the_spatial_index(self):
+        items = [(f"Point {n}", *self.north(0.01 + n * 0.1)) for n in range(30)]
+        results = Location.objects.resolve_many(items)
+        self.assertEqual(results[0], (self.stored, False))
+        self.assertTrue(all(created for _, created in results[1:]))
+
+        # Bulk-inserted rows reach the index on its next refresh
+        location_index.reset()
+        again = Location.objects.resolve_many([(f"Renamed {n}", *self.north(0.02 + n * 0.1)) for n in range(30)])
+        self.assertEqual([location.id for location, _ in again], [location.id for location, _ in results])
+        self.assertFalse(any(created for _, created in again))
+
+    def test_merges_duplicates_and_repoints_references_across_chunks(self):
+        # Pairs of (canonical, duplicate): one by address, the rest by coordinates
+        canonical = [self.stored] + [
+            Location.objects.create(address=f"Stop {n}", latitude=41.0 + n, longitude=-90.0) for n in range(4)
+        ]
+        duplicates = [Location.objects.create(address="10 elm st", latitude=self.north(0.5)[0], longitude=-100.0)] + [
+            Location.objects.create(address=f"Stop {n} annex", latitude=41.0 + n + 0.0003, longitude=-90.0)
+            for n in range(4)
+        ]
+        distinct = Location.objects.create(address="10 Elm Street", latitude=self.north(2)[0], longitude=-100.0)
+
+        start = timezone.now() - timedelta(days=1)
+        trip = Trip.objects.create(
+            current_location=duplicates[0], pickup_location=duplicates[1], dropoff_location=distinct,
+            start_time=start, end_time=start + timedelta(hours=5),
+        )
+        segments = [
+            RouteSegment.objects.create(
+                trip=trip, start_location=duplicates[n], end_location=duplicates[n + 1], segment_type='drive',
+                start_time=start + timedelta(hours=n), end_time=start + timedelta(hours=n + 1),
+            )
+            for n in range(4)
+        ]
+        RouteSegment.objects.update(updated_at=start)
+        GeocodeCacheEntry.objects.create(key='k', normalized_address='stop 3 annex', location=duplicates[4])
+
+        out = StringIO()
+        call_command('dedupe_locations', '--dry-run', stdout=out)
+        self.assertIn("Found 5 duplicate locations across 5 distinct locations", out.getvalue())
+        self.assertEqual(Location.objects.count(), 11)
+
+        out = StringIO()
+        call_command('dedupe_locations', '--chunk-size', '2', stdout=out)
+        self.assertIn("Merged 2/5", out.getvalue())
+        self.assertIn("Merged 5/5", out.getvalue())
+
+        self.assertEqual(set(Location.objects.values_list('id', flat=True)),
+                         {location.id for location in canonical} | {distinct.id})
+        trip.refresh_from_db()
+        self.assertEqual((trip.current_location_id, trip.pickup_location_id, trip.dropoff_location_id),
+                         (canonical[0].id, canonical[1].id, distinct.id))
+        for n, segment in enumerate(segments):
+            segment.refresh_from_db()
+            self.assertEqual((segment.start_location_id, segment.end_location_id),
+                             (canonical[n].id, canonical[n + 1].id))
+            self.assertGreater(segment.updated_at, start)
+        self.assertEqual(GeocodeCacheEntry.objects.get().location_id, canonical[4].id)
+
+        out = StringIO()
+        call_command('dedupe_locations', stdout=out)
+        self.assertIn("Found 0 duplicate locations", out.getvalue())
+
+
+class ConcurrentResolveTests(TransactionTestCase):
+    def setUp(self):
+        location_index.reset()
+        self.addCleanup(location_index.reset)
+
+    def test_concurrent_requests_for_one_place_insert_one_row(self):
+        barrier = threading.Barrier(8)
+        results = []
+        nearby_many = LocationManager._nearby_many
+
+        def slow_nearby_many(manager, points, tolerance):
+            # Widen the window between looking for a match and inserting
+            found = nearby_many(manager, points, tolerance)
+            time.sleep(0.05)
+            return found
+
+        errors = []
+
+        def resolve(n):
+            try:
+                barrier.wait()
+                results.append(Location.objects.resolve("10 Elm St", 40.0 + n / 100000, -100.0))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        with mock.patch.object(LocationManager, '_nearby_many', slow_nearby_many):
+            threads = [threading.Thread(target=resolve, args=(n,)) for n in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(results), 8)
+        self.assertEqual(Location.objects.count(), 1)
+        self.assertEqual(len({location.id for location, _ in results}), 1)
+        self.assertEqual([created for _, created in results].count(True), 1)
+
+
+class NearbyLocationsTests(TestCase):
+    def setUp(self):
+        location_index.reset()
+        self.addCleanup(location_index.reset)
+        self.client = APIClient()
+        self.points = {
+            miles: Location.objects.create(address=f"{miles} miles north", latitude=40.0 + miles / 69.05, longitude=-100.0)
+            for miles in (0, 1, 2, 4)
+        }
+
+    def nearby(self, **params):
+        return self.client.get('/api/locations/nearby/', dict({'lat': 40.0, 'lng': -100.0}, **params))
+
+    def found(self, **params):
+        response = self.nearby(**params)
+        self.assertEqual(response.status_code, 200)
+        return [(result['address'], result['distance']) for result in response.json()]
+
+    def test_locations_within_the_radius_nearest_first(self):
+        results = self.found(radius=3)
+        self.assertEqual([address for address, _ in results], ["0 miles north", "1 miles north", "2 miles north"])
+        for (_, distance), miles in zip(results, (0, 1, 2)):
+            self.assertAlmostEqual(distance, miles, places=2)
+
+        self.assertEqual(self.found(radius=0), [("0 miles north", 0)])
+        self.assertEqual(len(self.found(radius=100)), 4)
+        self.assertEqual([address for address, _ in self.found(radius=100, limit=2)], ["0 miles north", "1 miles north"])
+        self.assertEqual(self.found(lat=-40.0, radius=100), [])
+
+    def test_rejects_bad_queries(self):
+        for params in ({'radius': -1}, {'radius': 101}, {'limit': 0}, {'limit': 101}, {'lat': 91}, {'lng': 'east'}):
+            self.assertEqual(self.nearby(**params).status_code, 400, params)
+        self.assertEqual(self.client.get('/api/locations/nearby/', {'lat': 40.0}).status_code, 400)
+
+    def test_saves_and_deletes_update_the_index(self):
+        self.assertEqual(len(self.found(radius=3)), 3)
+
+        moved = self.points[4]
+        moved.latitude = 40.0 + 0.5 / 69.05
+        moved.save()
+        self.points[2].delete()
+        added = Location.objects.create(address="New stop", latitude=40.0 + 2.5 / 69.05, longitude=-100.0)
+
+        self.assertEqual([address for address, _ in self.found(radius=3)],
+                         ["0 miles north", "4 miles north", "1 miles north", "New stop"])
+        with self.assertNumQueries(0):
+            self.assertEqual([location_id for _, location_id in location_index.within(40.0, -100.0, 3)],
+                             [self.points[0].id, moved.id, self.points[1].id, added.id])
+
+    def test_rows_written_without_signals_are_picked_up_on_refresh(self):
+        self.assertEqual(len(self.found(radius=3)), 3)
+        Location.objects.bulk_create([Location(address="Bulk stop", latitude=40.0 + 1.5 / 69.05, longitude=-100.0)])
+        # Moved elsewhere without a save: dropped by the distance check on the rows read
+        Location.objects.filter(id=self.points[1].id).update(latitude=45.0)
+
+        self.assertEqual([address for address, _ in self.found(radius=3)], ["0 miles north", "2 miles north"])
+        later = time.monotonic() + location_index.refresh_interval
+        with mock.patch('api.spatial.time.monotonic', return_value=later):
+            self.assertEqual([address for address, _ in self.found(radius=3)],
+                             ["0 miles north", "Bulk stop", "2 miles north"])
+
+
+GAZETTEER_FIXTURE = """\
+# Two Springfields, so "Springfield" alone is ambiguous
+kind,name,state,code,latitude,longitude
+city,Chicago,IL,,41.8781,-87.6298
+city,Springfield,IL,,39.7817,-89.6501
+city,Springfield,MO,,37.2090,-93.2923
+city,Saint Louis,MO,,38.6270,-90.1994
+zip,Chicago,IL,60601,41.8858,-87.6181
+exit,I-40,AZ,1,34.8697,-114.5800
+exit,I-40,TX,1,35.2220,-103.0415
+exit,I-70,KS,53,39.0000,-99.0000
+"""
+
+
+class GazetteerTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.source = os.path.join(self.directory, 'places.csv')
+        with open(self.source, 'w') as f:
+            f.write(GAZETTEER_FIXTURE)
+        self.path = self.build(self.source)
+        self.gazetteer = Gazetteer(self.path)
+
+    def build(self, *sources, output='gazetteer.tsv'):
+        path = os.path.join(self.directory, output)
+        call_command('build_gazetteer', *sources, '--output', path, stdout=StringIO())
+        return path
+
+    def lookup(self, address):
+        match = self.gazetteer.lookup(address)
+        return match and (match.name, match.kind, match.exact)
+
+    def test_cities_zips_and_exits_resolve_offline(self):
+        self.assertEqual(self.lookup("Chicago, IL"), ("Chicago, IL", 'city', True))
+        self.assertEqual(self.lookup("chicago illinois usa"), ("Chicago, IL", 'city', True))
+        self.assertEqual(self.lookup("St. Louis, Missouri"), ("Saint Louis, MO", 'city', True))
+        self.assertEqual(self.lookup("60601"), ("Chicago, IL 60601", 'zip', True))
+        self.assertEqual(self.lookup("Chicago, IL 60601-1234"), ("Chicago, IL 60601", 'zip', True))
+        self.assertEqual(self.lookup("I-40 Exit 1, AZ"), ("I-40 Exit 1, AZ", 'exit', True))
+        self.assertEqual(self.lookup("Interstate 70 exit 53"), ("I-70 Exit 53, KS", 'exit', True))
+        match = self.gazetteer.lookup("Chicago, IL")
+        self.assertEqual((match.latitude, match.longitude), (41.8781, -87.6298))
+
+    def test_ambiguous_and_street_level_queries_are_not_exact(self):
+        # One of several candidates, or a street inside a known place
+        self.assertEqual(self.lookup("Springfield"), ("Springfield, IL", 'city', False))
+        self.assertEqual(self.lookup("I-40 Exit 1"), ("I-40 Exit 1, AZ", 'exit', False))
+        self.assertEqual(self.lookup("123 Main St, Chicago, IL"), ("Chicago, IL", 'city', False))
+        self.assertEqual(self.lookup("Springfield, MO"), ("Springfield, MO", 'city', True))
+        self.assertIsNone(self.lookup("Nowhere, OR"))
+        self.assertIsNone(self.lookup("I-40 Exit 99, AZ"))
+
+    @override_settings(GEOCODE_GAZETTEER_FIRST=True, USE_MOCK_DATA=False, GOOGLE_MAPS_API_KEY='key')
+    def test_only_exact_matches_skip_the_upstream_geocoder(self):
+        upstream = GeocodeResult("Upstream", 1.0, 2.0)
+        with mock.patch('api.geocoding.gazetteer', self.gazetteer), \
+                mock.patch('api.geocoding.google_geocode', return_value=upstream) as google:
+            self.assertEqual(resolve_upstream("Chicago, IL"), GeocodeResult("Chicago, IL", 41.8781, -87.6298))
+            self.assertEqual(resolve_upstream("I-40 Exit 1, AZ").address, "I-40 Exit 1, AZ")
+            google.assert_not_called()
+
+            for address in ("Springfield", "123 Main St, Chicago, IL", "Nowhere, OR"):
+                self.assertEqual(resolve_upstream(address), upstream)
+            self.assertEqual([call.args[0] for call in google.call_args_list],
+                             ["Springfield", "123 Main St, Chicago, IL", "Nowhere, OR"])
+
+    def test_builds_are_deterministic(self):
+        extra = os.path.join(self.directory, 'extra.csv')
+        with open(extra, 'w') as f:
+            f.write("kind,name,state,code,latitude,longitude\n"
+                    "city,Amarillo,TX,,35.2220,-101.8313\n"
+                    "city,Chicago,IL,,41.8800,-87.6300\n")
+
+        first = self.build(self.source, extra, output='first.tsv')
+        second = self.build(self.source, extra, output='second.tsv')
+        with open(first, 'rb') as f1, open(second, 'rb') as f2:
+            data = f1.read()
+            self.assertEqual(data, f2.read())
+        lines = data.splitlines()
+        self.assertEqual(lines, sorted(lines))
+        self.assertEqual(len(lines), 9)
+        # Later sources override earlier ones
+        self.assertEqual(Gazetteer(first).get('c chicago il'), ("Chicago, IL", 41.88, -87.63))
+
+        bad = os.path.join(self.directory, 'bad.csv')
+        with open(bad, 'w') as f:
+            f.write("kind,name,state,code,latitude,longitude\nairport,O'Hare,IL,ORD,41.97,-87.90\n")
+        with self.assertRaises(CommandError):
+            self.build(bad, output='bad.tsv')
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_identical_calls_hit_upstream_once(self):
+        with FakeMapsServer(delay=0.2) as server:
+            client = server.client()
+            barrier = threading.Barrier(20)
+            results = []
+
+            def call():
+                barrier.wait()
+                results.append(client.get_json('directions', {'origin': '1,2', 'destination': '3,4'}))
+
+            threads = [threading.Thread(target=call) for _ in range(20)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(server.hits, 1)
+        self.assertEqual(len(results), 20)
+        self.assertTrue(all(result is results[0] for result in results))
+
+    def test_distinct_calls_are_not_coalesced(self):
+        with FakeMapsServer(delay=0.05) as server:
+            client = server.client()
+            threads = [
+                threading.Thread(target=client.get_json, args=('geocode', {'address': f'Stop {n}'}))
+                for n in range(5)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(server.hits, 5)
+
+
+class AutocompleteTests(TestCase):
+    def setUp(self):
+        autocomplete_index.reset()
+        self.client = APIClient()
+
+    def tearDown(self):
+        autocomplete_index.reset()
+
+    def test_suggestions_are_ranked_by_use(self):
+        quiet = Location.objects.create(address="10 Main St, Shelbyville", latitude=35.0, longitude=-90.0)
+        busy = Location.objects.create(address="10 Main Street, Springfield", latitude=36.0, longitude=-91.0)
+        other = Location.objects.create(address="99 Oak Ave, Springfield", latitude=37.0, longitude=-92.0)
+        now = timezone.now()
+        Trip.objects.create(current_location=other, pickup_location=busy, dropoff_location=busy,
+                            start_time=now, end_time=now)
+
+        response = self.client.get('/api/locations/autocomplete/', {'q': '10 main st'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([match['id'] for match in response.json()], [busy.id, quiet.id])
+        self.assertEqual(response.json()[0]['uses'], 2)
+
+        # Locations and trips created after the index loaded are reflected immediately
+        newer = Location.objects.create(address="10 Main St, Capital City", latitude=38.0, longitude=-93.0)
+        for _ in range(3):
+            Trip.objects.create(current_location=newer, pickup_location=other, dropoff_location=other,
+                                start_time=now, end_time=now)
+        response = self.client.get('/api/locations/autocomplete/', {'q': '10 Main', 'limit': 2})
+        self.assertEqual([match['id'] for match in response.json()], [newer.id, busy.id])
+
+    def test_wide_prefix_rankings_follow_new_uses(self):
+        index = AutocompleteIndex(refresh_interval=60, scan_limit=5)
+        index.load([(n, f"{n} Elm Street", '', 35.0, -90.0) for n in range(1, 101)])
+        index.loaded = True
+
+        self.assertEqual([match.id for match in index.search("1", limit=3)], [1, 10, 100])
+        index.record_use([42, 17, 42])
+        self.assertEqual([match.id for match in index.search("", limit=3)], [])
+        self.assertEqual([match.id for match in index.search("4", limit=3)], [42, 4, 40])
+        self.assertEqual([match.id for match in index.search("1", limit=3)], [17, 1, 10])
+
+    def test_p99_latency_with_many_addresses(self):
+        streets = ["Main St", "Oak Ave", "Pine Rd", "Maple Dr", "Cedar Ln", "Elm St", "Lake Blvd", "Hill Ct"]
+        cities = ["Springfield, IL", "Chicago, IL", "Dallas, TX", "Denver, CO", "Reno, NV", "Gary, IN"]
+        rng = random.Random(7)
+        rows = [
+            (n, f"{rng.randint(1, 9999)} {rng.choice(streets)}, {rng.choice(cities)}", '', 35.0, -90.0)
+            for n in range(1, 200001)
+        ]
+        index = AutocompleteIndex(refresh_interval=60)
+        index.load(rows, {rng.randint(1, 200000): rng.randint(1, 50) for _ in range(20000)})
+        index.loaded = True
+
+        queries = [address[:rng.randint(1, len(address))] for _, address, *_ in rng.sample(rows, 2000)]
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            index.search(query)
+            timings.append(time.perf_counter() - started)
+
+        timings.sort()
+        self.assertLess(timings[int(len(timings) * 0.99)], 0.005)
+
+
+class DirectionsCacheTests(TestCase):
+    def setUp(self):
+        directions_cache.memory.clear()
+        directions_cache.counters.reset()
+
+    def directions(self, path, query):
+        return {
+            "status": "OK",
+            "routes": [{
+                "legs": [{"distance": {"value": 160934}, "duration": {"value": 7200}}],
+                "overview_polyline": {"points": "_p~iF~ps|U_ulLnnqC"},
+            }],
+        }
+
+    def test_repeat_lanes_skip_the_network(self):
+        with FakeMapsServer(handler=self.directions, delay=0.05) as server:
+            with mock.patch('api.directions.maps_client', server.client()):
+                [first] = get_route_legs([(41.8781, -87.6298), (39.7684, -86.1581)])
+                # A few hundred feet away from the first lane, on the same grid point
+                [second] = get_route_legs([(41.8790, -87.6301), (39.7680, -86.1579)])
+                directions_cache.memory.clear()
+                [third] = get_route_legs([(41.8781, -87.6298), (39.7684, -86.1581)])
+                get_route_legs([(39.7684, -86.1581), (41.8781, -87.6298)])
+
+        self.assertEqual(server.hits, 2)
+        self.assertEqual(first, second)
+        self.assertEqual(first, third)
+        self.assertAlmostEqual(first.distance, 100.0, places=2)
+        self.assertEqual(first.duration, 120)
+        self.assertEqual(first.geometry, "_p~iF~ps|U_ulLnnqC")
+
+        stats = directions_cache.stats()
+        self.assertEqual((stats['memory_hits'], stats['db_hits'], stats['misses']), (1, 1, 2))
+        self.assertEqual(stats['hit_ratio'], 0.5)
+        self.assertEqual(stats['estimated_saved_calls'], 2)
+        self.assertGreater(stats['estimated_saved_ms'], 0)
+
+
+class ConcurrentLegsTests(TestCase):
+    """
+    Benchmarks leg fetching against a fake Directions server with a fixed delay.
+    """
+    DELAY = 0.2
+
+    def setUp(self):
+        directions_cache.memory.clear()
+
+    def directions(self, path, query):
+        return directions_response(query, meters=80467, seconds=3600)
+
+    def test_routes_are_fetched_concurrently(self):
+        # Four routes of three stops, none sharing a lane: one call each
+        routes = [[(40.0 + n, -90.0), (40.0 + n, -89.0), (40.0 + n, -88.0)] for n in range(4)]
+        with FakeMapsServer(handler=self.directions, delay=self.DELAY) as server:
+            with mock.patch('api.directions.maps_client', server.client()):
+                started = time.perf_counter()
+                get_route_legs_many(routes, max_workers=1)
+                serial = time.perf_counter() - started
+
+                directions_cache.memory.clear()
+                DirectionsCacheEntry.objects.all().delete()
+                started = time.perf_counter()
+                results = get_route_legs_many(routes)
+                concurrent = time.perf_counter() - started
+
+        self.assertEqual(server.hits, 8)
+        self.assertEqual([[leg.distance for leg in legs] for legs in results], [[80467 / 1609.34] * 2] * 4)
+        self.assertGreater(serial, self.DELAY * 4)
+        self.assertLess(concurrent, self.DELAY * 2)
+
+    @override_settings(USE_MOCK_DATA=False, GOOGLE_MAPS_API_KEY='test')
+    def test_route_latency_is_the_slowest_leg(self):
+        stops = {
+            'currentLocation': {'address': 'Chicago, IL', 'latitude': 41.8781, 'longitude': -87.6298},
+            'pickupLocation': {'address': 'Indianapolis, IN', 'latitude': 39.7684, 'longitude': -86.1581},
+            'dropoffLocation': {'address': 'Columbus, OH', 'latitude': 39.9612, 'longitude': -82.9988},
+        }
+        with FakeMapsServer(handler=self.directions, delay=self.DELAY) as server:
+            with mock.patch('api.directions.maps_client', server.client()):
+                started = time.perf_counter()
+                response = APIClient().post('/api/route-calculator/', stops, format='json')
+                elapsed = time.perf_counter() - started
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(server.hits, 1)
+        self.assertAlmostEqual(response.json()['total_distance'], 2 * 80467 / 1609.34, places=3)
+        self.assertLess(elapsed, self.DELAY * 1.75)
+
+
+@override_settings(USE_MOCK_DATA=False, GOOGLE_MAPS_API_KEY='test')
+class MultiStopRouteTests(TestCase):
+    def setUp(self):
+        directions_cache.memory.clear()
+
+    def directions(self, path, query):
+        return directions_response(query, meters=160934, seconds=7200)
+
+    def stops(self, count):
+        stops = [
+            {'address': f'Stop {n}', 'latitude': 35.0 + n * 0.5, 'longitude': -90.0 - n * 0.5, 'type': 'dropoff'}
+            for n in range(count)
+        ]
+        stops[0]['type'] = 'stop'
+        stops[1]['type'] = 'pickup'
+        return stops
+
+    def plan(self, server, stops):
+        with mock.patch('api.directions.maps_client', server.client()):
+            return APIClient().post('/api/route-calculator/', {'stops': stops}, format='json')
+
+    def test_upstream_calls_stay_constant_as_stops_grow(self):
+        with FakeMapsServer(handler=self.directions) as server:
+            response = self.plan(server, self.stops(15))
+            self.assertEqual(server.hits, 1)
+
+            # More stops than one request takes are split across requests
+            self.plan(server, self.stops(30))
+            self.assertEqual(server.hits, 3)
+
+            # Every leg is cached now
+            self.plan(server, self.stops(15))
+            self.assertEqual(server.hits, 3)
+
+        self.assertEqual(response.status_code, 201)
+        trip = response.json()
+        self.assertAlmostEqual(trip['total_distance'], 14 * 100.0, places=2)
+        types = [segment['segment_type'] for segment in trip['segments']]
+        self.assertEqual(types.count('drive'), 14)
+        self.assertEqual(types.count('pickup'), 1)
+        self.assertEqual(types.count('dropoff'), 13)
+        # The hour at each stop stands in for the 30-minute break; the 14-hour
+        # window runs out twice, and the truck is fuelled after 1000 miles
+        self.assertEqual(types.count('rest'), 0)
+        self.assertEqual(types.count('sleep'), 2)
+        self.assertEqual(types.count('fuel'), 1)
+        self.assertEqual(trip['pickup_location']['address'], 'Stop 1')
+        self.assertEqual(trip['dropoff_location']['address'], 'Stop 14')
+
+    def test_rejects_routes_without_two_stops(self):
+        with FakeMapsServer(handler=self.directions) as server:
+            response = self.plan(server, self.stops(2)[:1])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(server.hits, 0)
+
+
+class HosScheduleTests(SimpleTestCase):
+    def kinds(self, segments):
+        return [(segment.kind, round(segment.duration)) for segment in segments]
+
+    def test_long_day_takes_a_break_then_a_reset(self):
+        # 1100 miles at 60 mph
+        segments = schedule([(1100, 1100)], ['stop', 'dropoff'])
+
+        self.assertEqual(self.kinds(segments), [
+            ('drive', 480), ('rest', 30), ('drive', 180), ('sleep', 600),
+            ('drive', 340), ('fuel', 30), ('drive', 100), ('dropoff', 60),
+        ])
+        self.assertAlmostEqual(sum(segment.distance for segment in segments), 1100)
+        # Segments are back to back
+        for previous, segment in zip(segments, segments[1:]):
+            self.assertAlmostEqual(previous.start + previous.duration, segment.start)
+        # The fuel stop is 1000 miles in
+        fuel = segments[5]
+        self.assertAlmostEqual(fuel.mile, 1000)
+
+    def test_planned_fuel_stops_replace_the_fixed_interval(self):
+        segments = schedule([(600, 600), (900, 900)], fuel_stops=[(820, 12), (1450, 0)])
+
+        fuel = [segment for segment in segments if segment.kind == 'fuel']
+        self.assertEqual([(segment.leg, round(segment.mile)) for segment in fuel], [(1, 220), (1, 850)])
+        self.assertEqual([segment.duration for segment in fuel], [42, 30])
+        self.assertAlmostEqual(sum(segment.distance for segment in segments), 1500)
+
+    def test_fourteen_hour_window_ends_driving(self):
+        # Six hours already on duty leave eight hours of window and no 30-minute break due
+        segments = schedule([(550, 600)], state=DutyState(window=360))
+        self.assertEqual(self.kinds(segments)[:2], [('drive', 480), ('sleep', 600)])
+
+    def test_cycle_limit_forces_a_restart(self):
+        segments = schedule([(275, 300)], state=DutyState(cycle=57 * 60), rules=PROPERTY_60_7)
+        self.assertEqual(self.kinds(segments), [('drive', 180), ('sleep', 2040), ('drive', 120)])
+
+    def test_five_thousand_mile_trip_schedules_in_well_under_a_millisecond(self):
+        legs = [(500, 500 / 55 * 60)] * 10
+        stop_types = ['stop', 'pickup'] + ['dropoff'] * 9
+        segments = schedule(legs, stop_types)
+        self.assertAlmostEqual(sum(segment.distance for segment in segments), 5000)
+
+        timings = []
+        for _ in range(200):
+            started = time.perf_counter()
+            schedule(legs, stop_types)
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        self.assertLess(timings[len(timings) // 2], 0.0005)
+
+
+class TripPlanningTests(TestCase):
+    STOPS = {
+        'currentLocation': {'address': 'Chicago, IL', 'latitude': 41.8781, 'longitude': -87.6298},
+        'pickupLocation': {'address': 'Indianapolis, IN', 'latitude': 39.7684, 'longitude': -86.1581},
+        'dropoffLocation': {'address': 'Denver, CO', 'latitude': 39.7392, 'longitude': -104.9903},
+    }
+
+    def test_trip_is_written_in_one_transaction_and_not_reread(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = APIClient().post('/api/route-calculator/', self.STOPS, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        statements = [query['sql'].split()[0] for query in queries.captured_queries]
+        # In one transaction (a savepoint inside the test case's own
+        # transaction): the locations lock, created on first use, then lookups
+        # for the stops and the places rests are taken at, the new locations,
+        # and the roadside locations, trip and segments
+        self.assertEqual(statements[:6], ['SAVEPOINT', 'SAVEPOINT', 'UPDATE', 'SAVEPOINT', 'INSERT', 'RELEASE'])
+        self.assertEqual(set(statements[6:-6]), {'SELECT'})
+        self.assertEqual(statements[-6:], ['INSERT', 'RELEASE'] + ['INSERT'] * 3 + ['RELEASE'])
+
+        # The response built from memory matches the stored trip
+        trip = response.json()
+        self.assertEqual(trip, TripSerializer(Trip.objects.get(id=trip['id'])).data)
+        self.assertEqual(trip['current_cycle_hours'], 0)
+
+        # Known stops are found by address alone and reused rather than
+        # inserted; only the trip's roadside stops are new rows
+        with self.assertNumQueries(9):
+            APIClient().post('/api/route-calculator/', self.STOPS, format='json')
+
+    @override_settings(ROUTING_BACKEND='estimate')
+    def test_roadside_stops_are_kept_out_of_lookups(self):
+        autocomplete_index.reset()
+        location_index.reset()
+        self.addCleanup(autocomplete_index.reset)
+        self.addCleanup(location_index.reset)
+        with mock.patch('api.planning.station_catalog', StationCatalog(stations=[])):
+            response = APIClient().post('/api/route-calculator/', self.STOPS, format='json')
+        self.assertEqual(response.status_code, 201)
+        trip = Trip.objects.get(id=response.json()['id'])
+        segments = list(trip.segments.select_related('start_location', 'end_location'))
+
+        roadside = list(Location.objects.filter(roadside=True))
+        self.assertTrue(roadside)
+        self.assertTrue(all(location.address.startswith('Roadside, route mile') for location in roadside))
+        self.assertEqual(len(roadside), sum(1 for segment in segments if segment.details))
+        # Not suggested, not found nearby and never reused for another stop
+        self.assertEqual(autocomplete_index.search('r'), [])
+        self.assertEqual([match.address for match in autocomplete_index.search('chi')], ['Chicago, IL'])
+        self.assertEqual(location_index.within(roadside[0].latitude, roadside[0].longitude, 0.1), [])
+        location, created = Location.objects.resolve('Customer yard', roadside[0].latitude, roadside[0].longitude)
+        self.assertTrue(created)
+        self.assertFalse(location.roadside)
+
+        # Driving resumes from where the previous stop was made
+        for previous, segment in zip(segments, segments[1:]):
+            if segment.segment_type == 'drive' and previous.details:
+                self.assertEqual(segment.start_location_id, previous.start_location_id)
+                self.assertTrue(segment.start_location.roadside)
+
+
+class RoutePreviewTests(TestCase):
+    STOPS = dict(TripPlanningTests.STOPS, startDateTime='2025-03-01T08:00:00Z')
+
+    def setUp(self):
+        preview_cache.clear()
+
+    def preview(self, data, **headers):
+        return APIClient().post('/api/route-calculator/?preview=true', data, format='json', **headers)
+
+    def test_preview_matches_a_saved_trip_without_touching_the_database(self):
+        with self.assertNumQueries(0):
+            response = self.preview(self.STOPS)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Trip.objects.count(), 0)
+        self.assertEqual(Location.objects.count(), 0)
+
+        preview = response.json()
+        saved = APIClient().post('/api/route-calculator/', self.STOPS, format='json').json()
+        self.assertIsNone(preview['id'])
+        self.assertEqual(preview.keys(), saved.keys())
+        for field in ('total_distance', 'total_duration', 'start_time', 'end_time'):
+            self.assertEqual(preview[field], saved[field])
+        self.assertEqual(
+            [(segment['segment_type'], segment['start_time']) for segment in preview['segments']],
+            [(segment['segment_type'], segment['start_time']) for segment in saved['segments']],
+        )
+
+    def test_repeat_previews_are_cached_by_input_hash(self):
+        with mock.patch('api.views.route_with_fallback', wraps=route_with_fallback) as routing:
+            first = self.preview(self.STOPS)
+            second = self.preview(self.STOPS)
+            self.assertEqual(routing.call_count, 1)
+            self.assertEqual(first.json(), second.json())
+            self.assertEqual(first['ETag'], second['ETag'])
+
+            unchanged = self.preview(self.STOPS, HTTP_IF_NONE_MATCH=first['ETag'])
+            self.assertEqual(unchanged.status_code, 304)
+
+            later = self.preview(dict(self.STOPS, startDateTime='2025-03-02T08:00:00Z'))
+            self.assertNotEqual(later['ETag'], first['ETag'])
+            self.assertEqual(routing.call_count, 2)
+
+@override_settings(USE_MOCK_DATA=False, GOOGLE_MAPS_API_KEY='test')
+class BatchPlanningTests(TestCase):
+    LANES = [
+        [{'address': 'Chicago, IL', 'latitude': 41.8781, 'longitude': -87.6298},
+         {'address': 'Indianapolis, IN', 'latitude': 39.7684, 'longitude': -86.1581, 'type': 'pickup'},
+         {'address': 'Columbus, OH', 'latitude': 39.9612, 'longitude': -82.9988}],
+        [{'address': 'Dallas, TX', 'latitude': 32.7767, 'longitude': -96.7970, 'type': 'pickup'},
+         {'address': 'Denver, CO', 'latitude': 39.7392, 'longitude': -104.9903}],
+    ]
+
+    def setUp(self):
+        directions_cache.memory.clear()
+
+    def directions(self, path, query):
+        return directions_response(query, meters=482803, seconds=18000)
+
+    def test_batch_dedupes_routing_and_reports_each_trip(self):
+        trips = [{'stops': self.LANES[n % 2], 'currentCycleHours': n % 10} for n in range(60)]
+        trips[7] = {'stops': self.LANES[0][:1]}
+        with FakeMapsServer(handler=self.directions) as server:
+            with mock.patch('api.directions.maps_client', server.client()):
+                response = APIClient().post('/api/route-calculator/batch/', {'trips': trips}, format='json')
+            # One Directions call per distinct route
+            self.assertEqual(server.hits, 2)
+
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([result['index'] for result in results], list(range(60)))
+        self.assertIn('stops', results[7]['error'])
+        planned = [result['trip'] for result in results if 'trip' in result]
+        self.assertEqual(len(planned), 59)
+        self.assertEqual(Trip.objects.count(), 59)
+        self.assertEqual(Location.objects.count(), 5)
+        self.assertEqual(planned[0]['pickup_location_address'], 'Indianapolis, IN')
+        self.assertAlmostEqual(planned[0]['total_distance'], 600, places=0)
+        self.assertEqual(planned[0]['segment_count'], Trip.objects.get(id=planned[0]['id']).segments.count())
+
+    @override_settings(ROUTING_BACKEND='estimate')
+    def test_async_batch_is_planned_by_a_worker(self):
+        trips = [{'stops': self.LANES[n % 2]} for n in range(4)]
+        response = APIClient().post('/api/route-calculator/batch/?async=true', {'trips': trips}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(Trip.objects.count(), 0)
+
+        call_command('run_jobs', '--once', '--processes', '1', stdout=StringIO())
+        result = APIClient().get(f"/api/jobs/{response.json()['job']['id']}/result/")
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual([result['index'] for result in result.json()['results']], list(range(4)))
+        self.assertEqual(Trip.objects.count(), 4)
+
+    def test_process_pool_matches_in_process_scheduling(self):
+        rng = random.Random(3)
+        jobs = [
+            ([(rng.uniform(50, 900), rng.uniform(60, 900)) for _ in range(3)], ['stop', 'pickup', 'dropoff', 'dropoff'],
+             DutyState(cycle=rng.uniform(0, 60) * 60), None)
+            for _ in range(PROCESS_POOL_MIN_TRIPS * 2)
+        ]
+        self.assertEqual(schedule_all(jobs, processes=2), schedule_all(jobs, processes=1))
+
+    def test_failed_chunk_does_not_fail_the_batch(self):
+        routes = [
+            TripRequest([(stop['address'], stop['latitude'], stop['longitude']) for stop in self.LANES[1]],
+                        ['pickup', 'dropoff'], timezone.now(), 0)
+        ] * 4
+        original = RouteSegment.objects.bulk_create
+        calls = []
+
+        def fail_first_chunk(objs, *args, **kwargs):
+            calls.append(len(objs))
+            if len(calls) == 1:
+                raise RuntimeError("disk full")
+            return original(objs, *args, **kwargs)
+
+        with mock.patch.object(RouteSegment.objects, 'bulk_create', side_effect=fail_first_chunk), \
+                override_settings(ROUTING_BACKEND='estimate'):
+            results = plan_trips(routes, chunk_size=2)
+
+        self.assertEqual([error is None for _, error in results], [False, False, True, True])
+        self.assertIn('disk full', results[0][1])
+        # The failed chunk rolled back completely
+        self.assertEqual(Trip.objects.count(), 2)
+
+
+def wiggly_line(start, end, count, wiggle=0.003, seed=1):
+    """
+    ``count`` points from ``start`` to ``end``, each moved up to ``wiggle`` degrees at random.
+    """
+    rng = random.Random(seed)
+    (lat1, lng1), (lat2, lng2) = start, end
+    points = [
+        (lat1 + (lat2 - lat1) * i / (count - 1) + rng.uniform(-wiggle, wiggle),
+         lng1 + (lng2 - lng1) * i / (count - 1) + rng.uniform(-wiggle, wiggle))
+        for i in range(count)
+    ]
+    points[0], points[-1] = start, end
+    return points
+
+
+class GeometryTests(SimpleTestCase):
+    def douglas_peucker(self, points, tolerance, scale):
+        """
+        Textbook recursive Douglas-Peucker, for comparison.
+        """
+        if len(points) < 3:
+            return list(points)
+        (lat1, lng1), (lat2, lng2) = points[0], points[-1]
+        dx, dy = (lng2 - lng1) * scale, lat2 - lat1
+        length = math.hypot(dx, dy)
+        deviations = [
+            abs(dy * (lng - lng1) * scale - dx * (lat - lat1)) / length
+            for lat, lng in points[1:-1]
+        ]
+        index = max(range(len(deviations)), key=deviations.__getitem__) + 1
+        if deviations[index - 1] <= tolerance:
+            return [points[0], points[-1]]
+        return self.douglas_peucker(points[:index + 1], tolerance, scale)[:-1] + \
+            self.douglas_peucker(points[index:], tolerance, scale)
+
+    def test_ranked_simplification_matches_douglas_peucker(self):
+        points = wiggly_line((40.0, -100.0), (41.0, -98.0), 500)
+        scale = math.cos(math.radians(sum(lat for lat, _ in points) / len(points)))
+        ranks = significance(points)
+        for zoom in ZOOM_LEVELS:
+            tolerance = pixel_degrees(zoom)
+            self.assertEqual(simplify(points, tolerance, ranks), self.douglas_peucker(points, tolerance, scale))
+
+    def test_cut_follows_the_line(self):
+        line = Line([(0.0, 0.0), (0.0, 1.0), (1.0, 1.0)])
+        self.assertEqual(line.cut(0, 1), [(0.0, 0.0), (0.0, 1.0), (1.0, 1.0)])
+        first, *middle, last = line.cut(0.25, 0.75)
+        self.assertAlmostEqual(first[1], 0.5, places=3)
+        self.assertEqual(middle, [(0.0, 1.0)])
+        self.assertAlmostEqual(last[0], 0.5, places=3)
+
+
+@override_settings(USE_MOCK_DATA=False, GOOGLE_MAPS_API_KEY='test')
+class RouteGeometryTests(TestCase):
+    # Chicago to Denver, roughly 1,000 miles
+    START, END = (41.8781, -87.6298), (39.7392, -104.9903)
+
+    def setUp(self):
+        directions_cache.memory.clear()
+        line = wiggly_line(self.START, self.END, 10000, wiggle=0.01)
+        half = len(line) // 2
+        self.steps = [{"polyline": {"points": encode(line[:half + 1])}}, {"polyline": {"points": encode(line[half:])}}]
+        self.line = line
+
+    def directions(self, path, query):
+        leg = {"distance": {"value": 1609340}, "duration": {"value": 60000}, "steps": self.steps}
+        return {"status": "OK", "routes": [{"legs": [leg], "overview_polyline": {"points": ""}}]}
+
+    def test_segments_store_their_stretch_of_the_route_at_each_zoom(self):
+        stops = [
+            {'address': 'Chicago, IL', 'latitude': self.START[0], 'longitude': self.START[1]},
+            {'address': 'Denver, CO', 'latitude': self.END[0], 'longitude': self.END[1]},
+        ]
+        with FakeMapsServer(handler=self.directions) as server:
+            with mock.patch('api.directions.maps_client', server.client()):
+                trip = APIClient().post('/api/route-calculator/', {'stops': stops}, format='json').json()
+
+        url = f"/api/trips/{trip['id']}/geometry/"
+        full = APIClient().get(url, {'decode': 'true'}).json()['segments']
+        # 1000 miles is split into several drive segments that join end to end
+        self.assertGreater(len(full), 1)
+        for previous, segment in zip(full, full[1:]):
+            self.assertEqual(previous['coordinates'][-1], segment['coordinates'][0])
+        self.assertEqual(tuple(full[0]['coordinates'][0]), self.START)
+        self.assertEqual(tuple(full[-1]['coordinates'][-1]), self.END)
+        self.assertGreater(sum(len(segment['coordinates']) for segment in full), len(self.line))
+
+        sizes = {}
+        for zoom in (4, 6, 8, 13):
+            response = APIClient().get(url, {'zoom': zoom})
+            sizes[zoom] = len(response.content)
+        self.assertLessEqual(sizes[4], sizes[6])
+        self.assertLess(sizes[6], sizes[8])
+        self.assertLess(sizes[6], 3000)
+        self.assertGreater(sizes[13], 10 * sizes[6])
+
+        # Reading the trip does not load any geometry
+        with CaptureQueriesContext(connection) as queries:
+            APIClient().get(f"/api/trips/{trip['id']}/")
+        self.assertFalse(any('geometry' in query['sql'] for query in queries.captured_queries))
+
+class RoadGraphTests(TestCase):
+    def grid_graph(self, size=12):
+        """
+        A ``size`` x ``size`` lattice of nodes 0.5 degrees apart with randomly slow roads.
+        """
+        rng = random.Random(3)
+        latitudes, longitudes, edges = [], [], []
+        for row in range(size):
+            for column in range(size):
+                latitudes.append(35 + row * 0.5)
+                longitudes.append(-100 + column * 0.5)
+                node = row * size + column
+                if column:
+                    edges.append((node - 1, node, 30.0, rng.uniform(30, 90)))
+                if row:
+                    edges.append((node - size, node, 35.0, rng.uniform(30, 90)))
+        path = os.path.join(tempfile.mkdtemp(), 'grid.bin')
+        write_graph(path, latitudes, longitudes, edges, landmark_count=4)
+        return RoadGraph(path)
+
+    def test_a_star_with_landmarks_matches_dijkstra(self):
+        graph = self.grid_graph()
+        graph.nearest_node(35, -100)
+        for source in (0, 17, 80):
+            times = shortest_durations(graph.offsets, graph.targets, graph.durations, source)
+            for target in range(0, 144, 7):
+                nodes, minutes = graph.shortest_path(source, target)
+                self.assertEqual((nodes[0], nodes[-1]), (source, target))
+                self.assertAlmostEqual(minutes, times[target], places=3)
+
+    def test_bundled_graph_routes_deterministically(self):
+        chicago, indianapolis = (41.8781, -87.6298), (39.7684, -86.1581)
+        first = road_graph.route(chicago, indianapolis)
+        second = road_graph.route(chicago, indianapolis)
+
+        self.assertEqual(first, second)
+        self.assertGreater(first.distance, 160)
+        self.assertLess(first.distance, 220)
+        points = decode(first.geometry)
+        self.assertEqual((points[0], points[-1]), (chicago, indianapolis))
+
+    @override_settings(ROUTING_BACKEND='graph')
+    def test_route_calculator_uses_the_graph_backend(self):
+        points = [(41.8781, -87.6298), (39.7684, -86.1581), (39.9612, -82.9988)]
+        stops = {'stops': [{'latitude': latitude, 'longitude': longitude} for latitude, longitude in points]}
+
+        first = APIClient().post('/api/route-calculator/', stops, format='json').json()
+        second = APIClient().post('/api/route-calculator/', stops, format='json').json()
+
+        self.assertEqual(first['total_distance'], second['total_distance'])
+        self.assertAlmostEqual(first['total_distance'], sum(leg.distance for leg in road_graph.route_legs(points)))
+
+
+class EstimateTests(TestCase):
+    def test_estimates_are_deterministic_and_match_the_batch_form(self):
+        points = [(41.8781, -87.6298), (41.8800, -87.6300), (41.5934, -87.3464), (39.7684, -86.1581)]
+        legs = estimate_legs(points)
+
+        self.assertEqual(legs, estimate_legs(points))
+        distances, durations = estimate_many(*zip(*[(a[0], a[1], b[0], b[1]) for a, b in zip(points, points[1:])]))
+        self.assertEqual([leg.distance for leg in legs], list(distances))
+        self.assertEqual([leg.duration for leg in legs], list(durations))
+        # Short legs at urban speed, long ones mostly at highway speed
+        self.assertAlmostEqual(legs[0].duration, legs[0].distance / 25 * 60)
+        self.assertAlmostEqual(legs[2].duration, 10 / 25 * 60 + 40 / 45 * 60 + (legs[2].distance - 50) / 55 * 60)
+        self.assertAlmostEqual(legs[2].distance, haversine_miles(*points[2], *points[3]) * 1.2)
+
+    def test_batch_throughput(self):
+        rng = random.Random(5)
+        columns = [[rng.uniform(30, 45) if i % 2 == 0 else rng.uniform(-120, -75) for _ in range(20000)] for i in range(4)]
+        started = time.perf_counter()
+        distances, durations = estimate_many(*columns)
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(len(distances), 20000)
+        self.assertLess(elapsed, 0.2)
+
+    def test_mock_routes_are_repeatable(self):
+        stops = {
+            'currentLocation': {'address': 'Chicago, IL', 'latitude': 41.8781, 'longitude': -87.6298},
+            'pickupLocation': {'address': 'Indianapolis, IN', 'latitude': 39.7684, 'longitude': -86.1581},
+            'dropoffLocation': {'address': 'Columbus, OH', 'latitude': 39.9612, 'longitude': -82.9988},
+        }
+        first = APIClient().post('/api/route-calculator/', stops, format='json').json()
+        second = APIClient().post('/api/route-calculator/', stops, format='json').json()
+
+        self.assertEqual(first['total_distance'], second['total_distance'])
+        self.assertEqual(first['total_duration'], second['total_duration'])
+
+
+class FuelStopTests(TestCase):
+    # A straight east-west route along the 40th parallel, 1500 road miles long
+    WEST, EAST = (40.0, -100.0), (40.0, -72.0)
+
+    def route_line(self):
+        return RouteLine([DirectionsResult(1500, 1500, encode([self.WEST, self.EAST]))], [self.WEST, self.EAST])
+
+    def test_route_line_maps_route_miles_to_points(self):
+        legs = [DirectionsResult(200, 200, ''), DirectionsResult(100, 100, encode([(40.0, -98.0), (41.0, -98.0)]))]
+        line = RouteLine(legs, [(40.0, -100.0), (40.0, -98.0), (41.0, -98.0)])
+
+        self.assertEqual(line.length, 300)
+        self.assertEqual(line.point_at(0), (40.0, -100.0))
+        self.assertAlmostEqual(line.point_at(100)[1], -99.0)
+        self.assertAlmostEqual(line.point_at(250)[0], 40.5)
+        self.assertEqual(line.point_at(300), (41.0, -98.0))
+
+    def test_picks_the_closest_truck_stop_in_the_window(self):
+        line = self.route_line()
+        (far_lat, far_lng), (near_lat, near_lng) = line.point_at(990), line.point_at(930)
+        catalog = StationCatalog(stations=[
+            # Four miles off the route, and about one
+            Station('truck_stop', 'Far', far_lat + 4 / 69.05, far_lng),
+            Station('truck_stop', 'Before window', *line.point_at(700)),
+            Station('rest_area', 'No diesel', *line.point_at(995)),
+            Station('truck_stop', 'Near', near_lat + 1 / 69.05, near_lng),
+        ])
+
+        stops = plan_fuel_stops(line, 1000, window=150, radius=5, catalog=catalog)
+        self.assertEqual(len(stops), 1)
+        stop = stops[0]
+        self.assertEqual(stop.station.name, 'Near')
+        self.assertAlmostEqual(stop.route_mile, 930, delta=5)
+        off_route = haversine_miles(stop.station.latitude, stop.station.longitude, *line.point_at(stop.route_mile))
+        self.assertEqual((stop.detour_miles, stop.detour_minutes), detour(off_route))
+
+    def test_fuels_at_the_mark_without_a_station(self):
+        stops = plan_fuel_stops(self.route_line(), 600, catalog=StationCatalog(stations=[]))
+        self.assertEqual(stops, [FuelStop(600, None, 0.0, 0.0), FuelStop(1200, None, 0.0, 0.0)])
+
+    def test_search_is_sub_millisecond_per_stop_with_fifty_thousand_stations(self):
+        rng = random.Random(11)
+        catalog = StationCatalog(stations=[
+            Station('truck_stop', f"Station {i}", rng.uniform(25, 49), rng.uniform(-124, -67)) for i in range(50000)
+        ])
+        line = RouteLine([DirectionsResult(4500, 4500, encode([(33.0, -117.0), (45.0, -70.0)]))],
+                         [(33.0, -117.0), (45.0, -70.0)])
+        stops = plan_fuel_stops(line, 1000, catalog=catalog)
+        self.assertEqual(len(stops), 4)
+        self.assertTrue(all(stop.station for stop in stops))
+
+        timings = []
+        for _ in range(20):
+            started = time.perf_counter()
+            plan_fuel_stops(line, 1000, catalog=catalog)
+            timings.append((time.perf_counter() - started) / len(stops))
+        timings.sort()
+        self.assertLess(timings[len(timings) // 2], 0.001)
+
+    @override_settings(ROUTING_BACKEND='graph')
+    def test_fuel_segments_are_made_at_catalog_stations(self):
+        stops = {'stops': [
+            {'address': 'Chicago, IL', 'latitude': 41.8781, 'longitude': -87.6298, 'type': 'pickup'},
+            {'address': 'Los Angeles, CA', 'latitude': 34.0522, 'longitude': -118.2437},
+        ]}
+        trip = APIClient().post('/api/route-calculator/', stops, format='json').json()
+
+        fuel = [segment for segment in trip['segments'] if segment['segment_type'] == 'fuel']
+        self.assertEqual(len(fuel), 2)
+        for segment in fuel:
+            station = segment['details']['station']
+            self.assertEqual(segment['start_location']['address'], station['name'])
+            self.assertEqual(segment['duration'], round(30 + segment['details']['detour_minutes']))
+            self.assertLess(segment['details']['route_mile'], 1000 * (fuel.index(segment) + 1))
+        # Drive segments still add up to the route
+        self.assertAlmostEqual(
+            sum(segment['distance'] for segment in trip['segments'] if segment['segment_type'] == 'drive'),
+            trip['total_distance'], places=3,
+        )
+
+
+class RestPlacementTests(SimpleTestCase):
+    WEST, EAST = (40.0, -100.0), (40.0, -72.0)
+
+    def setUp(self):
+        self.line = RouteLine([DirectionsResult(1500, 1500, encode([self.WEST, self.EAST]))], [self.WEST, self.EAST])
+        self.plan = schedule(leg_times(self.line.legs), ['pickup', 'dropoff'], fuel_stops=[(1000, 0)])
+
+    def test_rests_are_taken_at_the_nearest_station(self):
+        (break_lat, break_lng), (rest_lat, rest_lng) = self.line.point_at(480), self.line.point_at(660)
+        catalog = StationCatalog(stations=[
+            Station('rest_area', 'Rest Area', break_lat + 3 / 69.05, break_lng),
+            Station('truck_stop', 'Truck Stop', break_lat - 6 / 69.05, break_lng),
+            Station('truck_stop', 'Too far', rest_lat + 40 / 69.05, rest_lng),
+        ])
+        places = place_segments(self.line, self.plan, [FuelStop(1000, None, 0.0, 0.0)], radius=25, catalog=catalog)
+
+        placed = {(segment.kind, round(segment.mile)): place for segment, place in zip(self.plan, places) if place}
+        self.assertEqual(set(placed), {('rest', 480), ('sleep', 660), ('fuel', 1000), ('sleep', 1320)})
+        # Drive segments and the pickup and dropoff stay at the trip's stops
+        self.assertEqual({segment.kind for segment, place in zip(self.plan, places) if not place},
+                         {'pickup', 'drive', 'dropoff'})
+
+        self.assertEqual(placed['rest', 480].address, 'Rest Area')
+        self.assertEqual(placed['rest', 480].details['route_mile'], 480)
+        self.assertAlmostEqual(placed['rest', 480].details['off_route_miles'], 3, delta=0.1)
+        # Nothing within the radius: the rest is taken where it falls due
+        self.assertEqual(placed['sleep', 660].address, 'Roadside, route mile 660')
+        self.assertEqual(placed['sleep', 660][1:3], (rest_lat, rest_lng))
+        self.assertIsNone(placed['sleep', 660].details['station'])
+        self.assertEqual(placed['fuel', 1000].address, 'Roadside, route mile 1000')
+
+    def test_placement_is_one_lookup_per_stop_with_fifty_thousand_stations(self):
+        rng = random.Random(13)
+        catalog = StationCatalog(stations=[
+            Station(rng.choice(('truck_stop', 'rest_area')), f"Station {i}", rng.uniform(25, 49), rng.uniform(-124, -67))
+            for i in range(50000)
+        ])
+        fuel_stops = [FuelStop(1000, None, 0.0, 0.0)]
+        places = place_segments(self.line, self.plan, fuel_stops, catalog=catalog)
+        rests = [place for segment, place in zip(self.plan, places) if segment.kind in ('rest', 'sleep')]
+        self.assertEqual(len(rests), 3)
+        self.assertTrue(all(place.details['station'] for place in rests))
+
+        timings = []
+        for _ in range(50):
+            started = time.perf_counter()
+            place_segments(self.line, self.plan, fuel_stops, catalog=catalog)
+            timings.append((time.perf_counter() - started) / len(rests))
+        timings.sort()
+        self.assertLess(timings[len(timings) // 2], 0.0002)
+
+
+class EldGenerationTests(TestCase):
+    def make_trip(self, days=14, count=200):
+        start = timezone.now().replace(hour=6, minute=0, second=0, microsecond=0)
+        places = [Location.objects.create(address=f"Stop {i}", latitude=40.0, longitude=-100.0 + i) for i in range(3)]
+        trip = Trip.objects.create(
+            current_location=places[0], pickup_location=places[1], dropoff_location=places[2],
+            current_cycle_hours=0, total_distance=0, total_duration=0,
+            start_time=start, end_time=start + timedelta(days=days - 1),
+        )
+        minutes = (days - 1) * 24 * 60 / count
+        kinds = ['drive', 'rest', 'drive', 'fuel', 'sleep']
+        RouteSegment.objects.bulk_create([
+            RouteSegment(
+                trip=trip, segment_type=kinds[i % len(kinds)],
+                start_location=places[i % 3], end_location=places[(i + 1) % 3],
+                duration=round(minutes), start_time=start + timedelta(minutes=i * minutes),
+                end_time=start + timedelta(minutes=(i + 1) * minutes),
+            )
+            for i in range(count)
+        ])
+        return trip
+
+    def test_sweep_matches_scanning_every_day(self):
+        rng = random.Random(17)
+        base = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+        Span = namedtuple('Span', ['start_time', 'end_time'])
+        spans = []
+        for _ in range(300):
+            start = base + timedelta(minutes=rng.uniform(0, 20 * 24 * 60))
+            spans.append(Span(start, start + timedelta(minutes=rng.uniform(0, 3 * 24 * 60))))
+        spans.sort()
+
+        first, last = base.date(), (base + timedelta(days=24)).date()
+        for date, day_start, day_end, day_spans in split_days(spans, first, last):
+            self.assertEqual((day_start, day_end), day_bounds(date))
+            self.assertEqual(day_spans, [
+                span for span in spans if span.start_time <= day_end and span.end_time >= day_start
+            ])
+
+    def test_long_trip_is_generated_in_a_handful_of_queries(self):
+        trip = self.make_trip()
+        with CaptureQueriesContext(connection) as queries:
+            logs = generate_eld_logs(trip.id)['logs']
+        self.assertLessEqual(len(queries), 10)
+
+        self.assertEqual(len(logs), 14)
+        self.assertEqual(DailyLog.objects.filter(trip=trip).count(), 14)
+        # Segments crossing midnight are split between the two days
+        entries = [entry for log in logs for entry in log['entries']]
+        self.assertEqual(LogEntry.objects.filter(daily_log__trip=trip).count(), len(entries))
+        self.assertGreater(len(entries), 200)
+        self.assertEqual(logs[0]['entries'][0]['location'], 'Stop 0')
+        self.assertEqual({entry['status'] for entry in entries}, {'D', 'OFF', 'SB', 'ON'})
+        for log in logs:
+            for entry in log['entries']:
+                self.assertEqual(entry['start_time'][:10], log['date'])
+                self.assertEqual(entry['end_time'][:10], log['date'])
+
+        # A full regeneration replaces the logs
+        generate_eld_logs(trip.id, full=True)
+        self.assertEqual(DailyLog.objects.filter(trip=trip).count(), 14)
+
+    def test_breaks_are_off_duty_and_resets_in_the_sleeper_berth(self):
+        self.assertEqual([duty_status(kind) for kind in (BREAK, RESET, 'drive', 'fuel')], ['OFF', 'SB', 'D', 'ON'])
+        trip = self.make_trip(days=2, count=10)
+        generate_eld_logs(trip.id)
+        statuses = {
+            (entry.segment.segment_type, entry.status)
+            for entry in LogEntry.objects.filter(daily_log__trip=trip, segment__isnull=False).select_related('segment')
+        }
+        self.assertEqual(statuses, {('drive', 'D'), ('rest', 'OFF'), ('fuel', 'ON'), ('sleep', 'SB')})
+
+    def test_endpoint_queues_a_job(self):
+        trip = self.make_trip(days=3, count=20)
+        response = APIClient().post('/api/trips/generate_eld_logs/', {'trip_id': trip.id}, format='json')
+        self.assertEqual(response.status_code, 202)
+        job = response.json()['job']
+        self.assertEqual((job['kind'], job['status']), ('generate_eld_logs', Job.QUEUED))
+        self.assertFalse(DailyLog.objects.filter(trip=trip).exists())
+        self.assertEqual(APIClient().get(f"/api/jobs/{job['id']}/result/").status_code, 202)
+
+        call_command('run_jobs', '--once', '--processes', '1', stdout=StringIO())
+        result = APIClient().get(f"/api/jobs/{job['id']}/result/")
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(len(result.json()['logs']), 3)
+        self.assertEqual(APIClient().get(f"/api/jobs/{job['id']}/").json()['status'], Job.SUCCEEDED)
+
+        missing = APIClient().post('/api/trips/generate_eld_logs/', {'trip_id': trip.id + 1}, format='json')
+        self.assertEqual(missing.status_code, 404)
+
+    def test_merged_locations_are_picked_up_by_regeneration(self):
+        trip = self.make_trip(days=4, count=40)
+        generate_eld_logs(trip.id)
+        # A later duplicate of the trip's first stop, a few yards away, used by one segment
+        original = trip.current_location
+        duplicate = Location.objects.create(address="Stop 0 (dup)", latitude=40.0001, longitude=-100.0)
+        segment = trip.segments.filter(start_location=original).order_by('start_time')[5]
+        RouteSegment.objects.filter(id=segment.id).update(start_location=duplicate, updated_at=timezone.now())
+        generate_eld_logs(trip.id)
+        self.assertTrue(LogEntry.objects.filter(segment=segment, location="Stop 0 (dup)").exists())
+
+        call_command('dedupe_locations', stdout=StringIO())
+        self.assertFalse(Location.objects.filter(id=duplicate.id).exists())
+        segment.refresh_from_db()
+        self.assertEqual(segment.start_location_id, original.id)
+
+        logs = generate_eld_logs(trip.id)['logs']
+        self.assertFalse(LogEntry.objects.filter(location="Stop 0 (dup)").exists())
+        self.assertEqual(LogEntry.objects.get(segment=segment).location, "Stop 0")
+        generate_eld_logs(trip.id, full=True)
+        self.assertEqual(sum(len(log['entries']) for log in logs), LogEntry.objects.filter(daily_log__trip=trip).count())
+
+    def stored_logs(self, trip):
+        return {
+            daily_log.date: (
+                daily_log.start_odometer,
+                [(entry.id, entry.segment_id, entry.status, entry.start_time, entry.end_time, entry.location)
+                 for entry in daily_log.entries.order_by('start_time', 'id')],
+            )
+            for daily_log in DailyLog.objects.filter(trip=trip)
+        }
+
+    def without_ids(self, logs):
+        return {date: (odometer, [entry[1:] for entry in entries]) for date, (odometer, entries) in logs.items()}
+
+    def test_regeneration_only_touches_changed_days(self):
+        trip = self.make_trip()
+
+        def generate():
+            return generate_eld_logs(trip.id)
+
+        generate()
+        before = self.stored_logs(trip)
+
+        # Nothing changed: no entries are written
+        with CaptureQueriesContext(connection) as queries:
+            generate()
+        writes = [query['sql'].split()[0] for query in queries.captured_queries]
+        self.assertNotIn('INSERT', writes)
+        self.assertNotIn('DELETE', writes)
+        self.assertEqual(self.stored_logs(trip), before)
+
+        # Shorten a mid-trip stop and delete another on a different day
+        segments = list(trip.segments.order_by('start_time'))
+        edited, deleted = segments[100], segments[150]
+        edited.end_time -= timedelta(minutes=30)
+        edited.segment_type = 'pickup'
+        edited.save()
+        deleted.delete()
+        dirty = {edited.start_time.date(), edited.end_time.date(), deleted.start_time.date(), deleted.end_time.date()}
+
+        with CaptureQueriesContext(connection) as queries:
+            logs = generate()['logs']
+        self.assertLessEqual(len(queries), 14)
+        # Only the edited entry is updated and the deleted one removed
+        writes = [query['sql'].split()[0] for query in queries.captured_queries]
+        self.assertEqual((writes.count('INSERT'), writes.count('DELETE')), (0, 1))
+        after = self.stored_logs(trip)
+        # Other days keep their rows untouched
+        for date in set(before) - dirty:
+            self.assertEqual(after[date], before[date])
+        # The result matches generating from scratch
+        self.assertEqual(len(logs), 14)
+        self.assertEqual(sum(len(log['entries']) for log in logs), sum(len(entries) for _, entries in after.values()))
+        generate_eld_logs(trip.id, full=True)
+        self.assertEqual(self.without_ids(self.stored_logs(trip)), self.without_ids(after))
+
+
+class JobQueueTests(TestCase):
+    def test_a_job_is_claimed_once(self):
+        job = enqueue('generate_eld_logs', trip_id=1)
+        claimed = claim('worker-a')
+        self.assertEqual((claimed.id, claimed.status, claimed.worker, claimed.attempts), (job.id, Job.RUNNING, 'worker-a', 1))
+        self.assertIsNone(claim('worker-b'))
+
+    def test_failures_are_recorded(self):
+        job = enqueue('generate_eld_logs', trip_id=12345)
+        self.assertEqual(run(claim('worker-a')), Job.FAILED)
+        job.refresh_from_db()
+        self.assertEqual(job.error, "Trip with ID 12345 not found")
+        self.assertIsNotNone(job.finished_at)
+
+        result = APIClient().get(f"/api/jobs/{job.id}/result/")
+        self.assertEqual(result.status_code, 409)
+        self.assertEqual(result.json()['error'], job.error)
+
+    @override_settings(JOB_TIMEOUT=60, JOB_MAX_ATTEMPTS=2)
+    def test_timed_out_jobs_are_reclaimed(self):
+        job = enqueue('generate_eld_logs', trip_id=12345)
+        stale = claim('worker-a')
+        self.assertIsNone(claim('worker-b'))
+        Job.objects.filter(id=job.id).update(started_at=timezone.now() - timedelta(minutes=2))
+
+        reclaimed = claim('worker-b')
+        self.assertEqual((reclaimed.worker, reclaimed.attempts), ('worker-b', 2))
+        # The first worker finishing late does not overwrite the new run
+        run(stale)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.RUNNING)
+
+        # Past the attempt limit the job is given up
+        Job.objects.filter(id=job.id).update(started_at=timezone.now() - timedelta(minutes=2))
+        self.assertEqual(run(claim('worker-c')), Job.FAILED)
+        job.refresh_from_db()
+        self.assertEqual((job.worker, job.error), ('worker-c', "Gave up after 2 attempts"))
+
+    def test_clear_tables_removes_jobs(self):
+        enqueue('generate_eld_logs', trip_id=1)
+        call_command('clear_tables', stdout=StringIO())
+        self.assertFalse(Job.objects.exists())
+        self.assertEqual(enqueue('generate_eld_logs', trip_id=1).id, 1)
+
+
+def png_pixels(content):
+    """
+    Width, height and palette indices (row by row) of an unfiltered palette PNG.
+    """
+    assert content.startswith(b'\x89PNG\r\n\x1a\n')
+    chunks, position = {}, 8
+    while position < len(content):
+        length = int.from_bytes(content[position:position + 4], 'big')
+        kind = content[position + 4:position + 8]
+        chunks[kind] = chunks.get(kind, b'') + content[position + 8:position + 8 + length]
+        position += length + 12
+    width, height = int.from_bytes(chunks[b'IHDR'][:4], 'big'), int.from_bytes(chunks[b'IHDR'][4:8], 'big')
+    raw = zlib.decompress(chunks[b'IDAT'])
+    return width, height, [raw[y * (width + 1) + 1:(y + 1) * (width + 1)] for y in range(height)]
+
+
+class LogGraphTests(TestCase):
+    DATE = datetime(2026, 3, 2).date()
+
+    def entries(self, *spans):
+        base = datetime(2026, 3, 2, tzinfo=dt_timezone.utc)
+        return [
+            (status, base + timedelta(hours=start), base + timedelta(hours=end))
+            for status, start, end in spans
+        ]
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        patcher = mock.patch('api.loggraph.graph_cache', GraphCache(self.directory.name, 100, max_bytes=10 ** 6))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_png_draws_the_duty_line(self):
+        entries = self.entries(('OFF', 0, 6), ('D', 6, 17), ('SB', 17, 24))
+        width, height, rows = png_pixels(render_png(self.DATE, entries))
+        self.assertEqual((width, height), (WIDTH, HEIGHT))
+        # Duty line pixels (palette index 3) on the driving row span 11 hours,
+        # plus the outer pixels of the two 3-pixel connectors
+        driving = rows[row_y(2)]
+        self.assertEqual(driving.count(3), 11 * 36 + 1 + 2)
+        self.assertNotIn(3, rows[row_y(3)])
+
+        svg = render_svg(self.DATE, entries).decode()
+        self.assertIn('<polyline', svg)
+        self.assertIn('>11:00</text>', svg)
+        self.assertIn('>07:00</text>', svg)
+
+    def test_graphs_are_cached_by_their_entries(self):
+        entries = self.entries(('OFF', 0, 8), ('ON', 8, 24))
+        key = graph_key(self.DATE, entries)
+        self.assertEqual(key, graph_key(self.DATE, list(entries)))
+        self.assertNotEqual(key, graph_key(self.DATE, entries[:1]))
+
+        content = log_graph(self.DATE, entries, 'png')
+        with mock.patch('api.loggraph.render_png') as render:
+            # From memory, then from disk in another process
+            self.assertEqual(log_graph(self.DATE, entries, 'png'), content)
+            other = GraphCache(self.directory.name, 100, max_bytes=10 ** 6)
+            self.assertEqual(log_graph(self.DATE, entries, 'png', cache=other), content)
+        render.assert_not_called()
+
+    def test_threads_writing_the_same_graph_do_not_collide(self):
+        cache = GraphCache(self.directory.name, 100, max_bytes=10 ** 6)
+        content = render_png(self.DATE, self.entries(('OFF', 0, 24))) * 50
+        barrier = threading.Barrier(8)
+
+        def write():
+            barrier.wait()
+            for _ in range(20):
+                cache.set('abcdef.png', content)
+
+        with self.assertNoLogs('api.loggraph', level='WARNING'):
+            threads = [threading.Thread(target=write) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(cache.path('abcdef.png').read_bytes(), content)
+        self.assertEqual(os.listdir(cache.path('abcdef.png').parent), ['abcdef.png'])
+
+    def test_disk_tier_evicts_the_least_recently_used_graphs(self):
+        cache = GraphCache(self.directory.name, 100, max_bytes=1000)
+        now = time.time()
+        for age, name in ((30, 'aa.png'), (20, 'bb.png'), (10, 'cc.png')):
+            cache.set(name, b'x' * 300)
+            os.utime(cache.path(name), (now - age, now - age))
+        self.assertEqual(cache.disk_bytes, 900)
+
+        # Read by another process, so now the most recently used
+        other = GraphCache(self.directory.name, 100, max_bytes=1000)
+        self.assertEqual(other.get('aa.png'), b'x' * 300)
+        cache.set('dd.png', b'x' * 300)
+
+        remaining = sorted(path.name for path in Path(self.directory.name).glob('*/*'))
+        self.assertEqual(remaining, ['aa.png', 'dd.png'])
+        self.assertEqual(cache.disk_bytes, 600)
+        self.assertIsNone(other.get('bb.png'))
+
+    def test_endpoint_serves_graphs_with_strong_etags(self):
+        place = Location.objects.create(address="Stop", latitude=40.0, longitude=-100.0)
+        start = datetime(2026, 3, 2, tzinfo=dt_timezone.utc)
+        trip = Trip.objects.create(
+            current_location=place, pickup_location=place, dropoff_location=place,
+            current_cycle_hours=0, total_distance=0, total_duration=0, start_time=start, end_time=start,
+        )
+        daily_log = DailyLog.objects.create(
+            trip=trip, date=self.DATE, driver_name="Driver", carrier_name="Carrier", truck_number="T",
+            trailer_number="R", start_odometer=0, end_odometer=0, total_miles=0,
+        )
+        LogEntry.objects.bulk_create([
+            LogEntry(daily_log=daily_log, status=status, start_time=start_time, end_time=end_time, location="Stop")
+            for status, start_time, end_time in self.entries(('OFF', 0, 7), ('D', 7, 15), ('SB', 15, 24))
+        ])
+
+        client = APIClient()
+        response = client.get(f'/api/daily-logs/{daily_log.id}/graph.svg')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+        etag = response['ETag']
+        self.assertFalse(etag.startswith('W/'))
+
+        png = client.get(f'/api/daily-logs/{daily_log.id}/graph.png')
+        self.assertEqual(png['Content-Type'], 'image/png')
+        self.assertNotEqual(png['ETag'], etag)
+        self.assertEqual(png_pixels(png.content)[:2], (WIDTH, HEIGHT))
+
+        url = f'/api/daily-logs/{daily_log.id}/graph.svg'
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        for header in (f'"other", W/{etag}', '*'):
+            self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=header).status_code, 304, header)
+        # Tags merely containing this one, or with a suffix, do not match
+        for header in (f'"x{etag[1:]}', etag[:-1] + '-2"', f'"{etag}"'):
+            self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=header).status_code, 200, header)
+        entry = daily_log.entries.order_by('start_time').first()
+        entry.status = 'ON' if entry.status != 'ON' else 'OFF'
+        entry.save()
+        changed = client.get(f'/api/daily-logs/{daily_log.id}/graph.svg', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+
+        self.assertEqual(client.get('/api/daily-logs/999999/graph.svg').status_code, 404)
+
+    def test_a_month_renders_in_under_a_second(self):
+        rng = random.Random(5)
+        days = []
+        for _ in range(31):
+            spans, hour = [], 0.0
+            while hour < 24:
+                end = min(24.0, hour + rng.uniform(0.25, 4))
+                spans.append((rng.choice(['OFF', 'SB', 'D', 'ON']), hour, end))
+                hour = end
+            days.append(self.entries(*spans))
+        started = time.perf_counter()
+        for entries in days:
+            render_svg(self.DATE, entries)
+            render_png(self.DATE, entries)
+        self.assertLess(time.perf_counter() - started, 1.0)
+
+
+def pdf_objects(content):
+    """
+    Check a PDF's cross-reference table and return its objects by number.
+    """
+    assert content.startswith(b'%PDF-1.4') and content.endswith(b'%%EOF\n')
+    xref = int(content[content.rindex(b'startxref') + 10:].split()[0])
+    lines = content[xref:].split(b'\n')
+    count = int(lines[1].split()[1])
+    objects = {}
+    for number in range(1, count):
+        offset = int(lines[2 + number].split()[0])
+        assert content.startswith(b'%d 0 obj' % number, offset)
+        objects[number] = content[offset:content.index(b'endobj', offset)]
+    return objects
+
+
+def pdf_text(objects):
+    """
+    The decompressed content streams of a PDF's objects, in object order.
+    """
+    return [
+        zlib.decompress(body[body.index(b'stream\n') + 7:body.rindex(b'\nendstream')]).decode('latin-1')
+        for _, body in sorted(objects.items()) if b'/FlateDecode' in body
+    ]
+
+
+class LogExportTests(TestCase):
+    def make_logs(self, days, entries_per_day=6):
+        place = Location.objects.create(address="Stop", latitude=40.0, longitude=-100.0)
+        start = datetime(2026, 3, 1, tzinfo=dt_timezone.utc)
+        trip = Trip.objects.create(
+            current_location=place, pickup_location=place, dropoff_location=place,
+            current_cycle_hours=0, total_distance=0, total_duration=0,
+            start_time=start, end_time=start + timedelta(days=days - 1),
+        )
+        logs = DailyLog.objects.bulk_create([
+            DailyLog(
+                trip=trip, date=(start + timedelta(days=day)).date(), driver_name="Pat (Driver)",
+                carrier_name="Carrier", truck_number="T-1", trailer_number="R-1",
+                start_odometer=day * 500, end_odometer=(day + 1) * 500, total_miles=500,
+            )
+            for day in range(days)
+        ])
+        minutes = 24 * 60 // entries_per_day
+        LogEntry.objects.bulk_create([
+            LogEntry(
+                daily_log=daily_log, status=['OFF', 'D', 'ON', 'SB'][number % 4],
+                start_time=start + timedelta(days=day, minutes=number * minutes),
+                end_time=start + timedelta(days=day, minutes=(number + 1) * minutes),
+                location=f"Mile {number}", remarks="Segment",
+            )
+            for day, daily_log in enumerate(logs)
+            for number in range(entries_per_day)
+        ])
+        return trip
+
+    def test_exports_one_page_per_log(self):
+        trip = self.make_logs(8)
+        response = APIClient().get(f'/api/daily-logs/export.pdf?trip_id={trip.id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(response.streaming)
+
+        objects = pdf_objects(b''.join(response.streaming_content))
+        pages = [body for body in objects.values() if b'/Type /Page ' in body]
+        self.assertEqual(len(pages), 8)
+        self.assertIn(b'/Count 8', next(body for body in objects.values() if b'/Type /Pages' in body))
+        first = pdf_text(objects)[0]
+        self.assertIn("(Driver's Daily Log - 2026-03-01 \\(UTC\\))", first)
+        self.assertIn("Pat \\(Driver\\)", first)
+        self.assertIn("(Mile 5)", first)
+
+        # A date range within the trip
+        response = APIClient().get('/api/daily-logs/export.pdf?start_date=2026-03-03&end_date=2026-03-04')
+        pages = [body for body in pdf_objects(b''.join(response.streaming_content)).values() if b'/Type /Page ' in body]
+        self.assertEqual(len(pages), 2)
+
+    def test_streams_under_asgi(self):
+        trip = self.make_logs(3)
+        url = f'/api/daily-logs/export.pdf?trip_id={trip.id}'
+        expected = b''.join(APIClient().get(url).streaming_content)
+
+        async def fetch():
+            response = await AsyncClient().get(url)
+            # An async iterator, which ASGI handlers send as it is produced
+            self.assertTrue(response.is_async)
+            return [chunk async for chunk in response.streaming_content]
+
+        chunks = async_to_sync(fetch)()
+        self.assertTrue(chunks[0].startswith(b'%PDF'))
+        self.assertGreater(len(chunks), 3 * 2)
+        self.assertEqual(b''.join(chunks), expected)
+
+    def test_long_logs_continue_on_more_pages(self):
+        trip = self.make_logs(1, entries_per_day=96)
+        objects = pdf_objects(b''.join(export_logs(DailyLog.objects.filter(trip=trip))))
+        texts = pdf_text(objects)
+        self.assertEqual(len(texts), 3)
+        self.assertIn('\\(continued\\)', texts[1])
+        self.assertEqual(sum(text.count('(Segment)') for text in texts), 96)
+
+    def test_rejects_bad_queries(self):
+        self.assertEqual(APIClient().get('/api/daily-logs/export.pdf').status_code, 400)
+        self.assertEqual(
+            APIClient().get('/api/daily-logs/export.pdf?start_date=2026-03-04&end_date=2026-03-03').status_code, 400
+        )
+        self.assertEqual(APIClient().get('/api/daily-logs/export.pdf?trip_id=12345').status_code, 404)
+
+    def test_starts_at_once_and_streams_in_bounded_memory(self):
+        trip = self.make_logs(240)
+        logs = DailyLog.objects.filter(trip=trip)
+
+        started = time.perf_counter()
+        response = APIClient().get(f'/api/daily-logs/export.pdf?trip_id={trip.id}')
+        stream = iter(response.streaming_content)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(next(stream).startswith(b'%PDF'))
+        self.assertLess(time.perf_counter() - started, 0.1)
+        # The logs are only read once the header is out
+        self.assertEqual(len(queries), 0)
+
+        def peak(queryset):
+            tracemalloc.start()
+            try:
+                for _ in export_logs(queryset, chunk_size=20):
+                    pass
+                return tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        short = peak(logs.filter(date__lt=datetime(2026, 3, 21).date()))
+        long = peak(logs)
+        # Twelve times the pages, about the same memory
+        self.assertLess(long, short * 1.5)
@@ -1,14 +1,19 @@
-from django.urls import path, include
+from django.urls import path, re_path, include
 from rest_framework.routers import DefaultRouter
-from .views import TaskViewSet, TripViewSet, LocationViewSet, DailyLogViewSet, calculate_route
+from .views import TaskViewSet, TripViewSet, LocationViewSet, DailyLogViewSet, JobViewSet, calculate_route, calculate_routes_batch, daily_log_graph, export_daily_logs, maps_stats
 
 router = DefaultRouter()
 router.register(r'tasks', TaskViewSet)
 router.register(r'trips', TripViewSet)
 router.register(r'locations', LocationViewSet)
 router.register(r'daily-logs', DailyLogViewSet)
+router.register(r'jobs', JobViewSet)
 
 urlpatterns = [
+    re_path(r'^daily-logs/(?P<pk>\d+)/graph\.(?P<fmt>svg|png)$', daily_log_graph, name='daily-log-graph'),
+    re_path(r'^daily-logs/export\.pdf$', export_daily_logs, name='export-daily-logs'),
     path('', include(router.urls)),
     path('route-calculator/', calculate_route, name='calculate-route'),
+    path('route-calculator/batch/', calculate_routes_batch, name='calculate-routes-batch'),
+    path('maps/stats/', maps_stats, name='maps-stats'),
 ] 
\ No newline at end of file
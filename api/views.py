@@ -3,30 +3,40 @@ from rest_framework import viewsets, status, pagination
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from datetime import datetime, timedelta
+from datetime import datetime
 from django.utils import timezone
 import json
-import math
-import random
-import requests
-import os
-from dotenv import load_dotenv
+import logging
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Prefetch
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_GET
+from django.urls import reverse
+from django.utils.http import parse_etags
 
-from .models import Task, Location, Trip, RouteSegment, DailyLog, LogEntry
+from .models import Task, Location, Trip, RouteSegment, DailyLog, LogEntry, Job
 from .serializers import (
     TaskSerializer, LocationSerializer, TripSerializer, RouteSegmentSerializer,
     DailyLogSerializer, LogEntrySerializer, TripPlanRequestSerializer, EldLogsRequestSerializer,
-    TripListSerializer
+    TripListSerializer, GeocodeBatchRequestSerializer, NearbyLocationsQuerySerializer,
+    AutocompleteQuerySerializer, RouteRequestSerializer, RouteBatchRequestSerializer, TripPreviewSerializer,
+    TripGeometryQuerySerializer, JobSerializer, LogExportQuerySerializer
 )
+from .autocomplete import autocomplete_index
+from .directions import directions_cache
+from .jobs import enqueue
+from .logexport import async_chunks, export_logs
+from .loggraph import FORMATS, graph_key, log_graph
+from .geocoding import geocode_address, geocode_cache, geocode_many
+from .geometry import ZOOM_LEVELS
+from .maps_client import maps_client
+from .planning import TripRequest, plan_trip, plan_trips, preview_cache, preview_key, preview_trip
+from .polyline import decode
+from .routing import get_router, route_with_fallback
+from .spatial import haversine_miles, location_index
 
-# Load environment variables from .env file
-load_dotenv()
-
-# Google Maps API Key from environment variable
-GOOGLE_MAPS_API_KEY = os.getenv('GOOGLE_MAPS_API_KEY')
-
-# Flag to use mock data instead of Google Maps API
-USE_MOCK_DATA = os.getenv('USE_MOCK_DATA', 'True').lower() in ('true', 'yes', '1')
+logger = logging.getLogger(__name__)
 
 # Custom pagination class with smaller page size for better performance
 class OptimizedPagination(pagination.PageNumberPagination):
@@ -51,53 +61,83 @@ class LocationViewSet(viewsets.ModelViewSet):
     def geocode(self, request):
         """
         Geocode an address to get latitude and longitude.
-        Uses Google Maps API if available, otherwise falls back to mock data.
+        Repeat addresses are served from the geocode cache and reuse the
+        existing location; new ones use Google Maps API if available,
+        otherwise mock data.
         """
         address = request.data.get('address')
         if not address:
             return Response({"error": "Address is required"}, status=status.HTTP_400_BAD_REQUEST)
         
-        if not USE_MOCK_DATA and GOOGLE_MAPS_API_KEY:
-            # Try to use Google Maps Geocoding API
-            try:
-                url = f"https://maps.googleapis.com/maps/api/geocode/json?address={address}&key={GOOGLE_MAPS_API_KEY}"
-                response = requests.get(url)
-                data = response.json()
-                
-                if data['status'] == 'OK':
-                    # Extract coordinates from the API response
-                    location_data = data['results'][0]['geometry']['location']
-                    latitude = location_data['lat']
-                    longitude = location_data['lng']
-                    formatted_address = data['results'][0]['formatted_address']
-                    
-                    location = Location.objects.create(
-                        address=formatted_address,
-                        latitude=latitude,
-                        longitude=longitude
-                    )
-                    
-                    serializer = LocationSerializer(location)
-                    return Response(serializer.data, status=status.HTTP_201_CREATED)
-                else:
-                    # If geocoding failed, log the error and fall back to mock data
-                    print(f"Geocoding failed: {data.get('status')} - {data.get('error_message', 'No error message')}")
-            except Exception as e:
-                # If API call fails, log the error and fall back to mock data
-                print(f"Geocoding API error: {str(e)}")
-        
-        # Use mock data
-        latitude = random.uniform(30, 45)
-        longitude = random.uniform(-120, -70)
-        
-        location = Location.objects.create(
-            address=address,
-            latitude=latitude,
-            longitude=longitude
-        )
+        location, created = geocode_address(address)
+        autocomplete_index.record_use([location.id])
         
         serializer = LocationSerializer(location)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return Response(serializer.data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+    
+    @action(detail=False, methods=['post'], url_path='geocode/batch')
+    def geocode_batch(self, request):
+        """
+        Geocode many addresses in one call.
+        Addresses are deduplicated, cache misses are resolved concurrently, and
+        results come back in input order with an error entry for each failure.
+        """
+        serializer = GeocodeBatchRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        addresses = serializer.validated_data['addresses']
+        results = []
+        for address, (location, error) in zip(addresses, geocode_many(addresses)):
+            if error:
+                results.append({"address": address, "error": error})
+            else:
+                results.append({"address": address, "location": LocationSerializer(location).data})
+        autocomplete_index.record_use([result["location"]["id"] for result in results if "location" in result])
+        
+        return Response({"results": results}, status=status.HTTP_200_OK)
+    
+    @action(detail=False, methods=['get'])
+    def nearby(self, request):
+        """
+        Known locations within ``radius`` miles of ``lat``/``lng``, nearest first.
+        Candidates come from the in-memory spatial index; only the matching
+        rows are read from the database.
+        """
+        serializer = NearbyLocationsQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        lat = serializer.validated_data['lat']
+        lng = serializer.validated_data['lng']
+        radius = serializer.validated_data['radius']
+        matches = location_index.within(lat, lng, radius, limit=serializer.validated_data['limit'])
+        
+        # Rows deleted or moved by another process since the index last refreshed drop out here
+        locations = Location.objects.in_bulk([location_id for _, location_id in matches])
+        results = []
+        for _, location_id in matches:
+            location = locations.get(location_id)
+            if location is None:
+                continue
+            distance = haversine_miles(lat, lng, location.latitude, location.longitude)
+            if distance <= radius:
+                results.append(dict(LocationSerializer(location).data, distance=round(distance, 3)))
+        
+        return Response(results)
+    
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        """
+        Type-ahead over known addresses: locations whose address starts with
+        ``q``, most used first. Served entirely from the in-memory prefix index.
+        """
+        serializer = AutocompleteQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        matches = autocomplete_index.search(serializer.validated_data['q'], limit=serializer.validated_data['limit'])
+        return Response([match._asdict() for match in matches])
 
 
 class TripViewSet(viewsets.ModelViewSet):
@@ -133,7 +173,7 @@ class TripViewSet(viewsets.ModelViewSet):
                 'pickup_location',
                 'dropoff_location'
             ).prefetch_related(
-                'segments',
+                Prefetch('segments', queryset=RouteSegment.objects.defer(*RouteSegment.GEOMETRY_FIELDS)),
                 'segments__start_location',
                 'segments__end_location'
             )
@@ -155,142 +195,92 @@ class TripViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
         
+    @action(detail=True, methods=['get'])
+    def geometry(self, request, pk=None):
+        """
+        Route geometry of the trip's drive segments as encoded polylines.
+        With ``zoom``, the geometry simplified for that map zoom level (the
+        nearest precomputed level at or below it) is returned instead of the
+        full line; ``decode=true`` returns ``[lat, lng]`` pairs.
+        """
+        serializer = TripGeometryQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        trip = self.get_object()
+        
+        zoom = serializer.validated_data.get('zoom')
+        level = None
+        if zoom is not None and zoom <= ZOOM_LEVELS[-1]:
+            level = str(max((z for z in ZOOM_LEVELS if z <= zoom), default=ZOOM_LEVELS[0]))
+        
+        # Only the column needed for the requested zoom is read
+        rows = (RouteSegment.objects
+                .filter(trip=trip, segment_type='drive')
+                .order_by('start_time')
+                .values_list('id', 'geometry' if level is None else 'geometry_levels'))
+        segments = []
+        for segment_id, geometry in rows:
+            if level is not None:
+                geometry = geometry.get(level, '')
+            if serializer.validated_data['decode']:
+                segments.append({"id": segment_id, "coordinates": decode(geometry)})
+            else:
+                segments.append({"id": segment_id, "geometry": geometry})
+        
+        return Response({"trip": trip.id, "zoom": zoom, "segments": segments})
+    
     @action(detail=False, methods=['post'])
     def generate_eld_logs(self, request):
         """
-        Generate ELD logs for a trip
+        Queue ELD log generation for a trip. Returns 202 with the job, whose
+        result (the trip's logs) is at ``/api/jobs/{id}/result/``.
         """
-        try:
-            serializer = EldLogsRequestSerializer(data=request.data)
-            if not serializer.is_valid():
-                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-            
-            trip_id = serializer.validated_data['trip_id']
-            print(f"Generating ELD logs for trip_id={trip_id}")
-            
-            try:
-                trip = Trip.objects.get(id=trip_id)
-            except Trip.DoesNotExist:
-                return Response(
-                    {"error": f"Trip with ID {trip_id} not found"}, 
-                    status=status.HTTP_404_NOT_FOUND
-                )
-                
-            # Delete existing logs for this trip
-            DailyLog.objects.filter(trip=trip).delete()
-            
-            # Generate daily logs based on trip segments
-            daily_logs = []
-            
-            # Get all segments for the trip
-            segments = RouteSegment.objects.filter(trip=trip).order_by('start_time')
-            print(f"Found {segments.count()} segments for trip_id={trip_id}")
-            
-            if not segments:
-                return Response(
-                    {"error": "No segments found for this trip"}, 
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-                
-            # Get the start and end dates of the trip
-            trip_start_date = trip.start_time.date()
-            trip_end_date = trip.end_time.date()
-            print(f"Trip date range: {trip_start_date} to {trip_end_date}")
-            
-            # Generate a log for each day of the trip
-            current_date = trip_start_date
-            day_counter = 1
-            
-            while current_date <= trip_end_date:
-                print(f"Processing day {day_counter}: {current_date}")
-                # Create a daily log
-                daily_log = DailyLog.objects.create(
-                    trip=trip,
-                    date=current_date,
-                    driver_name="Test Driver",
-                    carrier_name="Test Carrier",
-                    truck_number=f"TRUCK-{trip_id}",
-                    trailer_number=f"TRAILER-{trip_id}",
-                    start_odometer=100000 + (day_counter - 1) * 500,
-                    end_odometer=100000 + day_counter * 500,
-                    total_miles=500
-                )
-                
-                # Get segments for this day
-                day_start = datetime.combine(current_date, datetime.min.time()).replace(tzinfo=timezone.utc)
-                day_end = datetime.combine(current_date, datetime.max.time()).replace(tzinfo=timezone.utc)
-                
-                # Find segments that overlap with this day
-                day_segments = []
-                for segment in segments:
-                    # Check if segment overlaps with current day
-                    if (segment.start_time <= day_end and segment.end_time >= day_start):
-                        day_segments.append(segment)
-                
-                print(f"Found {len(day_segments)} segments for day {current_date}")
-                
-                # Create log entries based on segments
-                for segment in day_segments:
-                    print(f"Processing segment: {segment.segment_type} from {segment.start_time} to {segment.end_time}")
-                    # Determine status based on segment type (case-insensitive)
-                    segment_type_lower = segment.segment_type.lower()
-                    
-                    if 'drive' in segment_type_lower:
-                        status = 'D'  # Driving
-                    elif 'rest' in segment_type_lower or 'sleep' in segment_type_lower:
-                        status = 'SB'  # Sleeper Berth
-                    elif 'pickup' in segment_type_lower or 'dropoff' in segment_type_lower or 'loading' in segment_type_lower or 'unloading' in segment_type_lower:
-                        status = 'ON'  # On Duty Not Driving
-                    else:
-                        status = 'OFF'  # Off Duty
-                    
-                    print(f"Creating log entry with status: {status}")
-                    
-                    # Calculate start and end times that fall within this day
-                    entry_start = max(segment.start_time, day_start)
-                    entry_end = min(segment.end_time, day_end)
-                    
-                    # Create log entry
-                    log_entry = LogEntry.objects.create(
-                        daily_log=daily_log,
-                        status=status,
-                        start_time=entry_start,
-                        end_time=entry_end,
-                        location=segment.start_location.address,
-                        remarks=f"{segment.segment_type.capitalize()} segment"
-                    )
-                    print(f"Created log entry: {log_entry.id}")
-                
-                # If no segments were found for this day, create a default "Off Duty" entry
-                if not day_segments:
-                    print(f"No segments found for day {current_date}, creating default OFF entry")
-                    LogEntry.objects.create(
-                        daily_log=daily_log,
-                        status='OFF',
-                        start_time=day_start,
-                        end_time=day_end,
-                        location=trip.current_location.address,
-                        remarks="Off duty (default)"
-                    )
-                
-                daily_logs.append(daily_log)
-                current_date += timedelta(days=1)
-                day_counter += 1
-            
-            # Serialize the daily logs
-            serializer = DailyLogSerializer(daily_logs, many=True)
-            
-            return Response({"logs": serializer.data}, status=status.HTTP_201_CREATED)
-            
-        except Exception as e:
-            print(f"Error generating ELD logs: {str(e)}")
-            import traceback
-            traceback.print_exc()
+        serializer = EldLogsRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        trip_id = serializer.validated_data['trip_id']
+        if not Trip.objects.filter(id=trip_id).exists():
             return Response(
-                {"error": f"Failed to generate ELD logs: {str(e)}"}, 
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                {"error": f"Trip with ID {trip_id} not found"},
+                status=status.HTTP_404_NOT_FOUND
             )
 
+        job = enqueue('generate_eld_logs', trip_id=trip_id, full=serializer.validated_data['full'])
+        return job_accepted(request, job)
+
+
+def job_accepted(request, job):
+    """
+    202 response for a queued job, pointing at its status and result.
+    """
+    return Response({
+        "job": JobSerializer(job).data,
+        "status_url": request.build_absolute_uri(reverse('job-detail', args=[job.id])),
+        "result_url": request.build_absolute_uri(reverse('job-result', args=[job.id])),
+    }, status=status.HTTP_202_ACCEPTED)
+
+
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = Job.objects.all().order_by('-created_at')
+    serializer_class = JobSerializer
+    permission_classes = [AllowAny]
+    pagination_class = OptimizedPagination
+
+    @action(detail=True, methods=['get'])
+    def result(self, request, pk=None):
+        """
+        The result of a finished job: 200 with the result once it has
+        succeeded, 202 with its status while it is queued or running, and 409
+        with the error if it failed.
+        """
+        job = self.get_object()
+        if job.status == Job.SUCCEEDED:
+            return Response(job.result)
+        if job.status == Job.FAILED:
+            return Response({"status": job.status, "error": job.error}, status=status.HTTP_409_CONFLICT)
+        return Response(JobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
 
 class DailyLogViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = DailyLog.objects.all()
@@ -316,12 +306,121 @@ class DailyLogViewSet(viewsets.ReadOnlyModelViewSet):
         serializer = LogEntrySerializer(entries, many=True)
         return Response(serializer.data)
 
+
+def etag_matches(request, etag):
+    """
+    Whether the request's If-None-Match names ``etag`` (or is ``*``),
+    comparing tags exactly with any weak ``W/`` prefix ignored.
+    """
+    tags = parse_etags(request.headers.get('If-None-Match', ''))
+    return '*' in tags or etag in (tag.removeprefix('W/') for tag in tags)
+
+
+@require_GET
+def daily_log_graph(request, pk, fmt):
+    """
+    The duty status graph of a daily log as SVG or PNG, rendered from its
+    entries. The graph is cached on a hash of the entries, which is also its
+    strong ETag, so an unchanged log is served from cache or answered with
+    304 Not Modified.
+    """
+    daily_log = get_object_or_404(DailyLog.objects.only('id', 'date'), pk=pk)
+    entries = list(daily_log.entries.order_by('start_time', 'id').values_list('status', 'start_time', 'end_time'))
+    key = graph_key(daily_log.date, entries)
+    headers = {'ETag': f'"{key}-{fmt}"', 'Cache-Control': 'no-cache'}
+    if etag_matches(request, headers['ETag']):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(log_graph(daily_log.date, entries, fmt, key=key), content_type=FORMATS[fmt][1])
+    for name, value in headers.items():
+        response[name] = value
+    return response
+
+
+@require_GET
+def export_daily_logs(request):
+    """
+    The daily logs of a trip (``trip_id``) and/or a date range
+    (``start_date`` to ``end_date``, default today) as one PDF, streamed a
+    page at a time as the logs are read, under WSGI and ASGI alike.
+    """
+    serializer = LogExportQuerySerializer(data=request.GET)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    query = serializer.validated_data
+
+    daily_logs = DailyLog.objects.all()
+    if 'trip_id' in query:
+        daily_logs = daily_logs.filter(trip_id=query['trip_id'])
+    if 'start_date' in query:
+        daily_logs = daily_logs.filter(date__range=(query['start_date'], query.get('end_date', timezone.now().date())))
+    if not daily_logs.exists():
+        return JsonResponse({"error": "No daily logs found"}, status=status.HTTP_404_NOT_FOUND)
+
+    name = f"trip-{query['trip_id']}" if 'trip_id' in query else f"logs-{query['start_date'].isoformat()}"
+    chunks = export_logs(daily_logs)
+    if isinstance(request, ASGIRequest):
+        # ASGI handlers would read a sync iterator to the end before sending anything
+        chunks = async_chunks(chunks)
+    response = StreamingHttpResponse(chunks, content_type='application/pdf')
+    response['Content-Disposition'] = f'attachment; filename="{name}.pdf"'
+    return response
+
+
+def parse_route_request(data):
+    """
+    Validate one route calculator request. Returns ``(route, errors)``: a
+    TripRequest, or the errors to report instead.
+    """
+    # An ordered list of stops; the current/pickup/dropoff shape is a three-stop route
+    stops = data.get('stops')
+    if stops is None:
+        current_location = data.get('currentLocation')
+        pickup_location = data.get('pickupLocation')
+        dropoff_location = data.get('dropoffLocation')
+        
+        # Validate required location data
+        if not current_location or not pickup_location or not dropoff_location:
+            return None, {"error": "Missing location data. Either stops, or current, pickup, and dropoff locations are required."}
+        stops = [
+            dict({'latitude': 0, 'longitude': 0, 'type': 'stop'}, **current_location),
+            dict({'latitude': 0, 'longitude': 0, 'type': 'pickup'}, **pickup_location),
+            dict({'latitude': 0, 'longitude': 0, 'type': 'dropoff'}, **dropoff_location),
+        ]
+    
+    route_serializer = RouteRequestSerializer(data={'stops': stops})
+    if not route_serializer.is_valid():
+        return None, route_serializer.errors
+    stops = route_serializer.validated_data['stops']
+    # The last stop is a delivery unless it says otherwise
+    stop_types = [stop.get('type', 'stop') for stop in stops]
+    stop_types[-1] = stops[-1].get('type', 'dropoff')
+    
+    # Extract additional parameters
+    start_datetime = data.get('startDateTime')
+    try:
+        current_cycle_hours = float(data.get('currentCycleHours', 0))
+        start_time = timezone.now() if not start_datetime else datetime.fromisoformat(start_datetime.replace('Z', '+00:00'))
+    except (TypeError, ValueError) as e:
+        return None, {"error": f"Invalid trip parameters: {str(e)}"}
+    
+    return TripRequest(
+        stops=[(stop['address'], stop['latitude'], stop['longitude']) for stop in stops],
+        stop_types=stop_types,
+        start_time=start_time,
+        cycle_hours=current_cycle_hours,
+    ), None
+
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def calculate_route(request):
     """
-    Calculate a route based on current location, pickup, and dropoff points.
-    Applies HOS (Hours of Service) rules to the route.
+    Calculate a route through an ordered list of stops (or the current
+    location, pickup, and dropoff points). Applies HOS (Hours of Service)
+    rules to the route.
+    With ``?preview=true`` the trip is calculated but not saved, and the
+    response is cached on a hash of the input and tagged with it as an ETag.
     """
     try:
         # Validate input data
@@ -331,190 +430,24 @@ def calculate_route(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Extract location data from request
-        current_location = request.data.get('currentLocation')
-        pickup_location = request.data.get('pickupLocation')
-        dropoff_location = request.data.get('dropoffLocation')
-        
-        # Validate required location data
-        if not current_location or not pickup_location or not dropoff_location:
-            return Response(
-                {"error": "Missing location data. Current, pickup, and dropoff locations are required."}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Extract additional parameters
-        current_cycle_hours = request.data.get('currentCycleHours', 0)
-        current_status = request.data.get('currentStatus', 'OFF')
-        start_datetime = request.data.get('startDateTime')
-        vehicle_details = request.data.get('vehicleDetails', {})
-        
-        # Calculate route using Google Maps API or mock data
-        if not USE_MOCK_DATA and GOOGLE_MAPS_API_KEY:
-            # Use Google Maps API for real route calculation
-            try:
-                # Calculate distance and duration from current to pickup
-                current_to_pickup_url = f"https://maps.googleapis.com/maps/api/directions/json?origin={current_location['latitude']},{current_location['longitude']}&destination={pickup_location['latitude']},{pickup_location['longitude']}&key={GOOGLE_MAPS_API_KEY}"
-                current_to_pickup_response = requests.get(current_to_pickup_url)
-                current_to_pickup_data = current_to_pickup_response.json()
-                
-                if current_to_pickup_data['status'] != 'OK':
-                    raise Exception(f"Google Maps API error: {current_to_pickup_data.get('status')} - {current_to_pickup_data.get('error_message', 'No error message')}")
-                
-                current_to_pickup_distance = current_to_pickup_data['routes'][0]['legs'][0]['distance']['value'] / 1609.34  # Convert meters to miles
-                current_to_pickup_duration = current_to_pickup_data['routes'][0]['legs'][0]['duration']['value'] / 60  # Convert seconds to minutes
-                
-                # Calculate distance and duration from pickup to dropoff
-                pickup_to_dropoff_url = f"https://maps.googleapis.com/maps/api/directions/json?origin={pickup_location['latitude']},{pickup_location['longitude']}&destination={dropoff_location['latitude']},{dropoff_location['longitude']}&key={GOOGLE_MAPS_API_KEY}"
-                pickup_to_dropoff_response = requests.get(pickup_to_dropoff_url)
-                pickup_to_dropoff_data = pickup_to_dropoff_response.json()
-                
-                if pickup_to_dropoff_data['status'] != 'OK':
-                    raise Exception(f"Google Maps API error: {pickup_to_dropoff_data.get('status')} - {pickup_to_dropoff_data.get('error_message', 'No error message')}")
-                
-                pickup_to_dropoff_distance = pickup_to_dropoff_data['routes'][0]['legs'][0]['distance']['value'] / 1609.34  # Convert meters to miles
-                pickup_to_dropoff_duration = pickup_to_dropoff_data['routes'][0]['legs'][0]['duration']['value'] / 60  # Convert seconds to minutes
-                
-            except Exception as e:
-                print(f"Error using Google Maps API: {str(e)}")
-                # Fall back to mock data
-                current_to_pickup_distance = random.uniform(50, 200)
-                current_to_pickup_duration = current_to_pickup_distance * 1.2  # Assume 50 mph average speed
-                pickup_to_dropoff_distance = random.uniform(300, 800)
-                pickup_to_dropoff_duration = pickup_to_dropoff_distance * 1.2  # Assume 50 mph average speed
-        else:
-            # Use mock data for route calculation
-            current_to_pickup_distance = random.uniform(50, 200)
-            current_to_pickup_duration = current_to_pickup_distance * 1.2  # Assume 50 mph average speed
-            pickup_to_dropoff_distance = random.uniform(300, 800)
-            pickup_to_dropoff_duration = pickup_to_dropoff_distance * 1.2  # Assume 50 mph average speed
-        
-        # Calculate end time based on HOS rules
-        total_driving_hours = (current_to_pickup_duration + pickup_to_dropoff_duration) / 60
-        
-        # Add mandatory breaks
-        num_breaks = math.floor(total_driving_hours / 8)
-        break_time = num_breaks * 0.5  # 30 minutes per break
-        
-        # Add loading/unloading time
-        loading_time = 1  # 1 hour for loading
-        unloading_time = 1  # 1 hour for unloading
-        
-        # Calculate total trip time including breaks and loading/unloading
-        total_trip_time = total_driving_hours + break_time + loading_time + unloading_time
-        
-        # Check if we need to add a rest period
-        if total_trip_time > 14 - current_cycle_hours:
-            # Add a 10-hour rest period
-            total_trip_time += 10
-        
-        # Calculate start and end time
-        start_time = timezone.now() if not start_datetime else datetime.fromisoformat(start_datetime.replace('Z', '+00:00'))
-        end_time = start_time + timedelta(hours=total_trip_time)
-        
-        # Create a new Trip object
-        trip = Trip.objects.create(
-            current_location=Location.objects.create(
-                address=current_location.get('address', ''),
-                latitude=current_location.get('latitude', 0),
-                longitude=current_location.get('longitude', 0)
-            ),
-            pickup_location=Location.objects.create(
-                address=pickup_location.get('address', ''),
-                latitude=pickup_location.get('latitude', 0),
-                longitude=pickup_location.get('longitude', 0)
-            ),
-            dropoff_location=Location.objects.create(
-                address=dropoff_location.get('address', ''),
-                latitude=dropoff_location.get('latitude', 0),
-                longitude=dropoff_location.get('longitude', 0)
-            ),
-            total_distance=current_to_pickup_distance + pickup_to_dropoff_distance,
-            total_duration=current_to_pickup_duration + pickup_to_dropoff_duration,
-            start_time=start_time,
-            end_time=end_time
-        )
-        
-        # Create route segments
-        segments = []
-        
-        # Current location to pickup
-        current_time = trip.start_time
-        
-        # Add driving segment from current location to pickup
-        drive_to_pickup = RouteSegment.objects.create(
-            trip=trip,
-            segment_type='DRIVE',
-            start_location=trip.current_location,
-            end_location=trip.pickup_location,
-            distance=current_to_pickup_distance,
-            duration=current_to_pickup_duration,
-            start_time=current_time,
-            end_time=current_time + timedelta(minutes=current_to_pickup_duration)
-        )
-        segments.append(drive_to_pickup)
-        current_time = drive_to_pickup.end_time
-        
-        # Add loading segment at pickup
-        loading = RouteSegment.objects.create(
-            trip=trip,
-            segment_type='LOADING',
-            start_location=trip.pickup_location,
-            end_location=trip.pickup_location,
-            distance=0,
-            duration=loading_time * 60,  # Convert hours to minutes
-            start_time=current_time,
-            end_time=current_time + timedelta(hours=loading_time)
-        )
-        segments.append(loading)
-        current_time = loading.end_time
+        route, errors = parse_route_request(request.data)
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
         
-        # Check if we need a break before continuing
-        driving_time_so_far = current_to_pickup_duration / 60  # Convert to hours
-        if driving_time_so_far >= 8:
-            # Add a break
-            break_segment = RouteSegment.objects.create(
-                trip=trip,
-                segment_type='BREAK',
-                start_location=trip.pickup_location,
-                end_location=trip.pickup_location,
-                distance=0,
-                duration=30,  # 30 minutes
-                start_time=current_time,
-                end_time=current_time + timedelta(minutes=30)
-            )
-            segments.append(break_segment)
-            current_time = break_segment.end_time
-            driving_time_so_far = 0  # Reset driving time
+        if request.query_params.get('preview', '').lower() in ('true', 'yes', '1'):
+            return preview_route(request, route)
         
-        # Add driving segment from pickup to dropoff
-        drive_to_dropoff = RouteSegment.objects.create(
-            trip=trip,
-            segment_type='DRIVE',
-            start_location=trip.pickup_location,
-            end_location=trip.dropoff_location,
-            distance=pickup_to_dropoff_distance,
-            duration=pickup_to_dropoff_duration,
-            start_time=current_time,
-            end_time=current_time + timedelta(minutes=pickup_to_dropoff_duration)
-        )
-        segments.append(drive_to_dropoff)
-        current_time = drive_to_dropoff.end_time
+        # Distance, duration and geometry of each leg from
+        # Google Maps (one Directions call per 25 waypoints, none for cached routes),
+        # the offline road graph or the straight-line estimator, as configured,
+        # falling back to the deterministic estimate
+        legs = route_with_fallback([stop[1:] for stop in route.stops])
         
-        # Add unloading segment at dropoff
-        unloading = RouteSegment.objects.create(
-            trip=trip,
-            segment_type='UNLOADING',
-            start_location=trip.dropoff_location,
-            end_location=trip.dropoff_location,
-            distance=0,
-            duration=unloading_time * 60,  # Convert hours to minutes
-            start_time=current_time,
-            end_time=current_time + timedelta(hours=unloading_time)
-        )
-        segments.append(unloading)
+        # Schedule the drive, break, rest, fuel and service segments under the
+        # HOS rules, then save the stops, trip and segments in one transaction
+        trip = plan_trip(route, legs)
         
-        # Serialize the trip with segments
+        # Serialize the trip with the segments just saved
         serializer = TripSerializer(trip)
         
         return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -525,3 +458,79 @@ def calculate_route(request):
             {"error": f"Failed to calculate route: {str(e)}"}, 
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
+
+
+def preview_route(request, route):
+    """
+    Respond with the trip a route calculation would save, without writing it.
+    """
+    # Previews starting now start at the top of the minute, so a user still
+    # typing gets the same cached preview
+    if not request.data.get('startDateTime'):
+        route = route._replace(start_time=route.start_time.replace(second=0, microsecond=0))
+    key = preview_key(route, get_router().name)
+    etag = f'"{key}"'
+    if etag_matches(request, etag):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+    
+    data = preview_cache.get(key)
+    if data is None:
+        legs = route_with_fallback([stop[1:] for stop in route.stops])
+        data = TripPreviewSerializer(preview_trip(route, legs)).data
+        preview_cache.set(key, data)
+    return Response(data, status=status.HTTP_200_OK, headers={'ETag': etag})
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def calculate_routes_batch(request):
+    """
+    Calculate many routes in one call, each in the same form the route
+    calculator takes. Routing for all trips is batched, HOS scheduling runs
+    on a process pool, and the trips are saved in chunked bulk transactions.
+    Results come back in input order with an error entry for each failure.
+    """
+    serializer = RouteBatchRequestSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    if request.query_params.get('async', '').lower() in ('true', '1', 'yes'):
+        return job_accepted(request, enqueue('plan_route_batch', trips=serializer.validated_data['trips']))
+    return Response({"results": plan_batch(serializer.validated_data['trips'])}, status=status.HTTP_200_OK)
+
+
+def plan_batch(trips):
+    """
+    Plan a batch of route calculator requests. Returns one result per trip,
+    in order: ``{"index", "trip"}`` or ``{"index", "error"}``.
+    """
+    results = [None] * len(trips)
+    routes = []
+    for index, data in enumerate(trips):
+        route, errors = parse_route_request(data)
+        if errors:
+            results[index] = {"index": index, "error": errors}
+        else:
+            routes.append((index, route))
+    
+    if routes:
+        for (index, _), (trip, error) in zip(routes, plan_trips([route for _, route in routes])):
+            if error:
+                results[index] = {"index": index, "error": error}
+            else:
+                results[index] = {"index": index, "trip": TripListSerializer(trip).data}
+    return results
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def maps_stats(request):
+    """
+    Report hit/miss counters for the maps caches, the upstream latency and
+    quota they save, and per-endpoint latency of the upstream calls made.
+    """
+    return Response({
+        "geocode_cache": geocode_cache.stats(),
+        "directions_cache": directions_cache.stats(),
+        "upstream": maps_client.stats(),
+    })
@@ -22,7 +22,7 @@ def create_locations(num=10):
     
     for i in range(num):
         city = random.choice(cities)
-        location = Location.objects.create(
+        location, _ = Location.objects.resolve(
             address=f"{random.randint(100, 9999)} Main St, {city}, USA",
             latitude=random.uniform(25, 48),
             longitude=random.uniform(-123, -75)
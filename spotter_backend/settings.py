@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 import os
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -58,6 +59,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.UpstreamTimingMiddleware',
 ]
 
 ROOT_URLCONF = 'spotter_backend.urls'
@@ -149,3 +151,103 @@ REST_FRAMEWORK = {
         'rest_framework.authentication.BasicAuthentication',
     ],
 }
+
+# Google Maps settings
+GOOGLE_MAPS_API_KEY = os.getenv('GOOGLE_MAPS_API_KEY')
+GOOGLE_MAPS_BASE_URL = os.getenv('GOOGLE_MAPS_BASE_URL', 'https://maps.googleapis.com/maps/api')
+
+# Outbound maps client: timeouts (seconds), retries with jittered backoff (seconds),
+# keep-alive pool size, and circuit breaker threshold (consecutive failures) and reset (seconds)
+MAPS_CONNECT_TIMEOUT = float(os.getenv('MAPS_CONNECT_TIMEOUT', '3.05'))
+MAPS_READ_TIMEOUT = float(os.getenv('MAPS_READ_TIMEOUT', '10'))
+MAPS_MAX_RETRIES = int(os.getenv('MAPS_MAX_RETRIES', '2'))
+MAPS_RETRY_BACKOFF = float(os.getenv('MAPS_RETRY_BACKOFF', '0.25'))
+MAPS_POOL_SIZE = int(os.getenv('MAPS_POOL_SIZE', '20'))
+MAPS_BREAKER_THRESHOLD = int(os.getenv('MAPS_BREAKER_THRESHOLD', '5'))
+MAPS_BREAKER_RESET = float(os.getenv('MAPS_BREAKER_RESET', '30'))
+
+# Use mock data instead of calling the Google Maps API
+USE_MOCK_DATA = os.getenv('USE_MOCK_DATA', 'True').lower() in ('true', 'yes', '1')
+
+# Offline gazetteer (sorted index built by `manage.py build_gazetteer`); when
+# GEOCODE_GAZETTEER_FIRST is on, place-level addresses it can resolve never reach the paid API
+GAZETTEER_PATH = Path(os.getenv('GAZETTEER_PATH', BASE_DIR / 'api' / 'data' / 'gazetteer.tsv'))
+GEOCODE_GAZETTEER_FIRST = os.getenv('GEOCODE_GAZETTEER_FIRST', 'True').lower() in ('true', 'yes', '1')
+
+# Routing backend for the route calculator: 'google', 'graph' (offline road graph
+# at ROAD_GRAPH_PATH, see build_road_graph) or 'estimate' (straight-line distance
+# times ROUTE_CIRCUITY; 'mock' is an alias). When unset, Google Maps is used if an
+# API key is configured and USE_MOCK_DATA is off, otherwise the estimate.
+ROUTING_BACKEND = os.getenv('ROUTING_BACKEND', '')
+ROAD_GRAPH_PATH = Path(os.getenv('ROAD_GRAPH_PATH', BASE_DIR / 'api' / 'data' / 'roadgraph.bin'))
+ROUTE_CIRCUITY = float(os.getenv('ROUTE_CIRCUITY', '1.2'))
+
+# Station catalog (CSV of truck stops and rest areas) used to place fuel stops: the
+# best truck stop within STATION_CORRIDOR_MILES of the route in the
+# FUEL_SEARCH_WINDOW_MILES before each point the tank would run out is chosen
+STATION_CATALOG_PATH = Path(os.getenv('STATION_CATALOG_PATH', BASE_DIR / 'api' / 'data' / 'stations.csv'))
+FUEL_SEARCH_WINDOW_MILES = float(os.getenv('FUEL_SEARCH_WINDOW_MILES', '150'))
+STATION_CORRIDOR_MILES = float(os.getenv('STATION_CORRIDOR_MILES', '5'))
+# Breaks and rests due on the road are taken at the nearest rest area or truck stop
+# within this many miles of where they fall due, otherwise at the roadside
+REST_SEARCH_RADIUS_MILES = float(os.getenv('REST_SEARCH_RADIUS_MILES', '25'))
+
+# Geocode cache: size of the in-process LRU tier and the time-to-live (in seconds)
+# applied to both the in-process and the shared database tier
+GEOCODE_CACHE_MAX_ENTRIES = int(os.getenv('GEOCODE_CACHE_MAX_ENTRIES', '10000'))
+GEOCODE_CACHE_TTL = int(os.getenv('GEOCODE_CACHE_TTL', str(30 * 24 * 60 * 60)))
+# Offline fallback results (the upstream geocoder failed or was unavailable) are
+# kept in the in-process tier only, for this many seconds, then retried upstream
+GEOCODE_FALLBACK_TTL = int(os.getenv('GEOCODE_FALLBACK_TTL', '300'))
+
+# Directions cache: origins and destinations are snapped to a grid of this many
+# degrees (0.01 is roughly 0.7 miles), so repeat lanes share one entry. The
+# database tier can be switched off to keep the cache in-process only.
+DIRECTIONS_CACHE_GRID = float(os.getenv('DIRECTIONS_CACHE_GRID', '0.01'))
+DIRECTIONS_CACHE_MAX_ENTRIES = int(os.getenv('DIRECTIONS_CACHE_MAX_ENTRIES', '5000'))
+DIRECTIONS_CACHE_TTL = int(os.getenv('DIRECTIONS_CACHE_TTL', str(7 * 24 * 60 * 60)))
+# Most stops accepted by the route calculator in one route
+ROUTE_MAX_STOPS = int(os.getenv('ROUTE_MAX_STOPS', '100'))
+# Batch route calculator: most trips per request, processes scheduling them
+# (one per CPU by default) and trips saved per transaction
+ROUTE_BATCH_MAX_TRIPS = int(os.getenv('ROUTE_BATCH_MAX_TRIPS', '1000'))
+PLANNING_PROCESSES = int(os.getenv('PLANNING_PROCESSES', str(os.cpu_count() or 1)))
+PLANNING_DB_CHUNK_SIZE = int(os.getenv('PLANNING_DB_CHUNK_SIZE', '200'))
+# Route previews: cached responses (by input hash) and how long they are kept in seconds
+ROUTE_PREVIEW_CACHE_MAX_ENTRIES = int(os.getenv('ROUTE_PREVIEW_CACHE_MAX_ENTRIES', '1000'))
+ROUTE_PREVIEW_CACHE_TTL = int(os.getenv('ROUTE_PREVIEW_CACHE_TTL', str(10 * 60)))
+# Directions legs fetched concurrently per route
+DIRECTIONS_WORKERS = int(os.getenv('DIRECTIONS_WORKERS', '8'))
+DIRECTIONS_CACHE_PERSIST = os.getenv('DIRECTIONS_CACHE_PERSIST', 'True').lower() in ('true', 'yes', '1')
+
+# Batch geocoding: upstream worker threads per request and maximum addresses per request
+GEOCODE_BATCH_WORKERS = int(os.getenv('GEOCODE_BATCH_WORKERS', '8'))
+GEOCODE_BATCH_MAX_ADDRESSES = int(os.getenv('GEOCODE_BATCH_MAX_ADDRESSES', '5000'))
+
+# Background jobs (api/jobs.py, run by `manage.py run_jobs`): worker processes (one per
+# CPU by default), seconds between polls of an empty queue, seconds after which a
+# running job is presumed lost and may be claimed again, and claims before giving up
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', str(os.cpu_count() or 1)))
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '1'))
+JOB_TIMEOUT = int(os.getenv('JOB_TIMEOUT', str(10 * 60)))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+
+# Rendered daily log graphs (api/loggraph.py), keyed by a hash of their entries: how many
+# are kept in memory, the directory shared by all processes (empty to keep them in memory
+# only), and the size past which its least recently used files are deleted
+LOG_GRAPH_CACHE_MAX_ENTRIES = int(os.getenv('LOG_GRAPH_CACHE_MAX_ENTRIES', '2000'))
+LOG_GRAPH_CACHE_DIR = os.getenv('LOG_GRAPH_CACHE_DIR', str(Path(tempfile.gettempdir()) / 'spotter_log_graphs'))
+LOG_GRAPH_CACHE_MAX_BYTES = int(os.getenv('LOG_GRAPH_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+
+# Daily logs read (with their entries) per query when streaming a PDF export
+LOG_EXPORT_CHUNK_SIZE = int(os.getenv('LOG_EXPORT_CHUNK_SIZE', '50'))
+
+# Spatial index over Location: grid cell size (degrees) and how often (seconds) rows
+# inserted by other processes are picked up
+LOCATION_INDEX_CELL_SIZE = float(os.getenv('LOCATION_INDEX_CELL_SIZE', '0.1'))
+LOCATION_INDEX_REFRESH = float(os.getenv('LOCATION_INDEX_REFRESH', '5'))
+
+# Location deduplication on write (miles): any location this close is reused, and
+# one with the same normalized address is reused within the larger address radius
+LOCATION_DEDUPE_TOLERANCE = float(os.getenv('LOCATION_DEDUPE_TOLERANCE', '0.05'))
+LOCATION_DEDUPE_ADDRESS_RADIUS = float(os.getenv('LOCATION_DEDUPE_ADDRESS_RADIUS', '1.0'))